@@ -0,0 +1,191 @@
+"""Nearest-neighbour index backends for `EmbeddingStore`.
+
+All backends work on L2-normalized float32 vectors (so inner product equals
+cosine similarity) and share one interface:
+
+- `build(embs)` indexes an (N, d) matrix, row i getting id i
+- `add(new, embs)` appends rows `len(embs) - len(new)` onwards; `embs` is the full
+  matrix after the append
+- `search(queries, k, **params)` returns `(scores, ids)`, both shaped (nq, k);
+  missing neighbours are padded with id -1
+- `save(persist_dir)` / `load(persist_dir, params)` persist the index
+
+`exact` is the brute-force scan and needs nothing beyond numpy. `hnsw` uses
+`hnswlib` and `ivfpq` uses `faiss`; both are optional and raise a RuntimeError
+with install guidance when the library is missing.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .topk import top_k, top_k_chunked
+from .vector_store import write_atomic
+
+try:
+    import hnswlib
+except Exception:  # pragma: no cover - optional dependency
+    hnswlib = None  # type: ignore
+
+try:
+    import faiss
+except Exception:  # pragma: no cover - optional dependency
+    faiss = None  # type: ignore
+
+ANN_CONFIG_FILE = "ann.json"
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, **params):
+        self.params = params
+        self.embs: Optional[np.ndarray] = None
+
+    def build(self, embs: np.ndarray) -> None:
+        self.embs = embs
+
+    def add(self, new: np.ndarray, embs: np.ndarray) -> None:
+        self.embs = embs
+
+    def search(self, queries: np.ndarray, k: int, **params) -> Tuple[np.ndarray, np.ndarray]:
+        queries, embs = np.atleast_2d(queries), np.asarray(self.embs)
+        # One chunk of questions at a time: never a full (questions x rows) score matrix
+        ids, scores = top_k_chunked(lambda start, end: top_k(queries[start:end] @ embs.T, k), len(queries))
+        return scores, ids
+
+    def save(self, persist_dir: Path) -> None:
+        # The embedding matrix itself is the index
+        pass
+
+    @classmethod
+    def load(cls, persist_dir: Path, params: Dict[str, Any], embs: np.ndarray) -> "ExactIndex":
+        index = cls(**params)
+        index.build(embs)
+        return index
+
+
+class HnswIndex:
+    """Graph index. Build params: M, ef_construction. Query param: ef."""
+
+    kind = "hnsw"
+    filename = "ann_hnsw.bin"
+
+    def __init__(self, M: int = 16, ef_construction: int = 200, ef: int = 64, **params):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib not installed; install with: pip install hnswlib")
+        self.params = {"M": M, "ef_construction": ef_construction, "ef": ef, **params}
+        self.index = None
+
+    def build(self, embs: np.ndarray) -> None:
+        n, dim = embs.shape
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self.index.init_index(max_elements=max(n, 1), M=self.params["M"], ef_construction=self.params["ef_construction"])
+        if n:
+            self.index.add_items(np.asarray(embs, dtype=np.float32), np.arange(n))
+        self.index.set_ef(self.params["ef"])
+
+    def add(self, new: np.ndarray, embs: np.ndarray) -> None:
+        start = len(embs) - len(new)
+        self.index.resize_index(max(len(embs), 1))
+        if len(new):
+            self.index.add_items(np.asarray(new, dtype=np.float32), np.arange(start, len(embs)))
+
+    def search(self, queries: np.ndarray, k: int, ef: Optional[int] = None, **params) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(queries).astype(np.float32, copy=False)
+        n = self.index.get_current_count()
+        k_eff = min(k, n)
+        if k_eff == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        # ef must be >= k for hnswlib to return k results
+        self.index.set_ef(max(ef or self.params["ef"], k_eff))
+        ids, dists = self.index.knn_query(queries, k=k_eff)
+        # "ip" space returns 1 - <a, b>
+        return 1.0 - dists, ids.astype(np.int64)
+
+    def save(self, persist_dir: Path) -> None:
+        self.index.save_index(str(Path(persist_dir) / self.filename))
+
+    @classmethod
+    def load(cls, persist_dir: Path, params: Dict[str, Any], embs: np.ndarray) -> "HnswIndex":
+        inst = cls(**params)
+        inst.index = hnswlib.Index(space="ip", dim=embs.shape[1])
+        inst.index.load_index(str(Path(persist_dir) / cls.filename), max_elements=max(embs.shape[0], 1))
+        inst.index.set_ef(inst.params["ef"])
+        return inst
+
+
+class IvfPqIndex:
+    """Inverted file + product quantization. Build params: nlist, m, nbits. Query param: nprobe."""
+
+    kind = "ivfpq"
+    filename = "ann_ivfpq.faiss"
+
+    def __init__(self, nlist: int = 1024, m: int = 16, nbits: int = 8, nprobe: int = 16, **params):
+        if faiss is None:
+            raise RuntimeError("faiss not installed; install with: pip install faiss-cpu")
+        self.params = {"nlist": nlist, "m": m, "nbits": nbits, "nprobe": nprobe, **params}
+        self.index = None
+
+    def build(self, embs: np.ndarray) -> None:
+        embs = np.ascontiguousarray(embs, dtype=np.float32)
+        n, dim = embs.shape
+        # IVF needs at least nlist training points and each PQ codebook 2**nbits; shrink both for small corpora
+        nlist = max(1, min(self.params["nlist"], n // 39 or 1))
+        nbits = max(1, min(self.params["nbits"], int(np.log2(max(n, 2)))))
+        quantizer = faiss.IndexFlatIP(dim)
+        self.index = faiss.IndexIVFPQ(quantizer, dim, nlist, self.params["m"], nbits, faiss.METRIC_INNER_PRODUCT)
+        self.index.train(embs)
+        self.index.add(embs)
+        self.index.nprobe = self.params["nprobe"]
+
+    def add(self, new: np.ndarray, embs: np.ndarray) -> None:
+        # Sequential ids continue from ntotal; the trained coarse quantizer is reused
+        if len(new):
+            self.index.add(np.ascontiguousarray(new, dtype=np.float32))
+
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None, **params) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        self.index.nprobe = nprobe or self.params["nprobe"]
+        scores, ids = self.index.search(queries, k)
+        return scores, ids.astype(np.int64)
+
+    def save(self, persist_dir: Path) -> None:
+        faiss.write_index(self.index, str(Path(persist_dir) / self.filename))
+
+    @classmethod
+    def load(cls, persist_dir: Path, params: Dict[str, Any], embs: np.ndarray) -> "IvfPqIndex":
+        inst = cls(**params)
+        inst.index = faiss.read_index(str(Path(persist_dir) / cls.filename))
+        inst.index.nprobe = inst.params["nprobe"]
+        return inst
+
+
+BACKENDS = {cls.kind: cls for cls in (ExactIndex, HnswIndex, IvfPqIndex)}
+
+
+def build_ann_index(kind: str, embs: np.ndarray, **params):
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown ANN backend {kind!r}; choose one of {sorted(BACKENDS)}")
+    index = BACKENDS[kind](**params)
+    index.build(embs)
+    return index
+
+
+def save_ann_index(index, persist_dir: Path) -> None:
+    index.save(persist_dir)
+    config = {"kind": index.kind, "params": index.params}
+    write_atomic(Path(persist_dir) / ANN_CONFIG_FILE, json.dumps(config))
+
+
+def load_ann_index(persist_dir: Path, embs: np.ndarray):
+    """Load the index described by ann.json, falling back to the exact scan."""
+    cfg_file = Path(persist_dir) / ANN_CONFIG_FILE
+    if not cfg_file.exists():
+        return ExactIndex.load(persist_dir, {}, embs)
+    cfg = json.loads(cfg_file.read_text(encoding="utf-8"))
+    return BACKENDS[cfg["kind"]].load(persist_dir, cfg.get("params", {}), embs)
@@ -0,0 +1,222 @@
+"""Answer cache in front of `llm.generate`.
+
+An answer is reusable when the same model, prompt template and sampling
+settings saw the same question over the same retrieved passages. The exact key
+hashes exactly that: model name, `llm.PROMPT_VERSION`, sampling params, the
+ordered context ids and the normalized question.
+
+With a semantic threshold set, a miss falls back to near-duplicate lookup:
+among cached answers for the *same* context ids, the one whose question
+embedding has cosine similarity >= threshold is reused ("what is negligence
+under indian law" vs "define negligence in Indian law"). Question embeddings
+are only kept in memory.
+
+Entries live in an in-memory LRU with TTL and, optionally, a SQLite file that
+survives restarts and is shared by workers. Every entry is tagged with the
+index generation it was produced under and only served under that generation,
+since re-ingestion can change what a context id refers to. Seeing a new
+generation drops the in-memory entries and prunes SQLite rows of *older*
+generations only: workers pick up a new generation at different times, so a
+lagging worker must not delete what an up-to-date one just wrote.
+
+Settings (env):
+- ANSWER_CACHE_SIZE: in-memory entries (default 512, 0 disables the cache)
+- ANSWER_CACHE_TTL: seconds an answer stays valid (default 3600)
+- ANSWER_CACHE_DB: path of the SQLite tier (default unset = memory only)
+- ANSWER_CACHE_SEMANTIC_THRESHOLD: cosine threshold for near-duplicates (default 0 = off)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import llm
+
+CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+CACHE_DB = os.getenv("ANSWER_CACHE_DB") or None
+SEMANTIC_THRESHOLD = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(_PUNCT_RE.sub(" ", question.lower()).split())
+
+
+def _context_key(context_ids: Sequence[str]) -> str:
+    payload = {
+        "model": llm.active_model_name(),
+        "prompt_version": llm.PROMPT_VERSION,
+        "sampling": llm.sampling_params(),
+        "contexts": list(context_ids),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _generation_number(generation: Optional[str]) -> Optional[int]:
+    # Numeric markers only ever increase; legacy signatures (and None) have no order
+    return int(generation) if generation is not None and generation.isdigit() else None
+
+
+def _exact_key(ctx_key: str, question: str) -> str:
+    return hashlib.sha256(f"{ctx_key}\n{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        db_path: Optional[str] = CACHE_DB,
+        semantic_threshold: float = SEMANTIC_THRESHOLD,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self._lock = threading.Lock()
+        # exact key -> (created, result)
+        self._entries: "OrderedDict[str, Tuple[float, llm.GenerationResult]]" = OrderedDict()
+        # context key -> [(question embedding, exact key)]
+        self._semantic: Dict[str, List[Tuple[np.ndarray, str]]] = {}
+        self._generation: Optional[str] = None
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path and max_entries > 0:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, generation TEXT, created REAL, result TEXT)"
+            )
+            self._db.commit()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _sync_generation(self, generation: Optional[str]) -> None:
+        # Caller holds self._lock
+        if generation == self._generation:
+            return
+        self._entries.clear()
+        self._semantic.clear()
+        current = _generation_number(generation)
+        if self._db is not None and current is not None:
+            # Rows of newer generations (other workers ahead of us) are kept; reads filter by generation.
+            # Legacy/None generations never come back once a numeric marker exists.
+            self._db.execute(
+                "DELETE FROM answers WHERE generation IS NULL OR NOT generation GLOB '[0-9]*' "
+                "OR CAST(generation AS INTEGER) < ?",
+                (current,),
+            )
+            self._db.commit()
+        self._generation = generation
+
+    def _lookup(self, key: str, now: float) -> Optional[llm.GenerationResult]:
+        hit = self._entries.get(key)
+        if hit is not None:
+            if now - hit[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                return hit[1]
+            del self._entries[key]
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT created, result FROM answers WHERE key = ? AND generation IS ?", (key, self._generation)
+            ).fetchone()
+            if row is not None and now - row[0] <= self.ttl:
+                result = llm.GenerationResult(**json.loads(row[1]))
+                self._remember(key, row[0], result)
+                return result
+        return None
+
+    def _remember(self, key: str, created: float, result: llm.GenerationResult) -> None:
+        self._entries[key] = (created, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(
+        self,
+        question: str,
+        context_ids: Sequence[str],
+        generation: Optional[str],
+        embedding: Optional[np.ndarray] = None,
+    ) -> Optional[llm.GenerationResult]:
+        if not self.enabled:
+            return None
+        ctx_key = _context_key(context_ids)
+        now = time.time()
+        with self._lock:
+            self._sync_generation(generation)
+            result = self._lookup(_exact_key(ctx_key, question), now)
+            if result is not None:
+                self.hits += 1
+                return result
+            if embedding is not None and self.semantic_threshold > 0:
+                for emb, key in self._semantic.get(ctx_key, []):
+                    if float(np.dot(emb, embedding)) >= self.semantic_threshold:
+                        result = self._lookup(key, now)
+                        if result is not None:
+                            self.semantic_hits += 1
+                            return result
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        question: str,
+        context_ids: Sequence[str],
+        generation: Optional[str],
+        result: llm.GenerationResult,
+        embedding: Optional[np.ndarray] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        ctx_key = _context_key(context_ids)
+        key = _exact_key(ctx_key, question)
+        now = time.time()
+        with self._lock:
+            self._sync_generation(generation)
+            self._remember(key, now, result)
+            if embedding is not None and self.semantic_threshold > 0:
+                similar = self._semantic.setdefault(ctx_key, [])
+                similar[:] = [(e, k) for e, k in similar if k in self._entries]
+                similar.append((embedding, key))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, generation, created, result) VALUES (?, ?, ?, ?)",
+                    (key, generation, now, json.dumps(asdict(result))),
+                )
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._semantic.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,505 @@
+"""BM25 inverted index: a lexical backend whose cost follows the postings touched.
+
+`TfidfStore` scores every row of its matrix for each question. `BM25Store`
+keeps, for every term, the rows containing it (its postings) and only reads
+the postings of the question's terms; within those it skips whatever cannot
+change the top k:
+
+- postings are split into blocks of 128 rows, stored as variable-byte
+  encoded row gaps followed by term frequencies, with the last row, the
+  highest term frequency and the shortest row of every block kept
+  uncompressed beside them;
+- questions are evaluated with MaxScore: posting lists are taken in order of
+  their best possible contribution (bounded per block from that highest
+  frequency and shortest row). Once the k-th best score so far beats the sum
+  of what the remaining lists could add, no unseen row can enter the top k,
+  so those lists are only probed for the current candidates, and only in the
+  blocks that hold a candidate whose score can still reach the top k.
+
+Results are exact: the same rows and scores as scoring every posting.
+
+The index is derived from the stored passages with the same row numbers, so
+BM25 candidates fuse with embedding candidates like TF-IDF ones. It lives in
+`bm25.*` files next to the TF-IDF files, as segments of consecutive rows:
+the base segment from the last full build and one segment per append since.
+The files hold raw frequencies and lengths only; idf, average length and the
+block bounds are computed at load time over all segments, so an append never
+touches existing segments and K1/B can change without a rebuild.
+
+Once BM25 is in use on an index (its files exist, or LEXICAL_BACKEND=bm25),
+every `TfidfStore` write updates it inside the same `writing()` bracket, so
+readers see both at the same generation and queries never pay for a build:
+an append (`update`) indexes only the new rows as a new segment, while full
+builds and compaction rebuild the base segment. Tombstones are read at load
+time and need no rewrite. Past BM25_MAX_SEGMENTS appended segments, those are
+merged into one (re-encoding only the appended rows). Only the first use on
+an index without BM25 files builds them on load. Writes take an exclusive
+file lock and write per-process temporary files, so several workers never
+interleave.
+
+Settings (env):
+- LEXICAL_BACKEND: default lexical backend for `/query/` and hybrid search,
+  `tfidf` (default) or `bm25`
+- BM25_K1: term-frequency saturation (default 1.2)
+- BM25_B: document-length normalization (default 0.75)
+- BM25_MAX_SEGMENTS: appended segments kept before merging them (default 8)
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+from . import index_format
+from .index_format import Blob, BlobWriter
+from .query_cache import cached_batch, retrieval_results
+from .vector_store import (
+    Document,
+    generation_is_stable,
+    get_document,
+    load_passages,
+    read_generation,
+    read_tombstones,
+    write_atomic,
+)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger("bm25")
+
+LEXICAL_BACKENDS = ("tfidf", "bm25")
+LEXICAL_BACKEND = os.getenv("LEXICAL_BACKEND", "tfidf")
+K1 = float(os.getenv("BM25_K1", "1.2"))
+B = float(os.getenv("BM25_B", "0.75"))
+BLOCK_SIZE = 128
+BM25_VERSION = 3
+BM25_FILE = "bm25.json"
+LOCK_FILE = "bm25.lock"
+MAX_SEGMENTS = int(os.getenv("BM25_MAX_SEGMENTS", "8"))
+# Per term: document frequency, first block (n_terms + 1 entries)
+# Per block: last row, highest term frequency, shortest row length, byte offset into the postings (n_blocks + 1 entries)
+# Per row: length in tokens
+ARRAYS = ("df", "term_blocks", "block_last", "block_maxtf", "block_mindl", "block_offsets", "doclen")
+# Bounds are sums of floats; never prune a row that ties the k-th score up to rounding
+_SLACK = 1e-9
+
+
+def _analyzer():
+    # Same tokens as the TF-IDF vectorizer, unigrams only
+    return CountVectorizer(lowercase=True, stop_words="english", dtype=np.int32)
+
+
+def idf(df: np.ndarray, n_docs: int) -> np.ndarray:
+    # Lucene's variant: never negative, even for terms in most documents
+    return np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+
+@contextmanager
+def _locked(persist_dir: Path, exclusive: bool):
+    """Cross-process lock on the BM25 files: exclusive to build, shared to open."""
+    with open(Path(persist_dir) / LOCK_FILE, "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def in_use(persist_dir: Path) -> bool:
+    return (Path(persist_dir) / BM25_FILE).exists() or LEXICAL_BACKEND == "bm25"
+
+
+def sync(persist_dir: Path, appended_from: Optional[int] = None) -> bool:
+    """Bring the BM25 files in line with the stored rows, if BM25 is in use on this index.
+
+    Writers call this inside their `writing()` bracket, after the doc columns
+    are in place. `appended_from` is the first row an append added: only rows
+    from there on are indexed, as a new segment. Without it (full builds,
+    compaction) the index is rebuilt. Returns True when anything was written.
+    """
+    if not in_use(persist_dir):
+        return False
+    store = BM25Store(persist_dir)
+    if appended_from is None:
+        store.build()
+    else:
+        store.append(appended_from)
+    return True
+
+
+def _prefix(segment: int) -> str:
+    # The base segment keeps the plain bm25.* names
+    return "bm25" if segment == 0 else f"bm25.{segment}"
+
+
+def vbyte_encode(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Variable-byte encode non-negative ints, 7 bits per byte, high bit set on all but the last byte.
+
+    Returns the bytes and the offset of each value's first byte.
+    """
+    v = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(v), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        nbytes += v >= (1 << shift)
+    starts = np.cumsum(nbytes) - nbytes
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for j in range(int(nbytes.max(initial=0))):
+        m = nbytes > j
+        chunk = (v[m] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        more = (nbytes[m] - 1 > j).astype(np.uint64) << np.uint64(7)
+        out[starts[m] + j] = (chunk | more).astype(np.uint8)
+    return out, starts
+
+
+def vbyte_decode(data: np.ndarray) -> np.ndarray:
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shift = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.int64) << (7 * shift)
+    return np.add.reduceat(parts, starts)
+
+
+class _Segment:
+    """The terms and postings of one run of consecutive rows, memory-mapped."""
+
+    def __init__(self, persist_dir: Path, prefix: str, first: int):
+        self.first = first
+        self.terms = Blob(persist_dir, f"{prefix}.terms")
+        for name in ARRAYS:
+            setattr(self, name, np.load(persist_dir / f"{prefix}.{name}.npy", mmap_mode="r"))
+        size = int(self.block_offsets[-1])
+        path = persist_dir / f"{prefix}.postings.bin"
+        self.postings = np.memmap(path, dtype=np.uint8, mode="r", shape=(size,)) if size else np.zeros(0, np.uint8)
+
+    def term_id(self, token: str) -> int:
+        # The vocabulary is stored sorted, so lookups are a binary search over the mmapped terms
+        i = bisect.bisect_left(self.terms, token)
+        return i if i < len(self.terms) and self.terms[i] == token else -1
+
+    def decode(self, t: int, blocks: np.ndarray, stats: Optional[Dict[str, int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and term frequencies of term `t` in the given (sorted) blocks."""
+        b0 = int(self.term_blocks[t])
+        offsets = self.block_offsets
+        if blocks[-1] - blocks[0] + 1 == len(blocks):
+            data = np.asarray(self.postings[int(offsets[blocks[0]]) : int(offsets[blocks[-1] + 1])])
+        else:
+            data = np.concatenate([self.postings[int(offsets[bl]) : int(offsets[bl + 1])] for bl in blocks])
+        values = vbyte_decode(data)
+        counts = np.minimum(BLOCK_SIZE, int(self.df[t]) - BLOCK_SIZE * (blocks - b0))
+        # Each block holds `count` gaps followed by `count` frequencies
+        block_of = np.repeat(np.arange(len(blocks)), 2 * counts)
+        slot = np.arange(len(values)) - np.repeat(np.cumsum(2 * counts) - 2 * counts, 2 * counts)
+        is_gap = slot < counts[block_of]
+        gaps, tfs = values[is_gap], values[~is_gap]
+        # A block's first gap is relative to the previous block's last row
+        base = np.where(blocks > b0, np.asarray(self.block_last)[np.maximum(blocks - 1, 0)], 0)
+        starts = np.cumsum(counts) - counts
+        gaps[starts] += base
+        ends = np.cumsum(gaps)
+        rows = ends - np.repeat(ends[starts] - gaps[starts], counts)
+        if stats is not None:
+            stats["decoded"] = stats.get("decoded", 0) + len(rows)
+        return rows, tfs
+
+
+class BM25Store:
+    def __init__(self, persist_dir: Path, k1: float = K1, b: float = B):
+        self.persist_dir = Path(persist_dir)
+        self.k1, self.b = k1, b
+        self.docs: Sequence[Document] = []
+        self.tombstones = np.zeros(0, dtype=np.int64)
+        self.generation: Optional[str] = None
+        self.segments: List[_Segment] = []
+        self._analyze = _analyzer().build_analyzer()
+
+    # Building
+
+    def _info(self) -> Optional[dict]:
+        path = self.persist_dir / BM25_FILE
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+    def is_current(self) -> bool:
+        """True when the on-disk BM25 files cover the stored rows.
+
+        Writers update BM25 whenever they change rows (see `sync`), so the row
+        count only catches indexes written while BM25 was not in use.
+        """
+        info = self._info()
+        return (
+            info is not None
+            and info.get("version") == BM25_VERSION
+            and info.get("docs") == len(load_passages(self.persist_dir, None))
+        )
+
+    def build(self) -> int:
+        """(Re)build the inverted index from the stored passages as one segment; returns the row count."""
+        with _locked(self.persist_dir, exclusive=True):
+            return self._build()
+
+    def append(self, first: int) -> int:
+        """Index stored rows `first`.. as a new segment, leaving the existing segments alone.
+
+        Falls back to a full build when the files do not cover exactly the rows
+        before `first` (e.g. BM25 was not in use when they were written). With
+        BM25_MAX_SEGMENTS appended segments already, those are merged with the
+        new rows into one. Returns the number of rows indexed.
+        """
+        with _locked(self.persist_dir, exclusive=True):
+            info = self._info()
+            if info is None or info.get("version") != BM25_VERSION or info["docs"] != first:
+                return self._build()
+            segments = info["segments"]
+            if len(segments) > MAX_SEGMENTS:
+                first, segments = segments[1]["first"], segments[:1]
+            docs = load_passages(self.persist_dir, None)
+            segments = segments + [self._write_segment(len(segments), docs, first, len(docs))]
+            self._commit(segments)
+            return len(docs) - first
+
+    def _build(self) -> int:
+        # Rows are read without the passage LRU: the generation is mid-write when called from `sync`
+        docs = load_passages(self.persist_dir, None)
+        self._commit([self._write_segment(0, docs, 0, len(docs))])
+        return len(docs)
+
+    def _write_segment(self, segment: int, docs: Sequence[Document], start: int, end: int) -> dict:
+        vectorizer = _analyzer()
+        try:
+            counts = vectorizer.fit_transform(docs[row].text for row in range(start, end))
+            # Feature names come out sorted, which `_Segment.term_id` relies on
+            terms = vectorizer.get_feature_names_out().tolist()
+        except ValueError:
+            # No rows, or nothing but stop words
+            counts, terms = None, []
+        arrays, postings = self._encode(counts, end - start, start)
+
+        # Unique per build so concurrent builders (other workers) never write the same temp file
+        tmp = f".{os.getpid()}.{uuid.uuid4().hex[:8]}{index_format.TMP_SUFFIX}"
+        prefix = _prefix(segment)
+        writer = BlobWriter(self.persist_dir, f"{prefix}.terms", tmp)
+        for term in terms:
+            writer.add(term)
+        writer.close()
+        for name in ARRAYS:
+            with open(self.persist_dir / f"{prefix}.{name}.npy{tmp}", "wb") as fh:
+                np.save(fh, arrays[name])
+        (self.persist_dir / f"{prefix}.postings.bin{tmp}").write_bytes(postings.tobytes())
+        names = [f"{prefix}.terms.bin", f"{prefix}.terms.idx.npy", f"{prefix}.postings.bin"]
+        for name in names + [f"{prefix}.{name}.npy" for name in ARRAYS]:
+            os.replace(self.persist_dir / (name + tmp), self.persist_dir / name)
+        logger.info("Indexed BM25 rows %d-%d, %d terms in %s", start, end, len(terms), self.persist_dir)
+        return {"first": start, "docs": end - start, "terms": len(terms), "postings": int(arrays["df"].sum())}
+
+    def _commit(self, segments: List[dict]) -> None:
+        # Written last: readers only trust the segment files once it lists them
+        info = {
+            "version": BM25_VERSION,
+            "block_size": BLOCK_SIZE,
+            "docs": segments[-1]["first"] + segments[-1]["docs"],
+            "segments": segments,
+        }
+        write_atomic(self.persist_dir / BM25_FILE, json.dumps(info))
+        # Files of segments merged away; readers open files under the shared lock, so none is mid-open
+        for path in self.persist_dir.glob("bm25.[0-9]*"):
+            if int(path.name.split(".")[1]) >= len(segments):
+                path.unlink(missing_ok=True)
+
+    def _encode(self, counts, n_rows: int, first: int) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        if counts is None:
+            empty = {name: np.zeros(0, dtype=np.int64) for name in ARRAYS}
+            empty.update(
+                term_blocks=np.zeros(1, dtype=np.int64),
+                block_offsets=np.zeros(1, dtype=np.int64),
+                doclen=np.zeros(n_rows, dtype=np.int32),
+            )
+            return empty, np.zeros(0, dtype=np.uint8)
+
+        doclen = np.asarray(counts.sum(axis=1)).ravel().astype(np.int32)
+        csc = counts.tocsc()
+        csc.sort_indices()
+        df = np.diff(csc.indptr).astype(np.int64)
+        local, tfs = csc.indices.astype(np.int64), csc.data.astype(np.int64)
+        n_terms, n_postings = len(df), len(local)
+        term = np.repeat(np.arange(n_terms), df)
+
+        # Blocks of BLOCK_SIZE postings per term
+        term_blocks = np.concatenate(([0], np.cumsum(-(-df // BLOCK_SIZE))))
+        pos = np.arange(n_postings) - csc.indptr[:-1][term]
+        block = term_blocks[:-1][term] + pos // BLOCK_SIZE
+        block_start = np.flatnonzero(np.concatenate(([True], block[1:] != block[:-1])))
+        block_count = np.diff(np.append(block_start, n_postings))
+        # Score bounds need only these: BM25 grows with the frequency and shrinks with the row length
+        block_maxtf = np.maximum.reduceat(tfs, block_start)
+        block_mindl = np.minimum.reduceat(doclen[local], block_start)
+        rows = local + first
+        block_last = rows[block_start + block_count - 1]
+
+        # Row gaps within each term (the first row as is), then per block: gaps, frequencies
+        gaps = rows.copy()
+        gaps[1:] -= rows[:-1]
+        firsts = csc.indptr[:-1]
+        gaps[firsts] = rows[firsts]
+        values = np.empty(2 * n_postings, dtype=np.int64)
+        values[np.arange(n_postings) + block_start[block]] = gaps
+        values[np.arange(n_postings) + block_start[block] + block_count[block]] = tfs
+        postings, value_offsets = vbyte_encode(values)
+        block_offsets = np.append(value_offsets[2 * block_start], len(postings))
+
+        arrays = {
+            "df": df,
+            "term_blocks": term_blocks.astype(np.int64),
+            "block_last": block_last,
+            "block_maxtf": block_maxtf,
+            "block_mindl": block_mindl.astype(np.int32),
+            "block_offsets": block_offsets.astype(np.int64),
+            "doclen": doclen,
+        }
+        return arrays, postings
+
+    # Loading
+
+    def load(self) -> "BM25Store":
+        """Open the on-disk index; builds it first only if BM25 was never built for these rows."""
+        self.generation = read_generation(self.persist_dir)
+        if not self.is_current():
+            with _locked(self.persist_dir, exclusive=True):
+                # Another worker may have built it while we waited
+                if not self.is_current():
+                    logger.warning("No BM25 index for the rows in %s; building it now", self.persist_dir)
+                    self._build()
+        # Shared lock: no build replaces files while they are opened; mapped files outlive a later replace
+        with _locked(self.persist_dir, exclusive=False):
+            info = self._info()
+            self.segments = [_Segment(self.persist_dir, _prefix(i), seg["first"]) for i, seg in enumerate(info["segments"])]
+        self.docs = load_passages(self.persist_dir, self.generation)
+        self.tombstones = read_tombstones(self.persist_dir)
+        self.n_docs = int(info["docs"])
+        doclen = np.concatenate([np.asarray(seg.doclen) for seg in self.segments])
+        self.avgdl = float(doclen.mean()) if len(doclen) else 1.0
+        self.norm = self._norm(doclen, self.avgdl)
+        for seg in self.segments:
+            # Per block: the most one occurrence of the term can add per unit of idf, from this corpus' avgdl
+            seg.block_bound = self._score(1.0, np.asarray(seg.block_maxtf), self._norm(np.asarray(seg.block_mindl), self.avgdl))
+            starts = np.asarray(seg.term_blocks[:-1])
+            seg.term_bound = np.maximum.reduceat(seg.block_bound, starts) if len(starts) else np.zeros(0)
+        return self
+
+    def _norm(self, doclen: np.ndarray, avgdl: float) -> np.ndarray:
+        return self.k1 * (1.0 - self.b + self.b * doclen / (avgdl or 1.0))
+
+    def _score(self, term_idf, tfs: np.ndarray, norm: np.ndarray) -> np.ndarray:
+        return term_idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+    # Querying
+
+    def query(self, q: str, k: int = 5, include_text: bool = True) -> List[Tuple[Document, float]]:
+        return self.query_batch([q], k=k, include_text=include_text)[0]
+
+    def query_batch(self, qs: List[str], k: int = 5, include_text: bool = True) -> List[List[Tuple[Document, float]]]:
+        return [[(get_document(self.docs, i, include_text), s) for i, s in rows] for rows in self.search_rows(qs, k)]
+
+    def search_rows(self, qs: List[str], k: int = 5) -> List[List[Tuple[int, float]]]:
+        """(row, score) pairs of the top k per question; rows index `docs` like the other stores."""
+        if not qs:
+            return []
+        cacheable = generation_is_stable(self.generation)
+        prefix = ("bm25", str(self.persist_dir), self.generation, k, self.k1, self.b)
+        keys = [prefix + (q,) if cacheable else None for q in qs]
+        return cached_batch(retrieval_results, keys, lambda missing: [self.search_one(qs[i], k) for i in missing])
+
+    def _lists(self, q: str) -> List[Tuple[_Segment, int, float, float]]:
+        """(segment, term id, weight, bound) per posting list of the question's terms.
+
+        A term has one list per segment containing it; its idf comes from its
+        document frequency over all segments, and the weight includes how
+        often the question repeats it.
+        """
+        qtf: Dict[str, int] = {}
+        for token in self._analyze(q):
+            qtf[token] = qtf.get(token, 0) + 1
+        lists = []
+        for token, n in qtf.items():
+            found = [(seg, t) for seg in self.segments if (t := seg.term_id(token)) >= 0]
+            if not found:
+                continue
+            weight = float(idf(sum(int(seg.df[t]) for seg, t in found), self.n_docs)) * n
+            lists.extend((seg, t, weight, weight * float(seg.term_bound[t])) for seg, t in found)
+        return lists
+
+    def search_one(self, q: str, k: int, stats: Optional[Dict[str, int]] = None) -> List[Tuple[int, float]]:
+        """MaxScore top-k for one question; `stats` (if given) accumulates postings decoded vs. matched."""
+        lists = self._lists(q)
+        if not lists or k <= 0:
+            return []
+        lists.sort(key=lambda entry: -entry[3])
+        bound = np.array([entry[3] for entry in lists])
+        # rest[i]: the most that lists i.. can still add to any row
+        rest = np.append(np.cumsum(bound[::-1])[::-1], 0.0)
+        if stats is not None:
+            stats["postings"] = stats.get("postings", 0) + sum(int(seg.df[t]) for seg, t, _, _ in lists)
+
+        rows = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+        i = 0
+        # Essential lists: any row in one of them may still reach the top k
+        while i < len(lists) and not (len(rows) >= k and rest[i] + _SLACK < self._kth(scores, k)):
+            seg, t, weight, _ = lists[i]
+            new_rows, tfs = seg.decode(t, np.arange(seg.term_blocks[t], seg.term_blocks[t + 1]), stats)
+            new_rows, tfs = self._live(new_rows, tfs)
+            rows = np.concatenate((rows, new_rows))
+            scores = np.concatenate((scores, self._score(weight, tfs, self.norm[new_rows])))
+            if i:
+                rows, inverse = np.unique(rows, return_inverse=True)
+                scores = np.bincount(inverse.ravel(), weights=scores, minlength=len(rows))
+            i += 1
+
+        # Non-essential lists: only add to candidates that can still make the top k
+        for j in range(i, len(lists)):
+            seg, t, weight, _ = lists[j]
+            theta = self._kth(scores, k)
+            keep = scores + rest[j] + _SLACK >= theta
+            rows, scores = rows[keep], scores[keep]
+            b0, b1 = int(seg.term_blocks[t]), int(seg.term_blocks[t + 1])
+            block = b0 + np.searchsorted(np.asarray(seg.block_last[b0:b1]), rows)
+            inside = (block < b1) & (rows >= seg.first)
+            # Block-max: a candidate that cannot reach theta even with this block's best is dropped
+            best = np.where(inside, seg.block_bound[np.minimum(block, b1 - 1)] * weight, 0.0)
+            keep = scores + best + rest[j + 1] + _SLACK >= theta
+            rows, scores, block, inside = rows[keep], scores[keep], block[keep], inside[keep]
+            probe = np.unique(block[inside])
+            if not len(probe):
+                continue
+            t_rows, tfs = seg.decode(t, probe, stats)
+            at = np.minimum(np.searchsorted(t_rows, rows), len(t_rows) - 1)
+            hit = t_rows[at] == rows
+            scores[hit] += self._score(weight, tfs[at[hit]], self.norm[rows[hit]])
+
+        if not len(rows):
+            return []
+        top = np.lexsort((rows, -scores))[:k]
+        return [(int(rows[r]), float(scores[r])) for r in top]
+
+    @staticmethod
+    def _kth(scores: np.ndarray, k: int) -> float:
+        if len(scores) < k:
+            return 0.0
+        return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+    def _live(self, rows: np.ndarray, tfs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if not len(self.tombstones):
+            return rows, tfs
+        live = ~np.isin(rows, self.tombstones)
+        return rows[live], tfs[live]
@@ -0,0 +1,109 @@
+"""Streaming, section-aware chunking of source documents.
+
+Files are read lazily line by line and emitted as passage-sized `Document`
+chunks, so ingestion never holds more than one chunk (plus overlap) of any
+file in memory. A statute heading such as "Section 302", "Article 14",
+"Chapter IV" or a numbered clause ("73. Compensation for ...") always starts a
+new chunk and is recorded in the chunk's `meta["section"]`.
+
+Chunk sizes are measured in whitespace-separated words, a cheap stand-in for
+model tokens. Consecutive chunks within a section share `overlap` words.
+Each chunk's actual token count is stored in `meta["tokens"]` for the context
+packer.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from .context_packer import count_tokens
+from .vector_store import Document
+
+CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "200"))
+CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "40"))
+
+SECTION_RE = re.compile(
+    r"^\s*(?P<label>(?i:section|sec\.|article|art\.|chapter|part|schedule|order|rule)\s+[0-9IVXLC]+[A-Z]?\b"
+    r"|\d+[A-Z]?(?=\.\s+[A-Z]))"
+)
+
+
+def iter_paragraphs(path: Path) -> Iterator[str]:
+    """Yield blank-line separated paragraphs of a text file, reading lazily."""
+    buf: List[str] = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                buf.append(line)
+            elif buf:
+                yield " ".join(buf)
+                buf = []
+    if buf:
+        yield " ".join(buf)
+
+
+def _section_of(paragraph: str) -> Optional[str]:
+    m = SECTION_RE.match(paragraph)
+    return m.group("label") if m else None
+
+
+def chunk_paragraphs(paragraphs: Iterable[str], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[dict]:
+    """Group paragraphs into chunks of about `chunk_size` words.
+
+    Yields dicts with `text` (paragraphs joined by single newlines, so a chunk
+    never contains a blank line) and `section` (the heading in effect, or None).
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    overlap = max(0, min(overlap, chunk_size // 2))
+    section: Optional[str] = None
+    lines: List[str] = []
+    n_words = 0
+    # Words added since the last flush; a chunk holding only carried-over overlap is not emitted
+    fresh = 0
+
+    def flush():
+        return {"text": "\n".join(lines), "section": section}
+
+    for para in paragraphs:
+        heading = _section_of(para)
+        if heading is not None:
+            if fresh:
+                yield flush()
+            # New section: don't carry overlap across the boundary
+            lines, n_words, fresh = [], 0, 0
+            section = heading
+        words = para.split()
+        # Long paragraphs are split on word boundaries
+        while words:
+            room = chunk_size - n_words
+            take, words = words[:room], words[room:]
+            lines.append(" ".join(take))
+            n_words += len(take)
+            fresh += len(take)
+            if n_words >= chunk_size:
+                yield flush()
+                tail = " ".join(lines).split()[-overlap:] if overlap else []
+                lines = [" ".join(tail)] if tail else []
+                n_words, fresh = len(tail), 0
+    if fresh:
+        yield flush()
+
+
+def iter_chunks(data_dir: Path, pattern: str = "*.txt", chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[Document]:
+    """Yield chunk `Document`s for every file under `data_dir`, one file at a time."""
+    for p in sorted(Path(data_dir).glob(pattern)):
+        yield from chunk_file(p, chunk_size=chunk_size, overlap=overlap)
+
+
+def chunk_file(path: Path, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[Document]:
+    path = Path(path)
+    for i, chunk in enumerate(chunk_paragraphs(iter_paragraphs(path), chunk_size, overlap)):
+        meta = {"path": str(path), "source": path.name, "chunk": i, "tokens": count_tokens(chunk["text"])}
+        if chunk["section"]:
+            meta["section"] = chunk["section"]
+        yield Document(id=f"{path.name}#{i}", text=chunk["text"], meta=meta)
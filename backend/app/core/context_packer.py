@@ -0,0 +1,192 @@
+"""Token-budget-aware packing of retrieved passages into the prompt.
+
+The local tokenizer truncates at `LLM_MAX_INPUT_TOKENS`, which used to cut off
+the end of the prompt: the question and the `<|answer|>` marker. The packer
+instead reserves room for the instructions and question first, then fills the
+remaining budget with passages in score order, trimming the first passage that
+does not fit whole and dropping the rest.
+
+Token counts are computed once per chunk at ingest (`meta["tokens"]`) with
+`count_tokens`, which uses the LLM tokenizer when `transformers` is available
+and a word-based estimate otherwise. The counter's name is recorded in the
+ingest manifest so a change of tokenizer triggers a rebuild.
+
+The reserved part is counted the way the model tokenizes the prompt (BOS
+included), plus `PACK_SAFETY_TOKENS` (default 8) of headroom, since pieces
+tokenized separately do not always add up to the joined text. The packed
+prompt is then counted once more and its last passage shortened if it still
+exceeds the limit.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from . import llm
+from .vector_store import Document
+
+logger = logging.getLogger("context_packer")
+
+# A passage is only trimmed if at least this many of its tokens still fit
+MIN_TRIM_TOKENS = int(os.getenv("PACK_MIN_TRIM_TOKENS", "32"))
+# Kept free below the input limit for tokens lost or gained where pieces are joined
+SAFETY_TOKENS = int(os.getenv("PACK_SAFETY_TOKENS", "8"))
+
+APPROX_COUNTER = "approx-v1"
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _approx_count(text: str) -> int:
+    # Subword tokenizers average ~1.3 tokens per word on English legal text
+    return math.ceil(len(_PIECE_RE.findall(text)) * 1.3)
+
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    if llm.AutoTokenizer is None:
+        return None
+    try:
+        return llm.AutoTokenizer.from_pretrained(llm.DEFAULT_MODEL)
+    except Exception as e:  # offline or unknown model: fall back to the estimate
+        logger.warning("Could not load tokenizer for %s (%s); using approximate token counts", llm.DEFAULT_MODEL, e)
+        return None
+
+
+def token_counter_name() -> str:
+    return llm.DEFAULT_MODEL if _tokenizer() is not None else APPROX_COUNTER
+
+
+def count_tokens(text: str) -> int:
+    tok = _tokenizer()
+    if tok is None:
+        return _approx_count(text)
+    return len(tok(text, add_special_tokens=False)["input_ids"])
+
+
+def count_prompt_tokens(prompt: str) -> int:
+    """Tokens the model sees for a whole prompt, special tokens (BOS) included."""
+    tok = _tokenizer()
+    if tok is None:
+        return _approx_count(prompt) + 1
+    return len(tok(prompt)["input_ids"])
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of `text`, cut at a word boundary, with at most `max_tokens` tokens."""
+    if max_tokens <= 0:
+        return ""
+    words = text.split(" ")
+    lo, hi = 0, len(words)
+    # Binary search on the number of words kept
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+@dataclass
+class PackDecision:
+    id: str
+    score: float
+    tokens: int
+    used_tokens: int
+    status: str  # full | trimmed | dropped
+
+
+@dataclass
+class PackResult:
+    contexts: List[str]
+    budget: int
+    used_tokens: int
+    reserved_tokens: int
+    decisions: List[PackDecision] = field(default_factory=list)
+
+    def context_keys(self) -> List[str]:
+        """Ids of the packed passages; trimmed ones carry their kept length."""
+        return [
+            d.id if d.status == "full" else f"{d.id}:{d.used_tokens}"
+            for d in self.decisions
+            if d.status != "dropped"
+        ]
+
+    def report(self) -> dict:
+        return {
+            "budget": self.budget,
+            "used_tokens": self.used_tokens,
+            "reserved_tokens": self.reserved_tokens,
+            "decisions": [asdict(d) for d in self.decisions],
+        }
+
+
+def pack_contexts(
+    question: str,
+    hits: Sequence[Tuple[Document, float]],
+    max_input_tokens: Optional[int] = None,
+    build_prompt: Callable[[str, List[str]], str] = llm.build_prompt,
+) -> PackResult:
+    """Choose (and if needed trim) passages so the whole prompt fits `max_input_tokens`.
+
+    Raises ValueError when the instructions and question alone do not fit.
+    """
+    max_input_tokens = max_input_tokens or llm.MAX_INPUT_TOKENS
+    reserved = count_prompt_tokens(build_prompt(question, [])) + SAFETY_TOKENS
+    if reserved > max_input_tokens:
+        raise ValueError(f"Question is too long: {reserved} prompt tokens exceed the {max_input_tokens}-token input budget")
+    budget = max_input_tokens - reserved
+    remaining = budget
+    contexts: List[str] = []
+    packed: List[PackDecision] = []
+    decisions: List[PackDecision] = []
+    for doc, score in sorted(hits, key=lambda h: h[1], reverse=True):
+        tokens = doc.meta.get("tokens")
+        if not isinstance(tokens, int):
+            tokens = count_tokens(doc.text)
+        # Blank line before every passage but the first, then the "[CONTEXT i]" header line
+        overhead = count_tokens(("\n\n" if contexts else "") + f"[CONTEXT {len(contexts) + 1}]\n")
+        fit = remaining - overhead
+        if tokens <= fit:
+            contexts.append(doc.text)
+            decisions.append(PackDecision(doc.id, float(score), tokens, tokens, "full"))
+            remaining -= tokens + overhead
+        elif fit >= MIN_TRIM_TOKENS and (text := trim_to_tokens(doc.text, fit)):
+            used = count_tokens(text)
+            contexts.append(text)
+            decisions.append(PackDecision(doc.id, float(score), tokens, used, "trimmed"))
+            remaining -= used + overhead
+        else:
+            decisions.append(PackDecision(doc.id, float(score), tokens, 0, "dropped"))
+            continue
+        packed.append(decisions[-1])
+
+    # The limit applies to the joined prompt: shorten the last passage until it fits
+    while contexts and (over := count_prompt_tokens(build_prompt(question, contexts)) - max_input_tokens) > 0:
+        last = packed[-1]
+        keep = last.used_tokens - over
+        text = trim_to_tokens(contexts[-1], keep) if keep >= MIN_TRIM_TOKENS else ""
+        used = count_tokens(text) if text else 0
+        if text and used < last.used_tokens:
+            contexts[-1] = text
+            last.status = "trimmed"
+        else:
+            contexts.pop()
+            packed.pop()
+            last.status = "dropped"
+            used = 0
+        remaining += last.used_tokens - used
+        last.used_tokens = used
+    return PackResult(
+        contexts=contexts,
+        budget=budget,
+        used_tokens=budget - remaining,
+        reserved_tokens=reserved,
+        decisions=decisions,
+    )
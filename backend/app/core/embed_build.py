@@ -0,0 +1,220 @@
+"""Sharded, resumable embedding builds.
+
+Records are split into fixed-size row shards. Each shard is encoded (in this
+process, or across a spawn-based process pool when `EMB_BUILD_WORKERS` > 1)
+and written to `embed_checkpoints/` as soon as it finishes, so a build that
+crashes at 90% resumes from the last finished shard instead of starting over.
+Checkpoints are tied to the model, shard size and index generation they were
+computed for and are discarded when any of those change.
+
+Progress is written to `embed_status.json` in the index dir after every shard,
+which lets `/embed/status` report it from any worker process.
+
+Settings (env):
+- EMB_BUILD_WORKERS: encoder processes (default 1 = encode in-process)
+- EMB_BATCH_SIZE: `encode()` batch size (default 64)
+- EMB_SHARD_SIZE: rows per checkpoint shard (default 2048)
+- EMB_THREADS_PER_WORKER: torch threads per worker (default cpu_count // workers)
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .vector_store import write_atomic
+
+logger = logging.getLogger("embed_build")
+
+CHECKPOINT_DIR = "embed_checkpoints"
+STATUS_FILE = "embed_status.json"
+
+
+@dataclass
+class EmbedBuildSettings:
+    workers: int = int(os.getenv("EMB_BUILD_WORKERS", "1"))
+    batch_size: int = int(os.getenv("EMB_BATCH_SIZE", "64"))
+    shard_size: int = int(os.getenv("EMB_SHARD_SIZE", "2048"))
+    threads_per_worker: int = int(os.getenv("EMB_THREADS_PER_WORKER", "0"))
+
+    def threads(self) -> int:
+        if self.threads_per_worker > 0:
+            return self.threads_per_worker
+        return max(1, (os.cpu_count() or 1) // max(1, self.workers))
+
+
+@dataclass
+class BuildStatus:
+    state: str = "idle"  # idle | running | saving | done | failed
+    total: int = 0
+    done: int = 0
+    shards_total: int = 0
+    shards_done: int = 0
+    resumed_shards: int = 0
+    workers: int = 1
+    started_at: Optional[float] = None
+    updated_at: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+def read_status(persist_dir: Path) -> BuildStatus:
+    path = Path(persist_dir) / STATUS_FILE
+    if not path.exists():
+        return BuildStatus()
+    return BuildStatus(**json.loads(path.read_text(encoding="utf-8")))
+
+
+def _write_status(persist_dir: Path, status: BuildStatus) -> None:
+    status.updated_at = time.time()
+    if status.started_at and status.done and status.state == "running":
+        rate = status.done / max(status.updated_at - status.started_at, 1e-6)
+        status.eta_seconds = round((status.total - status.done) / rate, 1)
+    write_atomic(Path(persist_dir) / STATUS_FILE, json.dumps(asdict(status)))
+
+
+# --- worker process side -------------------------------------------------
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    # Limit BLAS/torch threads before the encoder is created so workers don't oversubscribe cores
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except Exception:  # pragma: no cover - torch is optional
+        pass
+    from sentence_transformers import SentenceTransformer
+
+    from .quant import quantize_encoder
+
+    global _worker_model
+    _worker_model = quantize_encoder(SentenceTransformer(model_name, device="cpu"))
+
+
+def _encode_shard(texts: List[str], batch_size: int, out_path: str) -> int:
+    _write_shard(_worker_model, texts, batch_size, Path(out_path))
+    return len(texts)
+
+
+def _write_shard(model, texts: List[str], batch_size: int, out_path: Path) -> None:
+    from .embedding_store import normalize_rows
+
+    embs = normalize_rows(model.encode(texts, batch_size=batch_size, convert_to_numpy=True))
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        np.save(fh, embs)
+    os.replace(tmp, out_path)
+
+
+# --- coordinator side ----------------------------------------------------
+
+
+def _shard_ranges(n: int, shard_size: int) -> List[Tuple[int, int]]:
+    return [(s, min(s + shard_size, n)) for s in range(0, n, max(1, shard_size))]
+
+
+def _prepare_checkpoints(persist_dir: Path, fingerprint: dict) -> Path:
+    ckpt = Path(persist_dir) / CHECKPOINT_DIR
+    meta = ckpt / "build.json"
+    if ckpt.exists():
+        try:
+            same = json.loads(meta.read_text(encoding="utf-8")) == fingerprint
+        except (OSError, ValueError):
+            same = False
+        if not same:
+            logger.info("Discarding embedding checkpoints from a different build")
+            shutil.rmtree(ckpt)
+    ckpt.mkdir(parents=True, exist_ok=True)
+    write_atomic(meta, json.dumps(fingerprint))
+    return ckpt
+
+
+def encode_sharded(
+    texts: List[str],
+    persist_dir: Path,
+    model,
+    model_name: str,
+    fingerprint: dict,
+    settings: Optional[EmbedBuildSettings] = None,
+) -> np.ndarray:
+    """Encode `texts` shard by shard, reusing finished shards from a previous run.
+
+    Returns the L2-normalized (N, d) float32 matrix and removes the checkpoints;
+    the caller persists it and then calls `mark_done`.
+    `model` is used for in-process encoding; worker processes load `model_name`.
+    """
+    settings = settings or EmbedBuildSettings()
+    persist_dir = Path(persist_dir)
+    fingerprint = {**fingerprint, "model": model_name, "n": len(texts), "shard_size": settings.shard_size}
+    ckpt = _prepare_checkpoints(persist_dir, fingerprint)
+    ranges = _shard_ranges(len(texts), settings.shard_size)
+    paths = [ckpt / f"shard_{s:09d}_{e:09d}.npy" for s, e in ranges]
+    todo = [(r, p) for r, p in zip(ranges, paths) if not p.exists()]
+
+    status = BuildStatus(
+        state="running",
+        total=len(texts),
+        done=sum(e - s for (s, e), p in zip(ranges, paths) if p.exists()),
+        shards_total=len(ranges),
+        shards_done=len(ranges) - len(todo),
+        resumed_shards=len(ranges) - len(todo),
+        workers=settings.workers,
+        started_at=time.time(),
+    )
+    _write_status(persist_dir, status)
+    if status.resumed_shards:
+        logger.info("Resuming embedding build: %d/%d shards already done", status.resumed_shards, len(ranges))
+
+    def _finished(n_rows: int) -> None:
+        status.done += n_rows
+        status.shards_done += 1
+        _write_status(persist_dir, status)
+
+    try:
+        if settings.workers > 1 and todo:
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                max_workers=settings.workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(model_name, settings.threads()),
+            ) as pool:
+                futures = [pool.submit(_encode_shard, texts[s:e], settings.batch_size, str(p)) for (s, e), p in todo]
+                for fut in as_completed(futures):
+                    _finished(fut.result())
+        else:
+            for (s, e), p in todo:
+                _write_shard(model, texts[s:e], settings.batch_size, p)
+                _finished(e - s)
+    except Exception as e:
+        status.state, status.error = "failed", str(e)
+        _write_status(persist_dir, status)
+        raise
+
+    embs = np.concatenate([np.load(p) for p in paths]) if paths else np.zeros((0, 0), dtype=np.float32)
+    shutil.rmtree(ckpt, ignore_errors=True)
+    status.state, status.eta_seconds = "saving", 0.0
+    _write_status(persist_dir, status)
+    return embs
+
+
+def mark_done(persist_dir: Path) -> None:
+    """Record that the encoded matrix has been persisted."""
+    status = read_status(persist_dir)
+    status.state = "done"
+    _write_status(persist_dir, status)
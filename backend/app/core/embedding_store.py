@@ -2,17 +2,38 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 import logging
+import os
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 
+from .embed_build import EmbedBuildSettings, encode_sharded, mark_done
+from .ann import ANN_CONFIG_FILE, ExactIndex, build_ann_index, load_ann_index, save_ann_index
+from .encoder_registry import get_encoder
+from .index_format import append_npy, has_index
+from .query_cache import cached_batch, query_vectors, retrieval_results
+from .vector_store import generation_is_stable, get_document, index_lock, load_passages, read_generation, read_tombstones, writing
+
 try:
 	from sentence_transformers import SentenceTransformer
 except Exception:  # pragma: no cover - optional dependency
 	SentenceTransformer = None  # type: ignore
 
 
+# Stored embedding precision: float32 (default) or float16 to halve disk/page-cache use
+EMB_DTYPE = os.getenv("EMB_DTYPE", "float32")
+EMBEDDINGS_FILE = "embeddings.npy"
+LEGACY_EMBEDDINGS_FILE = "embeddings.joblib"
+
+
+def normalize_rows(mat: np.ndarray) -> np.ndarray:
+	"""L2-normalize each row so cosine similarity becomes a plain dot product."""
+	mat = np.asarray(mat, dtype=np.float32)
+	norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+	return mat / (norms + 1e-12)
+
+
 @dataclass
 class TextRecord:
 	id: str
@@ -21,88 +42,233 @@ class TextRecord:
 
 
 class EmbeddingStore:
-	def __init__(self, persist_dir: Path, model_name: str = "all-MiniLM-L6-v2"):
+	def __init__(self, persist_dir: Path, model_name: str = "all-MiniLM-L6-v2", model=None):
 		self.persist_dir = Path(persist_dir)
 		self.persist_dir.mkdir(parents=True, exist_ok=True)
 		self.model_name = model_name
-		self.model = SentenceTransformer(model_name) if SentenceTransformer is not None else None
-		self.records: List[TextRecord] = []
+		if model is None and SentenceTransformer is not None:
+			# Shared per (model, device) across all stores and requests
+			model = get_encoder(model_name)
+		self.model = model
+		# Lazy over the on-disk doc columns; only result rows are ever read
+		self.records: Sequence[TextRecord] = []
 		self.logger = logging.getLogger("embedding_store")
-		self.embs = None
+		# Unit-norm rows, memory-mapped read-only from embeddings.npy when loaded from disk
+		self.embs: Optional[np.ndarray] = None
+		self.ann = None
+		self.tombstones: set = set()
+		self.generation: Optional[str] = None
 
-	def build(self, force: bool = False) -> int:
-		texts_file = self.persist_dir / "texts.txt"
-		if not texts_file.exists():
-			return 0
-		texts = texts_file.read_text(encoding="utf-8").split("\n\n")
-		# Load docs metadata if present
-		meta_file = self.persist_dir / "docs.json"
-		metas = []
-		if meta_file.exists():
+	def _load_records(self) -> Sequence[TextRecord]:
+		return load_passages(self.persist_dir, read_generation(self.persist_dir), TextRecord)
+
+	def _load_embeddings(self) -> Optional[np.ndarray]:
+		npy = self.persist_dir / EMBEDDINGS_FILE
+		if npy.exists():
+			# mmap: pages are shared between workers through the OS page cache
+			return np.load(npy, mmap_mode="r")
+		legacy = self.persist_dir / LEGACY_EMBEDDINGS_FILE
+		if legacy.exists():
+			import joblib
+
+			self.logger.info("Loading legacy %s; run /embed/ to convert to %s", LEGACY_EMBEDDINGS_FILE, EMBEDDINGS_FILE)
+			return normalize_rows(joblib.load(legacy))
+		return None
+
+	def load(self) -> "EmbeddingStore":
+		self.generation = read_generation(self.persist_dir)
+		self.records = self._load_records()
+		self.embs = self._load_embeddings()
+		self.ann = load_ann_index(self.persist_dir, self.embs) if self.embs is not None else None
+		self.tombstones = set(read_tombstones(self.persist_dir).tolist())
+		return self
+
+	def _ann_config(self, ann: Optional[str], ann_params: Optional[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+		if ann is not None:
+			return ann, dict(ann_params or {})
+		# Keep whatever backend the index was last built with
+		cfg_file = self.persist_dir / ANN_CONFIG_FILE
+		if cfg_file.exists():
 			import json
 
-			metas = json.loads(meta_file.read_text(encoding="utf-8"))
+			cfg = json.loads(cfg_file.read_text(encoding="utf-8"))
+			return cfg["kind"], {**cfg.get("params", {}), **(ann_params or {})}
+		return ExactIndex.kind, dict(ann_params or {})
+
+	def build(
+		self,
+		force: bool = False,
+		ann: Optional[str] = None,
+		ann_params: Optional[Dict[str, Any]] = None,
+		settings: Optional[EmbedBuildSettings] = None,
+	) -> int:
+		"""Embed indexed texts and (re)build the ANN index.
 
-		# Ensure metas length matches texts; fallback to empty meta entries when missing
-		if metas and len(metas) == len(texts):
-			self.records = [TextRecord(id=metas[i].get("id", str(i)), text=texts[i], meta=metas[i].get("meta", {})) for i in range(len(texts))]
-		else:
-			# build default metas for each text
-			self.records = [TextRecord(id=str(i), text=texts[i], meta={}) for i in range(len(texts))]
+		Without `force`, only records past the end of the stored matrix (i.e.
+		chunks appended by incremental ingestion) are encoded and appended.
+		`ann` selects the search backend (see `app.core.ann.BACKENDS`); None keeps the
+		backend recorded in ann.json, defaulting to the exact scan. Switching
+		backends rebuilds the ANN index from the stored vectors without re-encoding.
+		Encoding is sharded and checkpointed (see `app.core.embed_build`); `settings`
+		overrides the EMB_* worker/batch/shard settings. Holds the index lock
+		throughout, so rows cannot change while they are being encoded.
+		"""
+		with index_lock(self.persist_dir):
+			return self._build(force, ann, ann_params, settings)
+
+	def _build(
+		self,
+		force: bool,
+		ann: Optional[str],
+		ann_params: Optional[Dict[str, Any]],
+		settings: Optional[EmbedBuildSettings],
+	) -> int:
+		if not has_index(self.persist_dir):
+			return 0
+		self.records = self._load_records()
 
 		if self.model is None:
 			# Nothing to compute; return count
 			self.logger.info("sentence-transformers not installed; skipping embedding computation")
 			return len(self.records)
 
-		# compute embeddings
-		self.embs = self.model.encode([r.text for r in self.records], convert_to_numpy=True)
+		kind, params = self._ann_config(ann, ann_params)
+		npy = self.persist_dir / EMBEDDINGS_FILE
+		existing = np.load(npy, mmap_mode="r") if npy.exists() and not force else None
+		if existing is not None and existing.shape[0] <= len(self.records):
+			offset = existing.shape[0]
+			pending = self.records[offset:]
+			new = self._encode(pending, offset, settings) if pending else np.zeros((0, existing.shape[1]), dtype=np.float32)
+			if ann is not None or ann_params:
+				self._save(np.concatenate([existing, new.astype(existing.dtype)]), kind, params)
+			else:
+				self._append(new.astype(existing.dtype, copy=False))
+			mark_done(self.persist_dir)
+			self.logger.info("Embedded %d new of %d records", len(new), len(self.records))
+			return len(self.records)
+
+		# compute embeddings, normalized once here so search is a single dot product
+		embs = self._encode(self.records, 0, settings)
 		self.logger.info("Computed embeddings for %d records", len(self.records))
 		# persist
-		import joblib
-
-		joblib.dump(self.embs, self.persist_dir / "embeddings.joblib")
+		self._save(embs.astype(EMB_DTYPE, copy=False), kind, params)
+		mark_done(self.persist_dir)
 		return len(self.records)
 
-	def search(self, q: str, k: int = 5) -> List[Tuple[TextRecord, float]]:
+	def _encode(self, records: List[TextRecord], offset: int, settings: Optional[EmbedBuildSettings] = None) -> np.ndarray:
+		# Checkpoints are only valid for the same texts, i.e. the same index generation and offset
+		fingerprint = {"generation": read_generation(self.persist_dir), "offset": offset}
+		return encode_sharded([r.text for r in records], self.persist_dir, self.model, self.model_name, fingerprint, settings)
+
+	def _append(self, new: np.ndarray) -> None:
+		if not len(new):
+			return
+		if self.ann is None:
+			self.load()
+		with writing(self.persist_dir) as gen:
+			append_npy(self.persist_dir / EMBEDDINGS_FILE, new)
+			self.embs = np.load(self.persist_dir / EMBEDDINGS_FILE, mmap_mode="r")
+			self.ann.add(new, self.embs)
+			save_ann_index(self.ann, self.persist_dir)
+		self.generation = gen[0]
+
+	def compact(self, row_map: np.ndarray, within_write: bool = False) -> None:
+		"""Drop embeddings of rows that `TfidfStore.compact` removed (-1 in `row_map`).
+
+		Set `within_write` when called inside the caller's `writing()` bracket
+		(as `TfidfStore.compact`'s `before_commit`), so the filtered vectors are
+		published in the same generation as the compacted rows.
+		"""
+		npy = self.persist_dir / EMBEDDINGS_FILE
+		with index_lock(self.persist_dir):
+			if not npy.exists():
+				return
+			embs = np.load(npy, mmap_mode="r")
+			n = min(len(embs), len(row_map))
+			keep = np.asarray(embs[:n][row_map[:n] >= 0])
+			kind, params = self._ann_config(None, None)
+			if within_write:
+				self._commit(*self._stage(keep, kind, params))
+			else:
+				self._save(keep, kind, params)
+
+	def _stage(self, embs: np.ndarray, ann: str, ann_params: Optional[Dict[str, Any]]) -> Tuple[Any, str]:
+		# Build the ANN index before touching the live files so a failure leaves them intact
+		index = build_ann_index(ann, embs, **(ann_params or {}))
+		tmp = self.persist_dir / (EMBEDDINGS_FILE + ".tmp")
+		with open(tmp, "wb") as fh:
+			np.save(fh, embs)
+		return index, ann
+
+	def _commit(self, index, ann: str) -> None:
+		# Caller holds the generation bracket
+		os.replace(self.persist_dir / (EMBEDDINGS_FILE + ".tmp"), self.persist_dir / EMBEDDINGS_FILE)
+		save_ann_index(index, self.persist_dir)
+		self.embs = np.load(self.persist_dir / EMBEDDINGS_FILE, mmap_mode="r")
+		self.ann = index if ann != ExactIndex.kind else ExactIndex.load(self.persist_dir, {}, self.embs)
+
+	def _save(self, embs: np.ndarray, ann: str = ExactIndex.kind, ann_params: Optional[Dict[str, Any]] = None) -> None:
+		index, ann = self._stage(embs, ann, ann_params)
+		with writing(self.persist_dir) as gen:
+			self._commit(index, ann)
+		self.generation = gen[0]
+
+	def search(self, q: str, k: int = 5, **search_params) -> List[Tuple[TextRecord, float]]:
+		"""Return the k nearest records to `q`.
+
+		`search_params` are passed to the ANN backend, e.g. `ef` for hnsw or
+		`nprobe` for ivfpq; the exact backend ignores them.
+		"""
+		return self.search_batch([q], k=k, **search_params)[0]
+
+	def search_batch(self, qs: List[str], k: int = 5, include_text: bool = True, **search_params) -> List[List[Tuple[TextRecord, float]]]:
+		"""Like `search` for many questions: one encode call and one matrix product.
+
+		With `include_text=False` the returned records have an empty text, which is never read.
+		"""
+		rows = self.search_rows(qs, k, **search_params)
+		return [[(get_document(self.records, i, include_text), s) for i, s in hits] for hits in rows]
+
+	def search_rows(self, qs: List[str], k: int = 5, **search_params) -> List[List[Tuple[int, float]]]:
+		"""Like `search_batch` but returns (row, score) pairs; row i is row i of the TF-IDF index."""
 		if self.embs is None:
 			# try to load
-			import joblib
-
-			if (self.persist_dir / "embeddings.joblib").exists():
-				self.embs = joblib.load(self.persist_dir / "embeddings.joblib")
+			self.load()
 		# Ensure records are loaded (texts/docs may be present even if embeddings were loaded earlier)
 		if not self.records:
-			# try to reconstruct records from docs/texts
-			texts_file = self.persist_dir / "texts.txt"
-			meta_file = self.persist_dir / "docs.json"
-			if texts_file.exists():
-				texts = texts_file.read_text(encoding="utf-8").split("\n\n")
-			else:
-				texts = []
-			metas = []
-			if meta_file.exists():
-				import json
-
-				metas = json.loads(meta_file.read_text(encoding="utf-8"))
-			if metas and len(metas) == len(texts):
-				self.records = [TextRecord(id=metas[i].get("id", str(i)), text=texts[i], meta=metas[i].get("meta", {})) for i in range(len(texts))]
-			else:
-				self.records = [TextRecord(id=str(i), text=texts[i], meta={}) for i in range(len(texts))]
+			self.records = self._load_records()
 
 		if self.model is None:
 			raise RuntimeError("sentence-transformers not installed; install to use embedding features")
-		q_emb = self.model.encode([q], convert_to_numpy=True)[0]
 		# guard against mismatch in lengths between embeddings and records
 		if self.embs is None or len(self.records) == 0:
 			self.logger.info("No embeddings or records found; returning empty list from search")
+			return [[] for _ in qs]
+		if not qs:
 			return []
+		cacheable = self.generation is not None and generation_is_stable(self.generation)
+		prefix = ("embedding", str(self.persist_dir), self.generation, k, tuple(sorted(search_params.items())))
+		keys = [prefix + (q,) if cacheable else None for q in qs]
+		return cached_batch(retrieval_results, keys, lambda missing: self._search_vectors(self.encode_queries([qs[i] for i in missing]), k, search_params))
+
+	def encode_queries(self, qs: List[str]) -> np.ndarray:
+		"""Normalized query embeddings; only questions not in the vector cache are encoded."""
+		rows = cached_batch(
+			query_vectors,
+			[(self.model_name, q) for q in qs],
+			lambda missing: list(normalize_rows(self.model.encode([qs[i] for i in missing], convert_to_numpy=True))),
+		)
+		return np.stack(rows)
+
+	def _search_vectors(self, q_embs: np.ndarray, k: int, search_params: Dict[str, Any]) -> List[List[Tuple[int, float]]]:
 		# If embeddings length mismatches records, trim/pad safely
 		n_emb = self.embs.shape[0]
 		n_rec = len(self.records)
 		n = min(n_emb, n_rec)
-		emb_matrix = self.embs[:n]
-		sims = (emb_matrix @ q_emb) / (np.linalg.norm(emb_matrix, axis=1) * np.linalg.norm(q_emb) + 1e-12)
-		idx = sims.argsort()[::-1][:k]
-		return [(self.records[i], float(sims[j])) for j, i in enumerate(idx)]
-
+		# Over-fetch by the number of orphan/deleted rows so filtering still leaves k hits
+		dead = self.tombstones
+		scores, ids = self.ann.search(q_embs, k + (n_emb - n) + len(dead), **search_params)
+		return [
+			[(int(i), float(s)) for i, s in zip(row_ids, row_scores) if 0 <= i < n and i not in dead][:k]
+			for row_ids, row_scores in zip(ids, scores)
+		]
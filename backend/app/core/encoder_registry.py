@@ -0,0 +1,135 @@
+"""Process-wide registry of SentenceTransformer encoders.
+
+`EmbeddingStore(...)` used to construct a fresh SentenceTransformer (loading
+the weights from disk) every time. Encoders are now loaded once per
+(model name, device) and shared by every store and request.
+
+Each shared encoder runs its `encode` calls on one dedicated thread. That
+makes concurrent calls safe (they are serialized rather than interleaved in
+the same module), caps the batch size of every call, and lets the thread set
+its own torch intra-op thread count once, so encoding and LLM generation can
+be sized to not oversubscribe the cores.
+
+Settings (env):
+- EMB_DEVICE: device for encoders (default: sentence-transformers' choice)
+- EMB_MAX_BATCH_SIZE: upper bound on `encode` batch size (default 64)
+- EMB_ENCODER_THREADS: torch threads for the encoder thread (default 0 = torch default)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from .quant import quantize_encoder
+
+try:
+    from sentence_transformers import SentenceTransformer
+except Exception:  # pragma: no cover - optional dependency
+    SentenceTransformer = None  # type: ignore
+
+logger = logging.getLogger("encoder_registry")
+
+ENCODER_DEVICE = os.getenv("EMB_DEVICE") or None
+MAX_BATCH_SIZE = int(os.getenv("EMB_MAX_BATCH_SIZE", "64"))
+ENCODER_THREADS = int(os.getenv("EMB_ENCODER_THREADS", "0"))
+
+
+def _pin_threads(threads: int) -> None:
+    if threads <= 0:
+        return
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except Exception:  # pragma: no cover - torch is optional
+        pass
+
+
+class SharedEncoder:
+    """Thread-safe wrapper exposing the `encode` subset of a SentenceTransformer."""
+
+    def __init__(self, model, name: str, max_batch_size: int = MAX_BATCH_SIZE, threads: int = ENCODER_THREADS):
+        self.model = model
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self._pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"encoder-{name}", initializer=_pin_threads, initargs=(threads,)
+        )
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.texts = 0
+        self.seconds = 0.0
+
+    @property
+    def device(self):
+        return getattr(self.model, "device", "cpu")
+
+    def _encode(self, texts, batch_size: int, **kwargs):
+        start = time.perf_counter()
+        out = self.model.encode(texts, batch_size=batch_size, **kwargs)
+        with self._stats_lock:
+            self.calls += 1
+            self.texts += len(texts)
+            self.seconds += time.perf_counter() - start
+        return out
+
+    def encode(self, texts: Sequence[str], batch_size: Optional[int] = None, **kwargs):
+        batch_size = min(batch_size or self.max_batch_size, self.max_batch_size)
+        return self._pool.submit(self._encode, list(texts), batch_size, **kwargs).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "device": str(self.device),
+                "max_batch_size": self.max_batch_size,
+                "calls": self.calls,
+                "texts": self.texts,
+                "texts_per_second": round(self.texts / self.seconds, 1) if self.seconds else 0.0,
+            }
+
+
+def _load_sentence_transformer(name: str, device: Optional[str]):
+    if SentenceTransformer is None:
+        raise RuntimeError("sentence-transformers not installed; install to use embedding features")
+    # EMB_QUANT (defaults to LLM_QUANT) selects int8/bf16 weights for the encoder
+    return quantize_encoder(SentenceTransformer(name, device=device))
+
+
+class EncoderRegistry:
+    def __init__(self, loader: Callable[[str, Optional[str]], Any] = _load_sentence_transformer):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._encoders: Dict[Tuple[str, str], SharedEncoder] = {}
+
+    def get(self, name: str, device: Optional[str] = ENCODER_DEVICE) -> SharedEncoder:
+        key = (name, device or "auto")
+        encoder = self._encoders.get(key)
+        if encoder is not None:
+            return encoder
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        # Only one thread loads a given encoder; the rest wait and reuse it
+        with load_lock:
+            encoder = self._encoders.get(key)
+            if encoder is None:
+                start = time.perf_counter()
+                encoder = SharedEncoder(self._loader(name, device), name)
+                self._encoders[key] = encoder
+                logger.info("Loaded encoder %s on %s in %.1fs", name, encoder.device, time.perf_counter() - start)
+            return encoder
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {f"{name}@{device}": enc.stats() for (name, device), enc in list(self._encoders.items())}
+
+
+registry = EncoderRegistry()
+
+
+def get_encoder(name: str, device: Optional[str] = ENCODER_DEVICE) -> SharedEncoder:
+    return registry.get(name, device)
@@ -0,0 +1,113 @@
+"""Bounded worker pools for blocking work called from async handlers.
+
+Generation and retrieval run on separate pools so a cheap `/query/` never waits
+behind a long generation, and each pool caps both its concurrency and the
+number of tasks allowed to wait. When a pool is full, `submit` raises
+`Overloaded` immediately instead of queueing without limit; `main.py` turns
+that into a 503 with a `Retry-After` estimate.
+
+Settings (env):
+- LLM_CONCURRENCY / LLM_QUEUE_SIZE: generation workers / waiting slots (1 / 8)
+- RETRIEVAL_CONCURRENCY / RETRIEVAL_QUEUE_SIZE: retrieval workers / waiting slots (4 / 64)
+- MAX_BATCH_QUESTIONS: most questions accepted by one batch request (default 10000)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Upper bound on `questions` in batch requests; scoring is chunked, but results still scale with it
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", "10000"))
+
+
+class Overloaded(Exception):
+    """Raised when a pool has no free worker or queue slot.
+
+    Deliberately not a RuntimeError: routers map RuntimeError to a 500.
+    """
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"{pool} pool is at capacity; retry in ~{retry_after}s")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+        # Exponentially weighted mean task duration, used for the Retry-After hint
+        self._avg_seconds = 1.0
+
+    def retry_after(self) -> int:
+        with self._lock:
+            backlog = self._in_flight / self.max_workers
+            return max(1, math.ceil(backlog * self._avg_seconds))
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise Overloaded(self.name, self.retry_after())
+        with self._lock:
+            self._in_flight += 1
+
+        def _run():
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._in_flight -= 1
+                    self._completed += 1
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+                self._slots.release()
+
+        try:
+            return self._pool.submit(_run)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            raise
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Await `fn(*args, **kwargs)` on this pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queue_size": self.max_queue,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_seconds": round(self._avg_seconds, 4),
+            }
+
+
+inference_executor = BoundedExecutor(
+    "inference",
+    max_workers=int(os.getenv("LLM_CONCURRENCY", "1")),
+    max_queue=int(os.getenv("LLM_QUEUE_SIZE", "8")),
+)
+retrieval_executor = BoundedExecutor(
+    "retrieval",
+    max_workers=int(os.getenv("RETRIEVAL_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("RETRIEVAL_QUEUE_SIZE", "64")),
+)
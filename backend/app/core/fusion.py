@@ -0,0 +1,89 @@
+"""Rank fusion for hybrid retrieval.
+
+Each backend returns (row, score) candidates, where `row` is the document's
+row in the index. Both stores are built over the same stored passages, so
+the row is a stable shared document id, unlike `Document.id` (chunk ids are
+not unique across re-ingested versions of a file, and legacy indexes without
+metadata fall back to positional ids).
+
+Two fusion methods:
+- `rrf`: reciprocal rank fusion, sum over backends of w / (rrf_k + rank).
+  Uses only ranks, so cosine scores on different scales don't matter;
+- `weighted`: scores min-max normalized per backend and query, then a
+  weighted sum (missing = 0).
+
+Settings (env):
+- HYBRID_FUSION: `rrf` (default) or `weighted`
+- HYBRID_DEPTH: candidates pulled from each backend before fusing (default 50)
+- HYBRID_RRF_K: RRF rank constant (default 60)
+- HYBRID_TFIDF_WEIGHT: lexical (TF-IDF or BM25) weight; embeddings get 1 - weight
+  (default 0.5)
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+FUSION_METHODS = ("rrf", "weighted")
+FUSION_METHOD = os.getenv("HYBRID_FUSION", "rrf")
+FUSION_DEPTH = int(os.getenv("HYBRID_DEPTH", "50"))
+RRF_K = float(os.getenv("HYBRID_RRF_K", "60"))
+TFIDF_WEIGHT = float(os.getenv("HYBRID_TFIDF_WEIGHT", "0.5"))
+
+Candidates = Sequence[Tuple[int, float]]
+
+
+def default_weights(tfidf_weight: Optional[float] = None) -> Dict[str, float]:
+    w = TFIDF_WEIGHT if tfidf_weight is None else tfidf_weight
+    # The weight applies to whichever lexical backend (TF-IDF or BM25) produced candidates
+    return {"tfidf": w, "bm25": w, "embedding": 1.0 - w}
+
+
+def rrf(rankings: Dict[str, Candidates], weights: Dict[str, float], rrf_k: float = RRF_K) -> Dict[int, float]:
+    fused: Dict[int, float] = {}
+    for backend, cands in rankings.items():
+        w = weights.get(backend, 1.0)
+        for rank, (row, _) in enumerate(cands, start=1):
+            fused[row] = fused.get(row, 0.0) + w / (rrf_k + rank)
+    return fused
+
+
+def weighted(rankings: Dict[str, Candidates], weights: Dict[str, float]) -> Dict[int, float]:
+    fused: Dict[int, float] = {}
+    for backend, cands in rankings.items():
+        if not cands:
+            continue
+        w = weights.get(backend, 1.0)
+        scores = [s for _, s in cands]
+        lo, hi = min(scores), max(scores)
+        span = hi - lo
+        for row, s in cands:
+            # A single candidate (or all tied) counts as a full match for that backend
+            norm = (s - lo) / span if span > 0 else 1.0
+            fused[row] = fused.get(row, 0.0) + w * norm
+    return fused
+
+
+def fuse(
+    rankings: Dict[str, Candidates],
+    k: int,
+    method: str = FUSION_METHOD,
+    weights: Optional[Dict[str, float]] = None,
+    rrf_k: float = RRF_K,
+) -> List[Tuple[int, float, Dict[str, int]]]:
+    """Fuse per-backend candidate lists into the top `k` (row, score, {backend: rank})."""
+    weights = weights or default_weights()
+    if method == "rrf":
+        fused = rrf(rankings, weights, rrf_k)
+    elif method == "weighted":
+        fused = weighted(rankings, weights)
+    else:
+        raise ValueError(f"Unknown fusion method {method!r}; expected one of {', '.join(FUSION_METHODS)}")
+    ranks = {backend: {row: r for r, (row, _) in enumerate(cands, start=1)} for backend, cands in rankings.items()}
+    # Ties broken by row so results are deterministic
+    top = sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:k]
+    return [
+        (row, score, {backend: r[row] for backend, r in ranks.items() if row in r})
+        for row, score in top
+    ]
@@ -1,9 +1,17 @@
+"""Hybrid lexical (TF-IDF or BM25) + embedding retrieval with rank fusion (see fusion.py)."""
+
 from __future__ import annotations
 
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from .vector_store import TfidfStore, Document
+from .vector_store import Document, get_document
+from .fusion import FUSION_DEPTH, FUSION_METHOD, RRF_K, default_weights, fuse
+from .bm25 import LEXICAL_BACKEND, LEXICAL_BACKENDS
+from .index_registry import get_embedding_store, get_lexical_store, get_tfidf_store
+from .scatter_gather import ScatterGather, coordinator
 
 try:
 	from .embedding_store import EmbeddingStore, TextRecord
@@ -11,41 +19,130 @@ except Exception:
 	EmbeddingStore = None  # type: ignore
 
 
+def warm(persist_dir: Path, qs: List[str], ks: List[int], lexical: Optional[str] = None, embeddings: bool = True) -> None:
+	"""Fill the retrieval-result cache under the keys later requests look up for `qs`.
+
+	`/generate/` reads TF-IDF and `/query/` the lexical backend at each k;
+	`/hybrid/` reads both backends at the fusion depth `max(HYBRID_DEPTH, k)`
+	with default ANN settings.
+	"""
+	lex = get_lexical_store(persist_dir, lexical)
+	tf = get_tfidf_store(persist_dir)
+	emb = get_embedding_store(persist_dir) if embeddings and EmbeddingStore is not None else None
+	for k in ks:
+		tf.search_rows(qs, k=k)
+		lex.search_rows(qs, k=k)
+	for depth in sorted({max(FUSION_DEPTH, k) for k in ks}):
+		lex.search_rows(qs, k=depth)
+		if emb is not None and emb.model is not None:
+			emb.search_rows(qs, k=depth)
+
+
+@dataclass
+class FusedHit:
+	doc: Document
+	score: float
+	# 1-based rank of this document in each backend's candidate list
+	ranks: Dict[str, int] = field(default_factory=dict)
+
+
 class HybridRetriever:
-	def __init__(self, persist_dir: Path):
+	def __init__(self, persist_dir: Path, remote: Optional[ScatterGather] = None, lexical: Optional[str] = None):
 		self.persist_dir = Path(persist_dir)
-		self.tf = TfidfStore(persist_dir)
-		self.emb = EmbeddingStore(persist_dir) if EmbeddingStore is not None else None
-
-	def query(self, q: str, k: int = 5) -> List[Tuple[Document, float]]:
-		# Get TF-IDF results
-		tf_res = self.tf.query(q, k=k)
-		# Try embeddings if available and merge scores by simple average where ids match
-		if self.emb is None:
-			return tf_res
-
-		try:
-			emb_res = self.emb.search(q, k=k)
-		except Exception:
-			# any embedding error -> fallback to TF-IDF-only results
-			return tf_res
-
-		# Map by id
-		combined = {}
-		for d, s in tf_res:
-			combined[d.id] = (d, float(s), 1)
-		for r, s in emb_res:
-			# r is TextRecord - try to match by id
-			rid = r.id
-			if rid in combined:
-				d, s0, cnt = combined[rid]
-				combined[rid] = (d, (s0 + float(s)) / (cnt + 1), cnt + 1)
-			else:
-				# create a Document-like wrapper
-				d = Document(id=r.id, text=r.text, meta=r.meta)
-				combined[rid] = (d, float(s), 1)
+		# "tfidf" or "bm25"; also the name of its candidate list in rankings and `ranks`
+		self.lexical = lexical or LEXICAL_BACKEND
+		if self.lexical not in LEXICAL_BACKENDS:
+			raise ValueError(f"Unknown lexical backend {self.lexical!r}; expected one of {', '.join(LEXICAL_BACKENDS)}")
+		# Coordinator mode (SHARD_URLS): candidates come from remote shards, not local stores
+		self.remote = remote if remote is not None else coordinator()
+		self.tf = get_lexical_store(persist_dir, self.lexical) if self.remote is None else None
+		self.emb = get_embedding_store(persist_dir) if EmbeddingStore is not None and self.remote is None else None
+		# Milliseconds spent per backend and in fusion by the last search on this instance
+		self.timings: Dict[str, float] = {}
+		# True when the last search left out shards that failed or timed out
+		self.partial = False
+
+	def query(self, q: str, k: int = 5, **search_params) -> List[Tuple[Document, float]]:
+		return self.query_batch([q], k=k, **search_params)[0]
 
-		# Return top-k by score
-		items = sorted(combined.values(), key=lambda x: x[1], reverse=True)[:k]
-		return [(d, score) for d, score, _ in items]
+	def query_batch(self, qs: List[str], k: int = 5, **search_params) -> List[List[Tuple[Document, float]]]:
+		return [[(h.doc, h.score) for h in hits] for hits in self.search(qs, k=k, **search_params)]
 
+	def search(
+		self,
+		qs: List[str],
+		k: int = 5,
+		method: str = FUSION_METHOD,
+		depth: Optional[int] = None,
+		tfidf_weight: Optional[float] = None,
+		rrf_k: float = RRF_K,
+		include_text: bool = True,
+		**search_params,
+	) -> List[List[FusedHit]]:
+		"""Pull `depth` candidates per backend and fuse them into the top `k` per question.
+
+		`search_params` go to the ANN backend (e.g. `ef`, `nprobe`). Falls back to
+		lexical candidates alone when embeddings are unavailable. Candidates are
+		fused by row; only the final top-k passages are read, and without
+		`include_text` their text is left empty.
+		"""
+		depth = max(depth or FUSION_DEPTH, k)
+		self.timings = {}
+		self.partial = False
+		if self.remote is not None:
+			rankings, refs = self._remote_rankings(qs, depth, search_params)
+		else:
+			rankings = self._local_rankings(qs, depth, search_params)
+
+		start = time.perf_counter()
+		weights = default_weights(tfidf_weight)
+		fused = [fuse(ranking, k=k, method=method, weights=weights, rrf_k=rrf_k) for ranking in rankings]
+		self.timings["fusion_ms"] = (time.perf_counter() - start) * 1000
+
+		rows = {row for hits in fused for row, _, _ in hits}
+		if self.remote is not None:
+			start = time.perf_counter()
+			docs = self._remote_docs(rows, refs, include_text)
+			self.timings["passages_ms"] = (time.perf_counter() - start) * 1000
+		else:
+			# Rows past the lexical docs (embeddings ahead of the text index) cannot be resolved
+			n_docs = len(self.tf.docs)
+			docs = {row: get_document(self.tf.docs, row, include_text) for row in rows if row < n_docs}
+		self.timings = {name: round(ms, 3) for name, ms in self.timings.items()}
+		return [[FusedHit(docs[row], score, ranks) for row, score, ranks in hits if row in docs] for hits in fused]
+
+	def _local_rankings(self, qs: List[str], depth: int, search_params) -> List[Dict[str, list]]:
+		start = time.perf_counter()
+		rankings: List[Dict[str, list]] = [{self.lexical: rows} for rows in self.tf.search_rows(qs, k=depth)]
+		self.timings[f"{self.lexical}_ms"] = (time.perf_counter() - start) * 1000
+
+		if self.emb is not None:
+			start = time.perf_counter()
+			try:
+				for ranking, rows in zip(rankings, self.emb.search_rows(qs, k=depth, **search_params)):
+					ranking["embedding"] = rows
+			except Exception:
+				# any embedding error -> fuse lexical candidates only
+				pass
+			self.timings["embedding_ms"] = (time.perf_counter() - start) * 1000
+		return rankings
+
+	def _remote_rankings(self, qs: List[str], depth: int, search_params):
+		start = time.perf_counter()
+		rankings, refs, gathered = self.remote.search(qs, depth, backends=(self.lexical, "embedding"), **search_params)
+		self.partial = gathered.partial
+		self.timings["scatter_ms"] = (time.perf_counter() - start) * 1000
+		return rankings, refs
+
+	def _remote_docs(self, rows, refs, include_text: bool) -> Dict[int, Document]:
+		texts = self.remote.passages(sorted(rows)) if include_text and rows else {}
+		docs = {}
+		for row in rows:
+			if row in texts:
+				doc_id, text, meta = texts[row]
+			else:
+				# Text not requested, or its shard failed: the reference is still useful
+				(doc_id, meta), text = refs[row], ""
+				self.partial = self.partial or include_text
+			docs[row] = Document(id=doc_id, text=text, meta=meta)
+		return docs
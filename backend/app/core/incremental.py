@@ -0,0 +1,194 @@
+"""Incremental ingestion: only re-index source files whose content changed.
+
+A manifest (`sources.json` in the index dir) records, per source file, its
+SHA-256 and the index rows its chunks occupy. On each sync:
+
+- new files are chunked and appended (`TfidfStore.update`), transformed with
+  the already-fitted vectorizer instead of refitting it;
+- changed files have their old rows tombstoned and their new chunks appended;
+- deleted files have their rows tombstoned;
+- if embeddings exist, only the appended rows are encoded and appended.
+
+Appended rows use the vocabulary/idf from the last fit and tombstoned rows
+still occupy space, so once they exceed `INDEX_COMPACT_RATIO` of the index the
+sync compacts: the vectorizer is refitted over the live rows and the stored
+embeddings are filtered (not re-encoded).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .chunking import CHUNK_OVERLAP, CHUNK_SIZE, chunk_file
+from .context_packer import token_counter_name
+from .embedding_store import EMBEDDINGS_FILE, EmbeddingStore
+from .index_format import has_index
+from .vector_store import Document, TfidfStore, index_lock, write_atomic
+
+logger = logging.getLogger("incremental")
+
+MANIFEST_FILE = "sources.json"
+# Compact once stale (appended since fit + tombstoned) rows exceed this share of the index
+COMPACT_RATIO = float(os.getenv("INDEX_COMPACT_RATIO", "0.3"))
+
+
+@dataclass
+class SyncResult:
+    chunks: int
+    added_files: int
+    changed_files: int
+    removed_files: int
+    unchanged_files: int
+    new_chunks: int
+    compacted: bool
+    rebuilt: bool
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(persist_dir: Path) -> Optional[dict]:
+    path = Path(persist_dir) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save_manifest(persist_dir: Path, manifest: dict) -> None:
+    write_atomic(Path(persist_dir) / MANIFEST_FILE, json.dumps(manifest, ensure_ascii=False))
+
+
+def _drop_embeddings(persist_dir: Path) -> None:
+    """Remove stored vectors after a full rebuild renumbered every row."""
+    for p in Path(persist_dir).glob("ann*"):
+        p.unlink()
+    npy = Path(persist_dir) / EMBEDDINGS_FILE
+    if npy.exists():
+        npy.unlink()
+
+
+def _full_rebuild(persist_dir: Path, files: List[Path], hashes: Dict[str, str], chunking: dict) -> SyncResult:
+    sources: Dict[str, dict] = {}
+
+    def chunks() -> Iterator[Document]:
+        row = 0
+        for p in files:
+            rows = []
+            for doc in chunk_file(p, chunk_size=chunking["chunk_size"], overlap=chunking["overlap"]):
+                rows.append(row)
+                row += 1
+                yield doc
+            sources[p.name] = {"sha256": hashes[p.name], "rows": rows}
+
+    # Every row is renumbered: the old vectors go in the same generation bracket as the new index
+    n = TfidfStore(persist_dir).build_streaming(chunks(), before_commit=lambda: _drop_embeddings(persist_dir))
+    if n:
+        _save_manifest(persist_dir, {"fitted_rows": n, "chunking": chunking, "sources": sources})
+    return SyncResult(
+        chunks=n, added_files=len(files), changed_files=0, removed_files=0, unchanged_files=0,
+        new_chunks=n, compacted=False, rebuilt=True,
+    )
+
+
+def sync_index(
+    data_dir: Path,
+    persist_dir: Path,
+    pattern: str = "*.txt",
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+    rebuild: bool = False,
+    encoder=None,
+) -> SyncResult:
+    """Bring the index in `persist_dir` in line with the files in `data_dir`.
+
+    Falls back to a full rebuild when `rebuild` is set, no manifest exists or
+    the chunking parameters or token counter differ from the ones the index was
+    built with.
+    `encoder` is the SentenceTransformer used for appending embeddings; it is
+    only needed when the index already has embeddings.
+    Holds the index lock throughout, so concurrent syncs (and embedding builds)
+    in any worker run one after the other against the latest manifest.
+    """
+    data_dir, persist_dir = Path(data_dir), Path(persist_dir)
+    files = sorted(data_dir.glob(pattern))
+    hashes = {p.name: file_sha256(p) for p in files}
+    with index_lock(persist_dir):
+        return _sync(persist_dir, files, hashes, chunk_size, overlap, rebuild, encoder)
+
+
+def _sync(
+    persist_dir: Path,
+    files: List[Path],
+    hashes: Dict[str, str],
+    chunk_size: int,
+    overlap: int,
+    rebuild: bool,
+    encoder,
+) -> SyncResult:
+    manifest = load_manifest(persist_dir)
+    # Stored per-chunk token counts are only valid for the tokenizer that produced them
+    chunking = {"chunk_size": chunk_size, "overlap": overlap, "tokenizer": token_counter_name()}
+    if rebuild or manifest is None or manifest.get("chunking") != chunking or not has_index(persist_dir):
+        return _full_rebuild(persist_dir, files, hashes, chunking)
+
+    sources: Dict[str, dict] = manifest["sources"]
+    removed = [name for name in sources if name not in hashes]
+    changed = [p for p in files if p.name in sources and sources[p.name]["sha256"] != hashes[p.name]]
+    added = [p for p in files if p.name not in sources]
+    unchanged = len(files) - len(changed) - len(added)
+
+    remove_rows = [r for name in removed for r in sources[name]["rows"]]
+    remove_rows += [r for p in changed for r in sources[p.name]["rows"]]
+    new_docs: List[Document] = []
+    spans = []
+    for p in changed + added:
+        start = len(new_docs)
+        new_docs.extend(chunk_file(p, chunk_size=chunk_size, overlap=overlap))
+        spans.append((p.name, start, len(new_docs)))
+
+    store = TfidfStore(persist_dir)
+    compacted = False
+    if new_docs or remove_rows:
+        rows = store.update(add=new_docs, remove_rows=remove_rows)
+        for name in removed:
+            del sources[name]
+        for name, start, end in spans:
+            sources[name] = {"sha256": hashes[name], "rows": rows[start:end]}
+
+        if (persist_dir / EMBEDDINGS_FILE).exists() and new_docs:
+            if encoder is None:
+                logger.warning("Index has embeddings but no encoder was given; run /embed/ to embed %d new chunks", len(new_docs))
+            else:
+                EmbeddingStore(persist_dir, model=encoder).build()
+
+        total = store.matrix.shape[0]
+        stale = (total - manifest.get("fitted_rows", total)) + len(store.tombstones)
+        if total and stale / total > COMPACT_RATIO:
+            # Stored vectors are filtered in the same generation bracket that publishes the renumbered rows
+            row_map = store.compact(
+                before_commit=lambda row_map: EmbeddingStore(persist_dir, model=encoder).compact(row_map, within_write=True)
+            )
+            for entry in sources.values():
+                entry["rows"] = [int(row_map[r]) for r in entry["rows"]]
+            manifest["fitted_rows"] = int((row_map >= 0).sum())
+            compacted = True
+            logger.info("Compacted index: %d stale of %d rows", stale, total)
+        manifest["sources"] = sources
+        _save_manifest(persist_dir, manifest)
+
+    chunks = sum(len(e["rows"]) for e in sources.values())
+    return SyncResult(
+        chunks=chunks, added_files=len(added), changed_files=len(changed), removed_files=len(removed),
+        unchanged_files=unchanged, new_chunks=len(new_docs), compacted=compacted, rebuilt=False,
+    )
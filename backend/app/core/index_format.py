@@ -0,0 +1,284 @@
+"""Versioned binary on-disk format for the TF-IDF index.
+
+The original layout (`texts.txt` split on blank lines, a pretty-printed
+`docs.json` and pickled `vectorizer.joblib`/`matrix.joblib`) corrupted any
+document containing a blank line, had to be parsed whole on every load and
+tied the index to the exact sklearn version that pickled it. Version 1 is:
+
+- `format.json`: format version and the vectorizer settings; written last, so
+  its presence marks a complete index
+- `texts.bin` + `texts.idx.npy`: UTF-8 passages back to back, and int64 byte
+  offsets (n + 1) so passage i is `bin[idx[i]:idx[i + 1]]`
+- `ids.bin` + `ids.idx.npy`, `meta.bin` + `meta.idx.npy`: document ids and
+  compact JSON metadata, one column each in the same layout
+- `vocab.bin` + `vocab.idx.npy`, `idf.npy`: vectorizer terms in column order
+  and their idf weights
+- `matrix.data.npy`, `matrix.indices.npy`, `matrix.indptr.npy`: the raw CSR arrays
+
+Everything is plain bytes or `.npy` and is opened with mmap, so a cold start
+reads a few headers and pages the rest in on demand (shared between workers
+through the OS page cache). Appends write the data first and extend the
+offset arrays last (see `append_npy`), so a concurrent reader never sees an
+offset past the data.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+
+FORMAT_VERSION = 1
+FORMAT_FILE = "format.json"
+TMP_SUFFIX = ".tmp"
+DOC_COLUMNS = ("texts", "ids", "meta")
+MATRIX_ARRAYS = ("data", "indices", "indptr")
+# Everything but FORMAT_FILE, which `commit` writes after these are in place
+DATA_FILES = tuple(
+    [f"{col}{ext}" for col in DOC_COLUMNS + ("vocab",) for ext in (".bin", ".idx.npy")]
+    + ["idf.npy"]
+    + [f"matrix.{name}.npy" for name in MATRIX_ARRAYS]
+)
+LEGACY_FILES = ("docs.json", "texts.txt", "vectorizer.joblib", "matrix.joblib")
+# TfidfVectorizer settings needed to rebuild it around the stored vocabulary/idf
+VECTORIZER_PARAMS = ("lowercase", "stop_words", "ngram_range", "norm", "use_idf", "smooth_idf", "sublinear_tf")
+
+
+def append_npy(path: Path, rows: np.ndarray) -> None:
+    """Append rows to a C-order .npy file in place.
+
+    The data is written first and the header's shape patched afterwards, so a
+    reader never sees a shape larger than the data on disk. Falls back to a full
+    rewrite when the new header would not fit in the existing header's padding.
+    """
+    with open(path, "r+b") as fh:
+        version = np.lib.format.read_magic(fh)
+        if version != (1, 0):
+            header_fits = False
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+            data_start = fh.tell()
+            new_shape = (shape[0] + len(rows),) + tuple(shape[1:])
+            header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": fortran, "shape": new_shape})
+            header_len = data_start - 10  # magic (6) + version (2) + uint16 length (2)
+            header_fits = not fortran and len(header) + 1 <= header_len
+        if header_fits:
+            fh.seek(0, os.SEEK_END)
+            fh.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+            fh.flush()
+            fh.seek(10)
+            fh.write(header.ljust(header_len - 1).encode("latin1") + b"\n")
+            return
+    old = np.load(path, mmap_mode="r")
+    tmp = path.with_name(path.name + TMP_SUFFIX)
+    with open(tmp, "wb") as out:
+        np.save(out, np.concatenate([old, np.asarray(rows).astype(old.dtype, copy=False)]))
+    del old
+    os.replace(tmp, path)
+
+
+def _paths(persist_dir: Path, name: str, suffix: str = ""):
+    persist_dir = Path(persist_dir)
+    return persist_dir / f"{name}.bin{suffix}", persist_dir / f"{name}.idx.npy{suffix}"
+
+
+class Blob:
+    """Read-only, memory-mapped sequence of strings stored as `<name>.bin` + `<name>.idx.npy`."""
+
+    def __init__(self, persist_dir: Path, name: str, suffix: str = ""):
+        bin_path, idx_path = _paths(persist_dir, name, suffix)
+        self.offsets = np.load(idx_path, mmap_mode="r")
+        # np.memmap cannot map an empty file
+        size = int(self.offsets[-1])
+        self._data = np.memmap(bin_path, dtype=np.uint8, mode="r", shape=(size,)) if size else np.zeros(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self._data[int(self.offsets[i]) : int(self.offsets[i + 1])].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class BlobWriter:
+    """Streams strings into a new blob; offsets are written on `close`."""
+
+    def __init__(self, persist_dir: Path, name: str, suffix: str = TMP_SUFFIX):
+        self.bin_path, self.idx_path = _paths(persist_dir, name, suffix)
+        self._fh = open(self.bin_path, "wb")
+        self._offsets = [0]
+
+    def add(self, s: str) -> None:
+        data = s.encode("utf-8")
+        self._fh.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def close(self) -> None:
+        self._fh.close()
+        with open(self.idx_path, "wb") as fh:
+            np.save(fh, np.array(self._offsets, dtype=np.int64))
+
+
+def append_blob(persist_dir: Path, name: str, items: Sequence[str]) -> None:
+    bin_path, idx_path = _paths(persist_dir, name)
+    offsets = np.load(idx_path, mmap_mode="r")
+    end = int(offsets[-1])
+    del offsets
+    new = []
+    with open(bin_path, "r+b") as fh:
+        # Drop bytes left behind by an append that died before extending the offsets
+        fh.truncate(end)
+        fh.seek(end)
+        for s in items:
+            data = s.encode("utf-8")
+            fh.write(data)
+            end += len(data)
+            new.append(end)
+    append_npy(idx_path, np.array(new, dtype=np.int64))
+
+
+def _meta_json(meta: dict) -> str:
+    return json.dumps(meta, ensure_ascii=False, separators=(",", ":"))
+
+
+class DocTable:
+    """Columnar view of the stored documents: row -> id, text, metadata."""
+
+    def __init__(self, persist_dir: Path, suffix: str = ""):
+        self.texts = Blob(persist_dir, "texts", suffix)
+        self.ids = Blob(persist_dir, "ids", suffix)
+        self.metas = Blob(persist_dir, "meta", suffix)
+
+    def __len__(self) -> int:
+        return min(len(self.texts), len(self.ids), len(self.metas))
+
+    def id(self, row: int) -> str:
+        return self.ids[row]
+
+    def text(self, row: int) -> str:
+        return self.texts[row]
+
+    def meta(self, row: int) -> dict:
+        return json.loads(self.metas[row])
+
+
+def write_docs(persist_dir: Path, docs: Iterable[Any], suffix: str = TMP_SUFFIX) -> int:
+    """Stream documents (anything with `id`, `text`, `meta`) into new doc columns; returns the count."""
+    writers = {col: BlobWriter(persist_dir, col, suffix) for col in DOC_COLUMNS}
+    n = 0
+    try:
+        for d in docs:
+            writers["texts"].add(d.text)
+            writers["ids"].add(d.id)
+            writers["meta"].add(_meta_json(d.meta))
+            n += 1
+    finally:
+        for w in writers.values():
+            w.close()
+    return n
+
+
+def append_docs(persist_dir: Path, docs: Sequence[Any]) -> None:
+    # Texts last: DocTable's length is the shortest column
+    append_blob(persist_dir, "ids", [d.id for d in docs])
+    append_blob(persist_dir, "meta", [_meta_json(d.meta) for d in docs])
+    append_blob(persist_dir, "texts", [d.text for d in docs])
+
+
+def write_vectorizer(persist_dir: Path, vectorizer, suffix: str = TMP_SUFFIX) -> Dict[str, Any]:
+    """Store the fitted vocabulary and idf; returns the settings to record in format.json."""
+    writer = BlobWriter(persist_dir, "vocab", suffix)
+    for term in vectorizer.get_feature_names_out():
+        writer.add(str(term))
+    writer.close()
+    with open(Path(persist_dir) / ("idf.npy" + suffix), "wb") as fh:
+        np.save(fh, np.asarray(vectorizer.idf_, dtype=np.float64))
+    params = vectorizer.get_params()
+    settings = {name: params[name] for name in VECTORIZER_PARAMS}
+    settings["ngram_range"] = list(settings["ngram_range"])
+    return settings
+
+
+def load_vectorizer(persist_dir: Path, settings: Dict[str, Any]):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vocab = Blob(persist_dir, "vocab")
+    params = {**settings, "ngram_range": tuple(settings["ngram_range"])}
+    vectorizer = TfidfVectorizer(**params, vocabulary={term: i for i, term in enumerate(vocab)})
+    vectorizer.idf_ = np.load(Path(persist_dir) / "idf.npy")
+    return vectorizer
+
+
+def write_csr(persist_dir: Path, matrix, suffix: str = TMP_SUFFIX) -> None:
+    matrix = sparse.csr_matrix(matrix)
+    for name in MATRIX_ARRAYS:
+        with open(Path(persist_dir) / f"matrix.{name}.npy{suffix}", "wb") as fh:
+            np.save(fh, getattr(matrix, name))
+
+
+def append_csr(persist_dir: Path, rows) -> None:
+    rows = sparse.csr_matrix(rows)
+    persist_dir = Path(persist_dir)
+    indptr_path = persist_dir / "matrix.indptr.npy"
+    nnz = int(np.load(indptr_path, mmap_mode="r")[-1])
+    # A previous append may have died after extending data/indices; cut back to indptr
+    for name in ("data", "indices"):
+        path = persist_dir / f"matrix.{name}.npy"
+        if np.load(path, mmap_mode="r").shape[0] != nnz:
+            arr = np.load(path)[:nnz]
+            with open(path.with_name(path.name + TMP_SUFFIX), "wb") as fh:
+                np.save(fh, arr)
+            os.replace(path.with_name(path.name + TMP_SUFFIX), path)
+        append_npy(path, getattr(rows, name))
+    append_npy(indptr_path, rows.indptr[1:].astype(np.int64) + nnz)
+
+
+def load_csr(persist_dir: Path, n_cols: int) -> sparse.csr_matrix:
+    arrays = [np.load(Path(persist_dir) / f"matrix.{name}.npy", mmap_mode="r") for name in MATRIX_ARRAYS]
+    return sparse.csr_matrix(tuple(arrays), shape=(len(arrays[2]) - 1, n_cols), copy=False)
+
+
+def read_format(persist_dir: Path) -> Optional[Dict[str, Any]]:
+    """The index's format.json, or None for a legacy (or missing) index."""
+    path = Path(persist_dir) / FORMAT_FILE
+    try:
+        fmt = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    if fmt.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version {fmt.get('version')!r} in {path}; re-run /ingest/")
+    return fmt
+
+
+def has_index(persist_dir: Path) -> bool:
+    persist_dir = Path(persist_dir)
+    return (persist_dir / FORMAT_FILE).exists() or (persist_dir / "matrix.joblib").exists()
+
+
+def commit(persist_dir: Path, vectorizer_settings: Dict[str, Any], names: Iterable[str] = DATA_FILES) -> None:
+    """Move freshly written `.tmp` files into place, then record the format.
+
+    Call inside `vector_store.writing` so readers skip the half-replaced index.
+    Legacy files are removed once the new ones are live.
+    """
+    persist_dir = Path(persist_dir)
+    for name in names:
+        os.replace(persist_dir / (name + TMP_SUFFIX), persist_dir / name)
+    tmp = persist_dir / (FORMAT_FILE + TMP_SUFFIX)
+    tmp.write_text(json.dumps({"version": FORMAT_VERSION, "vectorizer": vectorizer_settings}), encoding="utf-8")
+    os.replace(tmp, persist_dir / FORMAT_FILE)
+    for name in LEGACY_FILES:
+        (persist_dir / name).unlink(missing_ok=True)
+
+
+def discard(persist_dir: Path, names: Iterable[str] = DATA_FILES) -> None:
+    for name in names:
+        (Path(persist_dir) / (name + TMP_SUFFIX)).unlink(missing_ok=True)
+
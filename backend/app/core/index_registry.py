@@ -0,0 +1,166 @@
+"""Process-wide registry of loaded indexes.
+
+Routers used to construct a fresh `TfidfStore` per request, which re-parsed
+`docs.json`/`texts.txt` and unpickled the vectorizer and matrix every time. The
+registry keeps one loaded `TfidfStore`/`EmbeddingStore`/`BM25Store` per index directory for the life of the worker
+and only reloads when the on-disk generation marker changes.
+
+Reloads build a complete new store off to the side and then swap the reference
+under a lock, so a request that already holds a store keeps using a consistent
+snapshot while the next request picks up the new one.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .bm25 import LEXICAL_BACKEND, LEXICAL_BACKENDS, BM25Store
+from .embedding_store import EmbeddingStore
+from .vector_store import TfidfStore, generation_is_stable, read_generation
+
+logger = logging.getLogger("index_registry")
+
+# Index served by this process; set INDEX_DIR to run an instance per shard (see scatter_gather.py)
+INDEX_DIR = Path(os.getenv("INDEX_DIR") or Path(__file__).resolve().parents[1] / "index")
+
+# How many times to retry a load that raced with a writer before giving up
+MAX_LOAD_ATTEMPTS = 3
+# How long a first load waits for a writer to finish before failing (there is no old copy to serve)
+STABLE_WAIT_SECONDS = float(os.getenv("INDEX_STABLE_WAIT_SECONDS", "60"))
+STABLE_POLL_SECONDS = 0.05
+
+
+def wait_until_stable(persist_dir: Path, current: Optional[str], timeout: float = STABLE_WAIT_SECONDS) -> Optional[str]:
+    """Poll the generation marker until no writer is mid-swap; returns the stable generation.
+
+    Raises RuntimeError after `timeout` seconds. None (no index yet) counts as stable.
+    """
+    deadline = time.monotonic() + timeout
+    while current is not None and not generation_is_stable(current):
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Index {persist_dir} is still being written (generation {current}); try again later")
+        time.sleep(STABLE_POLL_SECONDS)
+        current = read_generation(persist_dir)
+    return current
+
+
+@dataclass
+class _Entry:
+    store: Any
+    generation: Optional[str]
+
+
+class IndexRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, Path], threading.Lock] = {}
+        self._entries: Dict[Tuple[str, Path], _Entry] = {}
+
+    def _load_lock(self, key: Tuple[str, Path]) -> threading.Lock:
+        with self._lock:
+            lock = self._load_locks.get(key)
+            if lock is None:
+                lock = self._load_locks[key] = threading.Lock()
+            return lock
+
+    def _get(self, kind: str, persist_dir: Path, loader: Callable[[Path, Any], Any]):
+        key = (kind, Path(persist_dir).resolve())
+        current = read_generation(key[1])
+        entry = self._entries.get(key)
+        if entry is not None and (entry.generation == current or not generation_is_stable(current)):
+            # Up to date, or a writer is mid-swap: keep serving the last good copy
+            return entry.store
+
+        # Only one thread per index does the (slow) load; the rest wait and reuse it
+        with self._load_lock(key):
+            entry = self._entries.get(key)
+            current = read_generation(key[1])
+            if entry is not None and entry.generation == current:
+                return entry.store
+            for _ in range(MAX_LOAD_ATTEMPTS):
+                if entry is not None and not generation_is_stable(current):
+                    return entry.store
+                # Nothing to fall back to: never load files a writer is halfway through replacing
+                current = wait_until_stable(key[1], current)
+                store = loader(key[1], entry.store if entry is not None else None)
+                after = read_generation(key[1])
+                if after == current:
+                    break
+                # Files changed underneath us; load again from the new generation
+                current = after
+            else:
+                logger.warning("Index %s kept changing while loading; serving last attempt", key[1])
+            with self._lock:
+                self._entries[key] = _Entry(store=store, generation=current)
+            logger.info("Loaded %s index from %s (generation %s)", kind, key[1], current)
+            return store
+
+    def loaded(self, kind: str, persist_dir: Path) -> Optional[Tuple[Any, Optional[str]]]:
+        """(store, generation) currently served for `kind`, or None; never loads or waits for a load."""
+        with self._lock:
+            entry = self._entries.get((kind, Path(persist_dir).resolve()))
+        return (entry.store, entry.generation) if entry is not None else None
+
+    def tfidf(self, persist_dir: Path) -> TfidfStore:
+        def _load(path: Path, previous: Optional[TfidfStore]) -> TfidfStore:
+            store = TfidfStore(path)
+            store._load()
+            return store
+
+        return self._get("tfidf", persist_dir, _load)
+
+    def embedding(self, persist_dir: Path) -> EmbeddingStore:
+        def _load(path: Path, previous: Optional[EmbeddingStore]) -> EmbeddingStore:
+            # Keep the already-loaded encoder; only the records/matrix change between generations
+            model = previous.model if previous is not None else None
+            return EmbeddingStore(path, model=model).load()
+
+        return self._get("embedding", persist_dir, _load)
+
+    def bm25(self, persist_dir: Path) -> BM25Store:
+        def _load(path: Path, previous: Optional[BM25Store]) -> BM25Store:
+            # Builds the inverted index only on first use of an index written without BM25
+            return BM25Store(path).load()
+
+        return self._get("bm25", persist_dir, _load)
+
+    def invalidate(self, persist_dir: Optional[Path] = None) -> None:
+        """Drop cached stores (for one directory, or all) so the next call reloads."""
+        with self._lock:
+            if persist_dir is None:
+                self._entries.clear()
+                return
+            resolved = Path(persist_dir).resolve()
+            for key in [k for k in self._entries if k[1] == resolved]:
+                del self._entries[key]
+
+
+registry = IndexRegistry()
+
+
+def get_tfidf_store(persist_dir: Path) -> TfidfStore:
+    return registry.tfidf(persist_dir)
+
+
+def get_embedding_store(persist_dir: Path) -> EmbeddingStore:
+    return registry.embedding(persist_dir)
+
+
+def get_bm25_store(persist_dir: Path) -> BM25Store:
+    return registry.bm25(persist_dir)
+
+
+def get_lexical_store(persist_dir: Path, backend: Optional[str] = None):
+    """The `TfidfStore` or `BM25Store` for `backend` (default LEXICAL_BACKEND); both have `query_batch`/`search_rows`."""
+    backend = backend or LEXICAL_BACKEND
+    if backend == "tfidf":
+        return get_tfidf_store(persist_dir)
+    if backend == "bm25":
+        return get_bm25_store(persist_dir)
+    raise ValueError(f"Unknown lexical backend {backend!r}; expected one of {', '.join(LEXICAL_BACKENDS)}")
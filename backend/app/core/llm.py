@@ -12,12 +12,20 @@ Design goals:
 - Clear error guidance when extras missing
 """
 
+import asyncio
+import copy
 import logging
+import math
 
+from concurrent.futures import Future
+from contextlib import contextmanager
 from dataclasses import dataclass
 from functools import lru_cache
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Callable, Iterator, List
 import os
+import queue
+import threading
+import time
 
 try:
     from transformers import AutoTokenizer, AutoModelForCausalLM
@@ -27,20 +35,44 @@ except Exception:  # pragma: no cover - we handle absence gracefully
     AutoModelForCausalLM = None  # type: ignore
     torch = None  # type: ignore
 
+try:
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+except Exception:  # pragma: no cover - we handle absence gracefully
+    StoppingCriteria = object  # type: ignore
+    StoppingCriteriaList = None  # type: ignore
+    TextIteratorStreamer = None  # type: ignore
+
 try:
     import openai
 except Exception:
     openai = None
 
+from .executor import Overloaded
+from .quant import LLM_QUANT, load_dtype, quantize
+
 logger = logging.getLogger("llm")
 logging.basicConfig(level=logging.INFO)
 
 DEFAULT_MODEL = os.getenv("LLM_MODEL", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+# Optional PEFT/LoRA adapter dir applied on top of LLM_MODEL and merged at load time.
+# LLM_MODEL may also point at a checkpoint fused by scripts/merge_lora_adapter.py.
+ADAPTER_PATH = os.getenv("LLM_ADAPTER") or None
 MAX_INPUT_TOKENS = int(os.getenv("LLM_MAX_INPUT_TOKENS", "2048"))
 MAX_GENERATION_TOKENS = int(os.getenv("LLM_MAX_GENERATION_TOKENS", "256"))
 DEVICE = os.getenv("LLM_DEVICE", "auto")  # auto|cpu|cuda|mps
 TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.4"))
 TOP_P = float(os.getenv("LLM_TOP_P", "0.95"))
+# Intra-op torch threads for local generation (0 = torch default); keep
+# LLM_CONCURRENCY * LLM_TORCH_THREADS at or below the core count
+TORCH_THREADS = int(os.getenv("LLM_TORCH_THREADS", "0"))
+# Dynamic batching of concurrent local generations (see BatchScheduler)
+BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("LLM_BATCH_MAX_WAIT_MS", "10"))
+BATCH_BUCKET_TOKENS = int(os.getenv("LLM_BATCH_BUCKET_TOKENS", "128"))
+# Prompts allowed to wait for a batch before new ones are rejected (Overloaded / 503)
+BATCH_MAX_PENDING = int(os.getenv("LLM_BATCH_MAX_PENDING", str(4 * BATCH_MAX_SIZE)))
+# Reuse the past key/values of the fixed system-prompt prefix across local generations
+PREFIX_CACHE = os.getenv("LLM_PREFIX_CACHE", "1") == "1"
 
 
 @dataclass
@@ -65,31 +97,434 @@ def _select_device():
     return "cpu"
 
 
-@lru_cache(maxsize=1)
-def _load_model():  # returns (tokenizer, model, device)
+def load_model(quant: str = LLM_QUANT, model_name: str = DEFAULT_MODEL, adapter: Optional[str] = ADAPTER_PATH):  # returns (tokenizer, model, device)
+    """Load tokenizer and model with the given `LLM_QUANT` mode.
+
+    An `adapter` is merged into the base weights right after loading, so serving
+    pays no per-forward adapter overhead; quantization is applied after merging.
+    """
     if AutoTokenizer is None or AutoModelForCausalLM is None:
         raise RuntimeError(
             "LLM dependencies not installed. Install with: pip install 'transformers' 'accelerate' 'torch' 'peft' 'datasets'"
         )
     device = _select_device()
-    tokenizer = AutoTokenizer.from_pretrained(DEFAULT_MODEL)
+    if TORCH_THREADS > 0:
+        torch.set_num_threads(TORCH_THREADS)
     model = AutoModelForCausalLM.from_pretrained(
-        DEFAULT_MODEL,
+        model_name,
         device_map="auto" if device in ("cuda", "mps") else None,
-        torch_dtype=(torch.float16 if device == "cuda" else None),
+        torch_dtype=load_dtype(quant, device),
     )
+    tokenizer_src = model_name
+    if adapter:
+        try:
+            from peft import PeftModel
+        except Exception as e:
+            raise RuntimeError("Loading LLM_ADAPTER requires peft. Install with: pip install peft") from e
+        model = PeftModel.from_pretrained(model, adapter).merge_and_unload()
+        # finetune_lora.py saves the tokenizer next to the adapter
+        if os.path.exists(os.path.join(adapter, "tokenizer_config.json")):
+            tokenizer_src = adapter
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_src)
+    model = quantize(model.eval(), quant, device)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
+    # Decoder-only models continue from the last position, so batched prompts are left-padded
+    tokenizer.padding_side = "left"
     return tokenizer, model, device
 
 
+class SwapInProgress(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    model: str
+    adapter: Optional[str] = None
+
+    def label(self) -> str:
+        return f"{self.model}+{self.adapter}" if self.adapter else self.model
+
+
+class _ModelSlot:
+    """Holds the loaded local model and swaps it once in-flight generations drain.
+
+    Generations hold the model through `use()`. `swap()` loads the replacement
+    off to the side while traffic continues, then stops admitting new
+    generations, waits for the active ones to finish and switches over.
+    """
+
+    def __init__(self, spec: ModelSpec):
+        self.spec = spec
+        self.loaded = None
+        self.swaps = 0
+        self._cond = threading.Condition()
+        self._swap_lock = threading.Lock()
+        # Serializes first loads; held without `_cond` so status/use/swap never wait on a load
+        self._load_lock = threading.Lock()
+        self._active = 0
+        self._swapping = False
+
+    def get(self):
+        loaded = self.loaded
+        if loaded is not None:
+            return loaded
+        with self._load_lock:
+            with self._cond:
+                if self.loaded is not None:
+                    return self.loaded
+                spec = self.spec
+            loaded = load_model(LLM_QUANT, spec.model, spec.adapter)
+            with self._cond:
+                # A swap that finished while we were loading wins
+                if self.loaded is None:
+                    self.loaded = loaded
+                return self.loaded
+
+    @contextmanager
+    def use(self):
+        with self._cond:
+            while self._swapping:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield self.get()
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def swap(self, spec: ModelSpec, drain_timeout: float) -> Dict[str, Any]:
+        if not self._swap_lock.acquire(blocking=False):
+            raise SwapInProgress("A model swap is already in progress")
+        try:
+            start = time.perf_counter()
+            loaded = load_model(LLM_QUANT, spec.model, spec.adapter)
+            load_seconds = time.perf_counter() - start
+            with self._cond:
+                self._swapping = True
+                try:
+                    drain_start = time.perf_counter()
+                    if not self._cond.wait_for(lambda: self._active == 0, timeout=drain_timeout):
+                        raise TimeoutError(f"{self._active} generations still running after {drain_timeout}s; model not swapped")
+                    previous, self.spec, self.loaded = self.spec, spec, loaded
+                    self.swaps += 1
+                finally:
+                    self._swapping = False
+                    self._cond.notify_all()
+            logger.info("Swapped model %s -> %s", previous.label(), spec.label())
+            return {
+                "previous": previous.label(),
+                "current": spec.label(),
+                "load_seconds": round(load_seconds, 3),
+                "drain_seconds": round(time.perf_counter() - drain_start, 3),
+            }
+        finally:
+            self._swap_lock.release()
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "model": self.spec.model,
+                "adapter": self.spec.adapter,
+                "loaded": self.loaded is not None,
+                "active_generations": self._active,
+                "swapping": self._swapping,
+                "swaps": self.swaps,
+            }
+
+
+_slot = _ModelSlot(ModelSpec(DEFAULT_MODEL, ADAPTER_PATH))
+
+
+def _load_model():  # returns (tokenizer, model, device)
+    return _slot.get()
+
+
+def swap_model(model_name: Optional[str] = None, adapter: Optional[str] = None, drain_timeout: float = 60.0) -> Dict[str, Any]:
+    """Hot-swap the local model (base + adapter, or a merged checkpoint path)."""
+    return _slot.swap(ModelSpec(model_name or DEFAULT_MODEL, adapter), drain_timeout)
+
+
+def model_status() -> Dict[str, Any]:
+    return _slot.status()
+
+
+def model_loaded() -> bool:
+    """Lock-free check for probes: never waits on a load, use() or swap holding the slot."""
+    return _slot.loaded is not None
+
+
+# Bump whenever build_prompt changes so cached answers from the old template are not reused
+PROMPT_VERSION = "1"
+
+
+def active_model_name() -> str:
+    """Model that `generate` will use with the current environment."""
+    if os.getenv("OPENAI_API_KEY") and openai is not None:
+        return os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    return _slot.spec.label()
+
+
+def sampling_params() -> Dict[str, Any]:
+    return {"temperature": TEMPERATURE, "top_p": TOP_P, "max_new_tokens": MAX_GENERATION_TOKENS}
+
+
+SYSTEM_PROMPT = (
+    "You are a legal assistant for Indian law. Answer the user question using ONLY the provided context snippets. "
+    "If the answer cannot be found, say you do not have enough information. Provide concise, factual responses with section references when possible."
+)
+# Identical for every request, so its attention keys/values are computed once (see _prefix_state)
+PROMPT_PREFIX = f"<|system|>\n{SYSTEM_PROMPT}\n"
+
+
 def build_prompt(question: str, contexts: List[str]) -> str:
     ctx_block = "\n\n".join(f"[CONTEXT {i+1}]\n{c}" for i, c in enumerate(contexts))
-    system = (
-        "You are a legal assistant for Indian law. Answer the user question using ONLY the provided context snippets. "
-        "If the answer cannot be found, say you do not have enough information. Provide concise, factual responses with section references when possible."
-    )
-    return f"<|system|>\n{system}\n<|context|>\n{ctx_block}\n<|question|>\n{question}\n<|answer|>"
+    return f"{PROMPT_PREFIX}<|context|>\n{ctx_block}\n<|question|>\n{question}\n<|answer|>"
+
+
+@lru_cache(maxsize=1)
+def _prefix_state(tokenizer, model):
+    """Token ids and past key/values of PROMPT_PREFIX for `model` (recomputed after a swap)."""
+    prefix_ids = tokenizer(PROMPT_PREFIX, return_tensors="pt")["input_ids"].to(model.device)
+    with torch.no_grad():
+        past = model(prefix_ids, use_cache=True).past_key_values
+    logger.info("Cached %d prompt-prefix tokens", prefix_ids.shape[1])
+    return prefix_ids, past
+
+
+def _prompt_inputs(tokenizer, model, prompt: str):
+    """Tokenize one prompt, reusing the cached prefix when the prompt starts with it.
+
+    Returns (input_ids, attention_mask, past_key_values or None, cached_tokens).
+    The prefix and the rest are tokenized separately so the prompt's first tokens
+    are exactly the cached ones; `generate` then only runs prefill on the rest.
+    """
+    if not (PREFIX_CACHE and prompt.startswith(PROMPT_PREFIX)):
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=MAX_INPUT_TOKENS)
+        return inputs["input_ids"].to(model.device), inputs["attention_mask"].to(model.device), None, 0
+    prefix_ids, past = _prefix_state(tokenizer, model)
+    rest = tokenizer(
+        prompt[len(PROMPT_PREFIX):],
+        return_tensors="pt",
+        add_special_tokens=False,
+        truncation=True,
+        max_length=max(1, MAX_INPUT_TOKENS - prefix_ids.shape[1]),
+    )["input_ids"].to(model.device)
+    input_ids = torch.cat([prefix_ids, rest], dim=1)
+    # generate() extends the cache in place, so every request gets its own copy
+    return input_ids, torch.ones_like(input_ids), copy.deepcopy(past), prefix_ids.shape[1]
+
+
+def _usage(tokens_in: int, tokens_out: int, cached: int) -> Dict[str, Any]:
+    return {
+        "total_tokens": tokens_in + tokens_out,
+        "prompt_tokens": tokens_in,
+        "completion_tokens": tokens_out,
+        # Prompt tokens served from the prefix cache vs. run through prefill for this request
+        "prompt_tokens_cached": cached,
+        "prompt_tokens_computed": tokens_in - cached,
+    }
+
+
+class _Pending:
+    __slots__ = ("prompt", "run_with", "enqueued", "future")
+
+    def __init__(self, prompt: str, run_with: Optional[Callable[..., Future]]):
+        self.prompt = prompt
+        self.run_with = run_with
+        self.enqueued = time.perf_counter()
+        self.future: "Future[GenerationResult]" = Future()
+
+
+class BatchScheduler:
+    """Coalesces concurrent prompts into batched `generate` calls.
+
+    `enqueue` returns a future right away, so async callers wait for their
+    batch without holding a worker thread; `submit` blocks on it. A single
+    background thread takes the first waiting prompt, keeps collecting for up
+    to `max_wait_ms` or until `max_batch_size` prompts are waiting, groups them
+    into buckets of similar prompt length (`bucket_tokens` wide) so padding
+    stays small, and runs each bucket through `run_batch(prompts) -> results`
+    in one forward pass. A prompt enqueued with `run_with` (e.g.
+    `inference_executor.submit`) has its batch run through that pool, which
+    caps how many model calls run at once; more than `max_pending` waiting
+    prompts raise `Overloaded`.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[str]], List[GenerationResult]],
+        length_fn: Callable[[str], int],
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        bucket_tokens: int = BATCH_BUCKET_TOKENS,
+        max_pending: int = BATCH_MAX_PENDING,
+    ):
+        self.run_batch = run_batch
+        self.length_fn = length_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.bucket_tokens = max(1, bucket_tokens)
+        self.max_pending = max(self.max_batch_size, max_pending)
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._batches = 0
+        self._requests = 0
+        self._tokens_out = 0
+        self._queue_wait = 0.0
+        self._busy = 0.0
+
+    def submit(self, prompt: str) -> GenerationResult:
+        return self.enqueue(prompt).result()
+
+    def enqueue(self, prompt: str, run_with: Optional[Callable[..., Future]] = None) -> "Future[GenerationResult]":
+        self._ensure_worker()
+        with self._stats_lock:
+            if self._pending >= self.max_pending:
+                # Rough wait: the batches ahead of this prompt at the average batch time
+                avg = self._busy / self._batches if self._batches else 1.0
+                raise Overloaded("inference", max(1, math.ceil(self._pending / self.max_batch_size * avg)))
+            self._pending += 1
+        item = _Pending(prompt, run_with)
+        self._queue.put(item)
+        return item.future
+
+    def _ensure_worker(self) -> None:
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name="llm-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self) -> List[_Pending]:
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._stats_lock:
+            self._pending -= len(items)
+        return items
+
+    def _length(self, prompt: str) -> int:
+        try:
+            return self.length_fn(prompt)
+        except Exception:
+            # Only used for bucketing; the batch run reports the underlying error (e.g. missing deps)
+            return 0
+
+    def _loop(self) -> None:
+        while True:
+            buckets: Dict[Any, List[_Pending]] = {}
+            for item in self._collect():
+                # Prompts bound for different pools never share a batch
+                buckets.setdefault((self._length(item.prompt) // self.bucket_tokens, item.run_with), []).append(item)
+            for _, group in sorted(buckets.items(), key=lambda kv: kv[0][0]):
+                self._run(group)
+
+    def _run(self, group: List[_Pending]) -> None:
+        start = time.perf_counter()
+        prompts = [item.prompt for item in group]
+        run_with = group[0].run_with
+        try:
+            results = run_with(self.run_batch, prompts).result() if run_with is not None else self.run_batch(prompts)
+        except BaseException as e:  # handed to every caller of the batch
+            for item in group:
+                item.future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(group)
+            self._tokens_out += sum(r.tokens_out for r in results)
+            self._queue_wait += sum(start - item.enqueued for item in group)
+            self._busy += elapsed
+        for item, res in zip(group, results):
+            res.usage = {**res.usage, "batch_size": len(group), "queue_ms": round((start - item.enqueued) * 1000, 2)}
+            item.future.set_result(res)
+
+    def stats(self) -> Dict[str, Any]:
+        """Throughput vs latency: larger batches raise tokens/s but add queue wait."""
+        with self._stats_lock:
+            batches, requests = self._batches, self._requests
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": batches,
+                "requests": requests,
+                "avg_batch_size": round(requests / batches, 2) if batches else 0.0,
+                "avg_queue_ms": round(self._queue_wait / requests * 1000, 2) if requests else 0.0,
+                "avg_batch_ms": round(self._busy / batches * 1000, 2) if batches else 0.0,
+                "tokens_per_second": round(self._tokens_out / self._busy, 2) if self._busy else 0.0,
+            }
+
+
+def _generate_local_batch(prompts: List[str]) -> List[GenerationResult]:
+    with _slot.use() as (tokenizer, model, device):
+        return _generate_with(tokenizer, model, _slot.spec.label(), prompts)
+
+
+def _generate_with(tokenizer, model, model_label: str, prompts: List[str]) -> List[GenerationResult]:
+    if len(prompts) == 1:
+        input_ids, attn_mask, past, cached = _prompt_inputs(tokenizer, model, prompts[0])
+    else:
+        # Left padding shifts the prefix to a different position per row, so batches skip the prefix cache
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=MAX_INPUT_TOKENS)
+        input_ids = inputs["input_ids"].to(model.device)
+        attn_mask = inputs["attention_mask"].to(model.device)
+        past, cached = None, 0
+
+    with torch.no_grad():
+        gen_ids = model.generate(
+            input_ids,
+            attention_mask=attn_mask,
+            past_key_values=past,
+            max_new_tokens=MAX_GENERATION_TOKENS,
+            do_sample=True,
+            temperature=TEMPERATURE,
+            top_p=TOP_P,
+            pad_token_id=tokenizer.pad_token_id,
+        )
+    padded_len = input_ids.shape[1]
+    results = []
+    for i, prompt in enumerate(prompts):
+        new_ids = gen_ids[i, padded_len:]
+        tokens_in = int(attn_mask[i].sum())
+        # Shorter completions in the batch are right-padded after their EOS
+        tokens_out = int((new_ids != tokenizer.pad_token_id).sum())
+        results.append(
+            GenerationResult(
+                prompt=prompt,
+                completion=tokenizer.decode(new_ids, skip_special_tokens=True).strip(),
+                model=model_label,
+                tokens_in=tokens_in,
+                tokens_out=tokens_out,
+                usage=_usage(tokens_in, tokens_out, cached),
+            )
+        )
+    return results
+
+
+def _prompt_tokens(prompt: str) -> int:
+    tokenizer, _, _ = _load_model()
+    return min(len(tokenizer(prompt)["input_ids"]), MAX_INPUT_TOKENS)
+
+
+@lru_cache(maxsize=1)
+def _scheduler() -> BatchScheduler:
+    return BatchScheduler(_generate_local_batch, _prompt_tokens)
+
+
+def batch_stats() -> Dict[str, Any]:
+    """Batching metrics for local generation (empty until the first local call)."""
+    return _scheduler().stats() if _scheduler.cache_info().currsize else {}
 
 
 def generate(question: str, contexts: List[str]) -> GenerationResult:
@@ -117,31 +552,144 @@ def generate(question: str, contexts: List[str]) -> GenerationResult:
             usage=usage,
         )
 
-    # Fallback to local HF model
+    # Fallback to local HF model; concurrent callers are batched into one forward pass
     logger.info("Using local HuggingFace backend for generation")
-    tokenizer, model, device = _load_model()
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=MAX_INPUT_TOKENS)
-    input_ids = inputs["input_ids"].to(model.device)
-    attn_mask = inputs["attention_mask"].to(model.device)
+    _load_model()  # raise the missing-deps error in the caller's thread
+    return _scheduler().submit(prompt)
 
-    with torch.no_grad():
-        gen_ids = model.generate(
-            input_ids,
-            attention_mask=attn_mask,
-            max_new_tokens=MAX_GENERATION_TOKENS,
-            do_sample=True,
+
+async def agenerate(question: str, contexts: List[str], submit: Callable[..., Future]) -> GenerationResult:
+    """`generate` for async handlers, with model calls run through `submit` (e.g. `inference_executor.submit`).
+
+    A local prompt goes straight to the batch scheduler and its batch runs
+    through `submit`, so waiting callers hold no pool worker and concurrent
+    requests are coalesced even with a single inference worker. An OpenAI call
+    runs through `submit` as a whole. Either may raise `Overloaded`.
+    """
+    if os.getenv("OPENAI_API_KEY") and openai is not None:
+        return await asyncio.wrap_future(submit(generate, question, contexts))
+    return await asyncio.wrap_future(_scheduler().enqueue(build_prompt(question, contexts), run_with=submit))
+
+
+class _CancelCriteria(StoppingCriteria):
+    """Stops `model.generate` at the next token once `event` is set."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
+
+def generate_stream(
+    question: str,
+    contexts: List[str],
+    cancel: Optional[threading.Event] = None,
+    submit: Optional[Callable[..., Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield `{"delta": text}` events as tokens are produced, then one final event.
+
+    The final event is `{"done": True, "model", "tokens_in", "tokens_out", "usage",
+    "cancelled"}`. Setting `cancel` (e.g. on client disconnect) stops generation at
+    the next token; closing the iterator has the same effect.
+    `submit` (e.g. `inference_executor.submit`) runs the local `model.generate` call
+    on a bounded pool instead of a dedicated thread; it may raise `Overloaded`.
+    """
+    cancel = cancel or threading.Event()
+    openai_key = os.getenv("OPENAI_API_KEY")
+    prompt = build_prompt(question, contexts)
+    if openai_key and openai is not None:
+        logger.info("Using OpenAI backend for streaming generation")
+        openai.api_key = openai_key
+        model_name = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+        resp = openai.ChatCompletion.create(
+            model=model_name,
+            messages=[{"role": "system", "content": prompt}],
+            max_tokens=MAX_GENERATION_TOKENS,
             temperature=TEMPERATURE,
             top_p=TOP_P,
-            pad_token_id=tokenizer.eos_token_id,
+            stream=True,
         )
-    full_text = tokenizer.decode(gen_ids[0], skip_special_tokens=True)
-    completion = full_text[len(tokenizer.decode(input_ids[0], skip_special_tokens=True)) :].strip()
-
-    return GenerationResult(
-        prompt=prompt,
-        completion=completion,
-        model=DEFAULT_MODEL,
-        tokens_in=input_ids.shape[1],
-        tokens_out=gen_ids.shape[1] - input_ids.shape[1],
-        usage={"total_tokens": gen_ids.shape[1], "prompt_tokens": input_ids.shape[1], "completion_tokens": gen_ids.shape[1] - input_ids.shape[1]},
-    )
+        chunks = 0
+        try:
+            for chunk in resp:
+                if cancel.is_set():
+                    break
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    chunks += 1
+                    yield {"delta": delta}
+        finally:
+            close = getattr(resp, "close", None)
+            if close is not None:
+                close()
+        # The streaming API does not report usage; each content chunk is ~one token
+        yield {
+            "done": True,
+            "model": model_name,
+            "tokens_in": 0,
+            "tokens_out": chunks,
+            "usage": {"completion_chunks": chunks},
+            "cancelled": cancel.is_set(),
+        }
+        return
+
+    logger.info("Using local HuggingFace backend for streaming generation")
+    if TextIteratorStreamer is None:
+        raise RuntimeError(
+            "LLM dependencies not installed. Install with: pip install 'transformers' 'accelerate' 'torch' 'peft' 'datasets'"
+        )
+    # Holding the model for the whole stream lets a hot swap drain it first
+    with _slot.use() as (tokenizer, model, device):
+        model_label = _slot.spec.label()
+        input_ids, attn_mask, past, cached = _prompt_inputs(tokenizer, model, prompt)
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        result: Dict[str, Any] = {}
+
+        def _run():
+            try:
+                with torch.no_grad():
+                    result["ids"] = model.generate(
+                        input_ids,
+                        attention_mask=attn_mask,
+                        past_key_values=past,
+                        max_new_tokens=MAX_GENERATION_TOKENS,
+                        do_sample=True,
+                        temperature=TEMPERATURE,
+                        top_p=TOP_P,
+                        pad_token_id=tokenizer.eos_token_id,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_CancelCriteria(cancel)]),
+                    )
+            except Exception as e:  # surfaced to the consumer after the stream ends
+                result["error"] = e
+                streamer.end()
+
+        if submit is not None:
+            join = submit(_run).result
+        else:
+            worker = threading.Thread(target=_run, name="llm-stream", daemon=True)
+            worker.start()
+            join = worker.join
+        try:
+            for text in streamer:
+                if text:
+                    yield {"delta": text}
+            cancelled = cancel.is_set()
+        finally:
+            # Reached on normal completion and when the consumer stops early
+            cancel.set()
+            join()
+        if "error" in result:
+            raise RuntimeError(f"Generation failed: {result['error']}")
+
+    tokens_in = input_ids.shape[1]
+    tokens_out = result["ids"].shape[1] - tokens_in
+    yield {
+        "done": True,
+        "model": model_label,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "usage": _usage(tokens_in, tokens_out, cached),
+        "cancelled": cancelled,
+    }
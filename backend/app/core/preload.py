@@ -0,0 +1,174 @@
+"""Startup preloading and per-component readiness.
+
+Without preloading, the first request after a deploy pays for loading the
+TF-IDF index, the embedding encoder and the LLM. `preload` loads all three
+at startup (called from the FastAPI lifespan in `main.py`), then runs the
+configured warm-up queries so the query caches and the LLM prefix cache are
+hot. `/health` reports each component's state and load time and answers 503
+until loading has finished, so an orchestrator only routes traffic to warm
+workers.
+
+Settings (env):
+- PRELOAD: `background` (default; serve /health while loading), `blocking`
+  (finish before accepting requests) or `off` (load lazily on first use)
+- WARMUP_QUERIES: `|`-separated questions to run after loading
+- WARMUP_FILE: file with one warm-up question per line
+- WARMUP_K: comma-separated k values to warm (default `5`)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from . import llm
+from .embedding_store import EMBEDDINGS_FILE, SentenceTransformer
+from .hybrid import warm
+from .index_format import has_index
+from .bm25 import LEXICAL_BACKEND
+from .index_registry import get_bm25_store, get_embedding_store, get_tfidf_store, registry
+from .vector_store import read_generation
+
+logger = logging.getLogger("preload")
+
+PRELOAD_MODE = os.getenv("PRELOAD", "background").lower()
+WARMUP_K = [int(k) for k in os.getenv("WARMUP_K", "5").split(",") if k.strip()]
+COMPONENTS = ("index", "encoder", "llm", "warmup")
+
+
+class Skip(Exception):
+    """Raised by a load step that does not apply in this configuration."""
+
+
+@dataclass
+class ComponentStatus:
+    state: str = "pending"  # pending | loading | ready | skipped | failed
+    seconds: Optional[float] = None
+    detail: Optional[str] = None
+
+
+class Readiness:
+    def __init__(self, mode: str = PRELOAD_MODE):
+        self._lock = threading.Lock()
+        self.mode = mode
+        initial = "skipped" if mode == "off" else "pending"
+        detail = "PRELOAD=off; loaded on first use" if mode == "off" else None
+        self.components: Dict[str, ComponentStatus] = {name: ComponentStatus(initial, detail=detail) for name in COMPONENTS}
+
+    def _set(self, name: str, **fields) -> None:
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self.components[name], key, value)
+
+    def run(self, name: str, step: Callable[[], Optional[str]]) -> bool:
+        self._set(name, state="loading")
+        start = time.perf_counter()
+        try:
+            detail = step()
+            state = "ready"
+        except Skip as e:
+            detail, state = str(e), "skipped"
+        except Exception as e:
+            logger.exception("Preloading %s failed", name)
+            detail, state = str(e), "failed"
+        self._set(name, state=state, seconds=round(time.perf_counter() - start, 3), detail=detail)
+        return state != "failed"
+
+    @property
+    def loading(self) -> bool:
+        with self._lock:
+            return any(c.state in ("pending", "loading") for c in self.components.values())
+
+    def state(self, name: str) -> str:
+        with self._lock:
+            return self.components[name].state
+
+    def report(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: asdict(c) for name, c in self.components.items()}
+
+
+readiness = Readiness()
+
+
+def warmup_queries() -> List[str]:
+    queries = [q.strip() for q in os.getenv("WARMUP_QUERIES", "").split("|") if q.strip()]
+    path = os.getenv("WARMUP_FILE")
+    if path:
+        queries += [q.strip() for q in Path(path).read_text(encoding="utf-8").splitlines() if q.strip()]
+    return queries
+
+
+def index_detail(index_dir: Path) -> Optional[str]:
+    """Chunks and generation of the index this worker serves now; None before the first load."""
+    loaded = registry.loaded("tfidf", index_dir)
+    if loaded is None:
+        return None
+    store, generation = loaded
+    detail = f"{len(store.docs)} chunks, generation {generation}"
+    on_disk = read_generation(index_dir)
+    if on_disk != generation:
+        detail += f" (generation {on_disk} on disk; loaded on the next request)"
+    return detail
+
+
+def component_report(index_dir: Path) -> Dict[str, dict]:
+    """`readiness.report()` with the index detail computed now, not frozen at preload time."""
+    report = readiness.report()
+    detail = index_detail(index_dir)
+    if detail is not None:
+        report["index"]["detail"] = detail
+    return report
+
+
+def _load_index(index_dir: Path) -> str:
+    if not has_index(index_dir):
+        raise Skip("no index yet; run /ingest/")
+    get_tfidf_store(index_dir)
+    if LEXICAL_BACKEND == "bm25":
+        # Builds the inverted index now if this index has none yet, not on the first query
+        get_bm25_store(index_dir)
+    return index_detail(index_dir)
+
+
+def _load_encoder(index_dir: Path) -> str:
+    if SentenceTransformer is None:
+        raise Skip("sentence-transformers not installed")
+    if not (index_dir / EMBEDDINGS_FILE).exists():
+        raise Skip("no embeddings yet; run /embed/")
+    store = get_embedding_store(index_dir)
+    return f"{store.model_name}, {store.embs.shape[0]} vectors"
+
+
+def _load_llm() -> str:
+    if os.getenv("OPENAI_API_KEY") and llm.openai is not None:
+        raise Skip("remote OpenAI backend")
+    tokenizer, model, device = llm._load_model()
+    if llm.PREFIX_CACHE:
+        llm._prefix_state(tokenizer, model)
+    return f"{llm.active_model_name()} on {device}"
+
+
+def _warmup(index_dir: Path, queries: List[str]) -> str:
+    if not queries:
+        raise Skip("no WARMUP_QUERIES / WARMUP_FILE configured")
+    if readiness.state("index") != "ready":
+        raise Skip("index not loaded")
+    warm(index_dir, queries, WARMUP_K, embeddings=readiness.state("encoder") == "ready")
+    return f"{len(queries)} queries x k={WARMUP_K}"
+
+
+def preload(index_dir: Path, queries: Optional[List[str]] = None) -> None:
+    """Load index, encoder and LLM in order, then run warm-up queries."""
+    index_dir = Path(index_dir)
+    start = time.perf_counter()
+    readiness.run("index", lambda: _load_index(index_dir))
+    readiness.run("encoder", lambda: _load_encoder(index_dir))
+    readiness.run("llm", _load_llm)
+    readiness.run("warmup", lambda: _warmup(index_dir, warmup_queries() if queries is None else queries))
+    logger.info("Preload finished in %.1fs: %s", time.perf_counter() - start, readiness.report())
@@ -0,0 +1,90 @@
+"""Low-precision loading for the local LLM and the embedding encoder.
+
+`LLM_QUANT` selects how model weights are held on CPU:
+
+- `none` (default): fp32 on CPU, fp16 on CUDA (the previous behaviour);
+- `int8`: dynamic int8 quantization of every `nn.Linear` (weights stored as
+  int8, activations quantized on the fly). Roughly 4x smaller linear layers and
+  faster matmuls on x86/ARM CPUs; CPU only, ignored on CUDA/MPS;
+- `bf16`: load weights in bfloat16. Halves memory; only faster on CPUs with
+  native bf16 support (AVX512-BF16 / AMX), otherwise falls back to fp32.
+
+`EMB_QUANT` does the same for the SentenceTransformer encoder and defaults to
+`LLM_QUANT`.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Optional
+
+try:
+    import torch
+except Exception:  # pragma: no cover - torch is optional
+    torch = None  # type: ignore
+
+logger = logging.getLogger("quant")
+
+QUANT_MODES = ("none", "int8", "bf16")
+LLM_QUANT = os.getenv("LLM_QUANT", "none").lower()
+EMB_QUANT = os.getenv("EMB_QUANT", LLM_QUANT).lower()
+
+
+def _check(mode: str) -> str:
+    if mode not in QUANT_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {', '.join(QUANT_MODES)}")
+    return mode
+
+
+def bf16_supported() -> bool:
+    if torch is None:
+        return False
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def load_dtype(mode: str, device: str) -> Optional[Any]:
+    """`torch_dtype` to pass to `from_pretrained` for `mode` on `device`."""
+    _check(mode)
+    if device == "cuda":
+        return torch.float16
+    if mode == "bf16" and device == "cpu":
+        if bf16_supported():
+            return torch.bfloat16
+        logger.warning("LLM_QUANT=bf16 requested but this CPU has no native bf16 support; loading fp32")
+    return None
+
+
+def quantize(model, mode: str, device: str = "cpu"):
+    """Apply post-load quantization for `mode`; returns the (possibly new) model."""
+    _check(mode)
+    if torch is None or mode == "none":
+        return model
+    if mode == "int8":
+        if device != "cpu":
+            logger.warning("LLM_QUANT=int8 only applies on CPU; keeping %s weights as loaded", device)
+            return model
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if mode == "bf16" and device == "cpu" and bf16_supported():
+        return model.to(torch.bfloat16)
+    return model
+
+
+def quantize_encoder(model, mode: str = EMB_QUANT):
+    """Apply `mode` to a loaded SentenceTransformer encoder."""
+    if model is None:
+        return model
+    device = str(getattr(model, "device", "cpu"))
+    return quantize(model, mode, "cpu" if device.startswith("cpu") else device)
+
+
+def weights_bytes(model) -> int:
+    """Serialized size of the model's weights (counts packed int8 params correctly)."""
+    import io
+
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell()
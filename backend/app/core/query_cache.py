@@ -0,0 +1,101 @@
+"""Bounded LRU caches for query vectors and retrieval results.
+
+Front-end retries and `/warm/` send the same questions repeatedly. These
+process-wide caches make the repeats nearly free:
+
+- `query_vectors`: (encoder model name, question) -> normalized embedding, so
+  `EmbeddingStore` only runs the SentenceTransformer for unseen questions;
+- `retrieval_results`: (backend, index dir, index generation, question, k,
+  search params) -> hits. The generation is part of the key, so results from an
+  older index are never served and simply age out of the LRU;
+- `passages`: (index dir, index generation, row) -> (id, text, meta) of hot
+  passages read lazily from the on-disk doc columns (see `PassageTable`).
+
+Settings (env):
+- QUERY_VECTOR_CACHE_SIZE: cached query embeddings (default 4096, 0 disables)
+- RETRIEVAL_CACHE_SIZE: cached result lists (default 4096, 0 disables)
+- PASSAGE_CACHE_SIZE: cached passages (default 1024, 0 disables)
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "4096"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+PASSAGE_CACHE_SIZE = int(os.getenv("PASSAGE_CACHE_SIZE", "1024"))
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+def cached_batch(
+    cache: LRUCache,
+    keys: Sequence[Optional[Hashable]],
+    compute: Callable[[List[int]], List[Any]],
+) -> List[Any]:
+    """Look up every key; `compute(missing_positions)` fills the misses in one call.
+
+    A `None` key is never cached (e.g. an index without a generation marker).
+    """
+    out: List[Any] = [None] * len(keys)
+    missing: List[int] = []
+    for i, key in enumerate(keys):
+        value = cache.get(key, _MISSING) if key is not None and cache.maxsize > 0 else _MISSING
+        if value is _MISSING:
+            missing.append(i)
+        else:
+            out[i] = value
+    if missing:
+        for i, value in zip(missing, compute(missing)):
+            out[i] = value
+            if keys[i] is not None:
+                cache.put(keys[i], value)
+    return out
+
+
+query_vectors = LRUCache(QUERY_VECTOR_CACHE_SIZE)
+retrieval_results = LRUCache(RETRIEVAL_CACHE_SIZE)
+passages = LRUCache(PASSAGE_CACHE_SIZE)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    return {"query_vectors": query_vectors.stats(), "retrieval_results": retrieval_results.stats(), "passages": passages.stats()}
@@ -0,0 +1,302 @@
+"""Scatter-gather retrieval over index shards served by other backend instances.
+
+Every backend instance can serve a shard: start it with `INDEX_DIR` pointing at
+a directory written by `scripts/shard_index.py` and it answers
+`/shard/search` (per-backend candidates with global row ids, no text) and
+`/shard/passages` (text for given rows). A coordinator instance started with
+`SHARD_URLS` runs `HybridRetriever` in coordinator mode:
+
+1. the query batch goes to every shard in parallel over pooled keep-alive
+   connections;
+2. each backend's candidates are merged by score into one global list per
+   question, then fused exactly as on a single node;
+3. text for the final top-k only is fetched from the shards owning those rows.
+
+Each shard call has a deadline. If a replica has not answered within the
+hedge delay, the same request is also sent to the next replica (or again to
+the only one) and the first answer wins. Shards that fail or time out are
+left out and the response is marked `partial`, unless partial results are
+disabled.
+
+Settings (env):
+- SHARD_URLS: shards separated by `,`, replicas of one shard by `|`,
+  e.g. `http://a:8001|http://a2:8001,http://b:8002`
+- SHARD_TIMEOUT_MS: deadline per shard including hedges (default 1000)
+- SHARD_HEDGE_MS: hedge delay (default 150; 0 disables hedging)
+- SHARD_ALLOW_PARTIAL: answer from the shards that responded (default 1);
+  0 fails the request when any shard is missing
+- SHARD_MAX_CONNECTIONS: pooled connections across all shards (default 64)
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .sharding import merge_topk, read_shard_info
+from .vector_store import get_document
+
+try:
+    import httpx
+except Exception:  # pragma: no cover - optional dependency
+    httpx = None  # type: ignore
+
+logger = logging.getLogger("scatter_gather")
+
+SHARD_URLS = os.getenv("SHARD_URLS", "")
+SHARD_TIMEOUT_MS = float(os.getenv("SHARD_TIMEOUT_MS", "1000"))
+SHARD_HEDGE_MS = float(os.getenv("SHARD_HEDGE_MS", "150"))
+SHARD_ALLOW_PARTIAL = os.getenv("SHARD_ALLOW_PARTIAL", "1") not in ("0", "false", "False")
+SHARD_MAX_CONNECTIONS = int(os.getenv("SHARD_MAX_CONNECTIONS", "64"))
+BACKENDS = ("tfidf", "embedding")
+
+
+class ShardUnavailable(RuntimeError):
+    """Raised when too few shards answered to build a result."""
+
+
+def parse_shard_urls(spec: str) -> List[List[str]]:
+    return [[url.strip().rstrip("/") for url in shard.split("|") if url.strip()] for shard in spec.split(",") if shard.strip()]
+
+
+# Shard side: plain functions over one index dir, wrapped by routers/shard.py
+
+
+def shard_search(index_dir: Path, questions: List[str], k: int, backends: Sequence[str], search_params: Dict[str, Any]) -> Dict[str, Any]:
+    """Top-k (global row, score, id, meta) per backend and question for the shard in `index_dir`."""
+    from .index_registry import get_bm25_store, get_embedding_store, get_tfidf_store
+
+    info = read_shard_info(index_dir) or {}
+    offset = int(info.get("row_offset", 0))
+    tf = get_tfidf_store(index_dir)
+    n_docs = len(tf.docs)
+    rankings: Dict[str, List[List[Tuple[int, float]]]] = {}
+    errors: Dict[str, str] = {}
+    if "tfidf" in backends:
+        rankings["tfidf"] = tf.search_rows(questions, k=k)
+    if "bm25" in backends:
+        # BM25 statistics are per shard, like TF-IDF scores of a standalone shard index
+        rankings["bm25"] = get_bm25_store(index_dir).search_rows(questions, k=k)
+    if "embedding" in backends:
+        try:
+            rankings["embedding"] = get_embedding_store(index_dir).search_rows(questions, k=k, **search_params)
+        except Exception as e:
+            errors["embedding"] = str(e)
+
+    def hit(row: int, score: float) -> Dict[str, Any]:
+        doc = get_document(tf.docs, row, include_text=False)
+        return {"row": offset + row, "score": score, "id": doc.id, "meta": doc.meta}
+
+    results = [
+        {backend: [hit(row, score) for row, score in rows[i] if row < n_docs] for backend, rows in rankings.items()}
+        for i in range(len(questions))
+    ]
+    return {"row_offset": offset, "rows": n_docs, "generation": tf.generation, "results": results, "errors": errors}
+
+
+def shard_passages(index_dir: Path, rows: Iterable[int]) -> Dict[str, Any]:
+    from .index_registry import get_tfidf_store
+
+    offset = int((read_shard_info(index_dir) or {}).get("row_offset", 0))
+    tf = get_tfidf_store(index_dir)
+    passages = []
+    for row in rows:
+        local = int(row) - offset
+        if 0 <= local < len(tf.docs):
+            doc = tf.docs[local]
+            passages.append({"row": int(row), "id": doc.id, "text": doc.text, "meta": doc.meta})
+    return {"passages": passages}
+
+
+# Coordinator side
+
+
+@dataclass
+class ShardStats:
+    requests: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    hedges: int = 0
+    total_ms: float = 0.0
+    last_error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            "last_error": self.last_error,
+        }
+
+
+@dataclass
+class Gathered:
+    """Per-shard responses (None where the shard failed) and what happened to each call."""
+
+    responses: List[Optional[Dict[str, Any]]]
+    status: List[str] = field(default_factory=list)
+
+    @property
+    def partial(self) -> bool:
+        return any(s != "ok" for s in self.status)
+
+
+class ScatterGather:
+    def __init__(
+        self,
+        shards: Sequence[Sequence[str]],
+        timeout_ms: float = SHARD_TIMEOUT_MS,
+        hedge_ms: float = SHARD_HEDGE_MS,
+        allow_partial: bool = SHARD_ALLOW_PARTIAL,
+        client=None,
+    ):
+        if not shards or not all(shards):
+            raise ValueError("Need at least one shard URL per shard")
+        if client is None:
+            if httpx is None:
+                raise RuntimeError("httpx not installed; install it to use SHARD_URLS")
+            limits = httpx.Limits(max_connections=SHARD_MAX_CONNECTIONS, max_keepalive_connections=SHARD_MAX_CONNECTIONS)
+            client = httpx.Client(limits=limits, timeout=timeout_ms / 1000)
+        self.shards = [list(replicas) for replicas in shards]
+        self.timeout = timeout_ms / 1000
+        self.hedge = hedge_ms / 1000
+        self.allow_partial = allow_partial
+        self.client = client
+        # Shard calls wait on requests, so the two get separate pools (sized for concurrent queries)
+        self._fanout = ThreadPoolExecutor(max_workers=4 * len(self.shards), thread_name_prefix="shard-call")
+        self._io = ThreadPoolExecutor(max_workers=max(4, 4 * len(self.shards)), thread_name_prefix="shard-io")
+        self._lock = threading.Lock()
+        self._stats = [ShardStats() for _ in self.shards]
+        # Global row ranges learned from search responses, for routing passage fetches
+        self.ranges: Dict[int, Tuple[int, int]] = {}
+
+    def _post(self, url: str, path: str, body: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        resp = self.client.post(url + path, json=body, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _call(self, i: int, path: str, body: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], str]:
+        replicas = itertools.cycle(self.shards[i])
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        pending: Dict[Any, str] = {}
+        hedges, error = 0, None
+
+        def launch():
+            url = next(replicas)
+            pending[self._io.submit(self._post, url, path, body, max(0.001, deadline - time.perf_counter()))] = url
+
+        launch()
+        while pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            can_hedge = self.hedge > 0 and hedges < len(self.shards[i])
+            done, _ = wait(list(pending), timeout=min(remaining, self.hedge) if can_hedge else remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                url = pending.pop(fut)
+                if fut.exception() is None:
+                    self._record(i, start, hedges, "ok")
+                    return fut.result(), "ok"
+                error = f"{url}: {fut.exception()}"
+            # Hedge when the outstanding request is slow; fail over at once when it errored
+            if (not done or not pending) and hedges < len(self.shards[i]) and deadline > time.perf_counter():
+                launch()
+                hedges += 1
+        status = "error" if error and not pending else "timeout"
+        self._record(i, start, hedges, status, error)
+        return None, status
+
+    def _record(self, i: int, start: float, hedges: int, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            st = self._stats[i]
+            st.requests += 1
+            # Fail-overs after an error count as hedges too
+            st.hedges += hedges
+            st.total_ms += (time.perf_counter() - start) * 1000
+            st.errors += status == "error"
+            st.timeouts += status == "timeout"
+            if status != "ok":
+                st.last_error = error or status
+        if status != "ok":
+            logger.warning("Shard %d %s: %s", i, status, error or "no answer before the deadline")
+
+    def gather(self, path: str, bodies: Dict[int, Dict[str, Any]]) -> Gathered:
+        """POST `bodies[i]` to shard i for every i given; raises ShardUnavailable per SHARD_ALLOW_PARTIAL."""
+        futures = {i: self._fanout.submit(self._call, i, path, body) for i, body in bodies.items()}
+        out = Gathered(responses=[None] * len(self.shards), status=["skipped"] * len(self.shards))
+        for i, fut in futures.items():
+            out.responses[i], out.status[i] = fut.result()
+        failed = [i for i in bodies if out.status[i] != "ok"]
+        if failed and (len(failed) == len(bodies) or not self.allow_partial):
+            raise ShardUnavailable(f"Shards unavailable: {', '.join(f'{i} ({out.status[i]})' for i in failed)}")
+        return out
+
+    def search(
+        self, qs: List[str], k: int, backends: Sequence[str] = BACKENDS, **search_params
+    ) -> Tuple[List[Dict[str, List[Tuple[int, float]]]], Dict[int, Tuple[str, dict]], Gathered]:
+        """Globally merged top-k (row, score) per backend and question, plus (id, meta) of every candidate row."""
+        body = {"questions": qs, "k": k, "backends": list(backends), "params": search_params}
+        gathered = self.gather("/shard/search", {i: body for i in range(len(self.shards))})
+        refs: Dict[int, Tuple[str, dict]] = {}
+        per_shard: List[List[Dict[str, list]]] = []
+        for i, resp in enumerate(gathered.responses):
+            if resp is None:
+                continue
+            self.ranges[i] = (resp["row_offset"], resp["row_offset"] + resp["rows"])
+            per_shard.append(resp["results"])
+            for result in resp["results"]:
+                for hits in result.values():
+                    refs.update((h["row"], (h["id"], h["meta"])) for h in hits)
+        rankings = []
+        for q in range(len(qs)):
+            found = {backend for results in per_shard for backend in results[q]}
+            rankings.append({
+                backend: merge_topk(([(h["row"], h["score"]) for h in results[q].get(backend, [])] for results in per_shard), k)
+                for backend in backends
+                if backend in found
+            })
+        return rankings, refs, gathered
+
+    def passages(self, rows: Iterable[int]) -> Dict[int, Tuple[str, str, dict]]:
+        """(id, text, meta) for global rows, fetched from the shards that own them; missing rows are left out."""
+        by_shard: Dict[int, List[int]] = {}
+        for row in rows:
+            for i, (lo, hi) in self.ranges.items():
+                if lo <= row < hi:
+                    by_shard.setdefault(i, []).append(int(row))
+                    break
+        if not by_shard:
+            return {}
+        try:
+            gathered = self.gather("/shard/passages", {i: {"rows": r} for i, r in by_shard.items()})
+        except ShardUnavailable:
+            logger.warning("Passage fetch failed; returning hits without text")
+            return {}
+        return {
+            p["row"]: (p["id"], p["text"], p["meta"])
+            for resp in gathered.responses
+            if resp is not None
+            for p in resp["passages"]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {" | ".join(replicas): st.as_dict() for replicas, st in zip(self.shards, self._stats)}
+
+
+@lru_cache(maxsize=1)
+def coordinator() -> Optional[ScatterGather]:
+    """The process-wide coordinator when SHARD_URLS is set, else None (single-node mode)."""
+    shards = parse_shard_urls(SHARD_URLS)
+    return ScatterGather(shards) if shards else None
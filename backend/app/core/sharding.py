@@ -0,0 +1,178 @@
+"""Row-sharded TF-IDF scoring and standalone shard indexes.
+
+`TfidfStore` scores a query batch against contiguous row ranges of its CSR
+matrix on a thread pool (sparse products and top-k selection run in C without
+the GIL), takes the top k per shard and merges them. Shards are zero-copy
+views of the (memory-mapped) matrix, so the shard count can change at any
+time without touching the index on disk.
+
+Each shard is scored as `shard @ q.T` rather than `q @ shard.T`: the
+transpose of a small query batch is cheap, while transposing the corpus
+matrix copied it on every call.
+
+For spreading an index over several processes or nodes, `split_index` writes
+each row range as a standalone index directory (own doc columns, CSR arrays
+and a copy of the global vocabulary/idf, so scores stay comparable across
+shards) plus a `shard.json` recording its global row offset. `build_shard`
+builds one such shard from its documents alone, given the shared vectorizer.
+Any shard directory can be loaded with `TfidfStore`; global row = `row_offset`
++ local row.
+
+Settings (env):
+- TFIDF_SHARDS: row shards per query batch (default: CPU count)
+- TFIDF_SHARD_MIN_ROWS: smallest shard worth a thread (default 20000), so
+  small indexes are scored in one piece
+- TFIDF_SHARD_THREADS: scoring threads shared by all stores (default: TFIDF_SHARDS)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from . import index_format
+from .topk import top_k, top_k_chunked
+
+SHARDS = int(os.getenv("TFIDF_SHARDS", str(os.cpu_count() or 1)))
+SHARD_MIN_ROWS = int(os.getenv("TFIDF_SHARD_MIN_ROWS", "20000"))
+SHARD_THREADS = int(os.getenv("TFIDF_SHARD_THREADS", str(SHARDS)))
+SHARD_FILE = "shard.json"
+
+_pool = ThreadPoolExecutor(max_workers=max(1, SHARD_THREADS), thread_name_prefix="tfidf-shard")
+
+
+def shard_bounds(n_rows: int, n_shards: int = SHARDS, min_rows: int = SHARD_MIN_ROWS) -> List[Tuple[int, int]]:
+    """Split `n_rows` into at most `n_shards` near-equal [start, end) ranges of at least `min_rows`."""
+    n = max(1, min(n_shards, n_rows // max(1, min_rows)))
+    edges = np.linspace(0, n_rows, n + 1).astype(np.int64)
+    return [(int(s), int(e)) for s, e in zip(edges[:-1], edges[1:])]
+
+
+def row_slice(matrix: sparse.csr_matrix, start: int, end: int) -> sparse.csr_matrix:
+    """Rows [start, end) of a CSR matrix sharing its data/indices (no copy, unlike `matrix[start:end]`)."""
+    lo, hi = int(matrix.indptr[start]), int(matrix.indptr[end])
+    indptr = np.asarray(matrix.indptr[start : end + 1]) - lo
+    return sparse.csr_matrix((matrix.data[lo:hi], matrix.indices[lo:hi], indptr), shape=(end - start, matrix.shape[1]), copy=False)
+
+
+class ShardedMatrix:
+    """A CSR matrix scored shard by shard on the shared thread pool."""
+
+    def __init__(self, matrix: sparse.csr_matrix, n_shards: int = SHARDS, min_rows: int = SHARD_MIN_ROWS):
+        self.matrix = matrix
+        self.bounds = shard_bounds(matrix.shape[0], n_shards, min_rows)
+        self.shards = [row_slice(matrix, s, e) for s, e in self.bounds]
+
+    def _score_shard(self, i: int, q_t, k: int, dead: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.bounds[i]
+        sims = np.asarray((self.shards[i] @ q_t).toarray().T)
+        dead = dead[(dead >= start) & (dead < end)]
+        if len(dead):
+            sims[:, dead - start] = -np.inf
+        idx, scores = top_k(sims, k)
+        return idx + start, scores
+
+    def top_k(self, q_vecs, k: int, dead: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) of the k best rows per query; `dead` rows score -inf.
+
+        Large batches are scored in question chunks (see `topk.top_k_chunked`).
+        """
+        q_vecs = sparse.csr_matrix(q_vecs)
+        return top_k_chunked(lambda start, end: self._top_k(q_vecs[start:end], k, dead), q_vecs.shape[0])
+
+    def _top_k(self, q_vecs, k: int, dead: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        q_t = sparse.csr_matrix(q_vecs.T)
+        if len(self.shards) == 1:
+            return self._score_shard(0, q_t, k, dead)
+        parts = list(_pool.map(lambda i: self._score_shard(i, q_t, k, dead), range(len(self.shards))))
+        idx = np.concatenate([p[0] for p in parts], axis=1)
+        scores = np.concatenate([p[1] for p in parts], axis=1)
+        best, top_scores = top_k(scores, k)
+        return np.take_along_axis(idx, best, axis=1), top_scores
+
+
+def merge_topk(results: Iterable[Sequence[Tuple[int, float]]], k: int) -> List[Tuple[int, float]]:
+    """Merge per-shard (row, score) lists into the global top k; ties go to the lower row."""
+    merged = [hit for hits in results for hit in hits]
+    merged.sort(key=lambda hit: (-hit[1], hit[0]))
+    return merged[:k]
+
+
+def read_shard_info(persist_dir: Path) -> Optional[Dict[str, Any]]:
+    path = Path(persist_dir) / SHARD_FILE
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+
+def write_shard(
+    shard_dir: Path,
+    docs: Iterable[Any],
+    vectorizer,
+    matrix,
+    info: Dict[str, Any],
+    tombstones: Iterable[int] = (),
+    embeddings: Optional[np.ndarray] = None,
+) -> int:
+    """Write one standalone shard index; `matrix` (and `embeddings`) hold the shard's rows in `docs` order.
+
+    Shard embeddings are searched with the exact scan; run `/embed/` with an
+    `ann` backend on the shard instance to index them.
+    """
+    from . import bm25
+    from .embedding_store import EMBEDDINGS_FILE
+    from .vector_store import index_lock, write_atomic, write_tombstones, writing
+
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    with index_lock(shard_dir):
+        n = index_format.write_docs(shard_dir, docs)
+        if n != matrix.shape[0]:
+            index_format.discard(shard_dir)
+            raise ValueError(f"Shard has {n} documents but {matrix.shape[0]} matrix rows")
+        settings = index_format.write_vectorizer(shard_dir, vectorizer)
+        index_format.write_csr(shard_dir, matrix)
+        if embeddings is not None:
+            with open(shard_dir / (EMBEDDINGS_FILE + index_format.TMP_SUFFIX), "wb") as fh:
+                np.save(fh, np.asarray(embeddings))
+        with writing(shard_dir):
+            index_format.commit(shard_dir, settings)
+            if embeddings is not None:
+                os.replace(shard_dir / (EMBEDDINGS_FILE + index_format.TMP_SUFFIX), shard_dir / EMBEDDINGS_FILE)
+            write_tombstones(shard_dir, tombstones)
+            write_atomic(shard_dir / SHARD_FILE, json.dumps({**info, "rows": n}))
+            bm25.sync(shard_dir)
+    return n
+
+
+def build_shard(shard_dir: Path, docs: Sequence[Any], vectorizer, info: Dict[str, Any]) -> int:
+    """Build a shard from its own documents, transformed with the shared (already fitted) vectorizer."""
+    return write_shard(shard_dir, docs, vectorizer, vectorizer.transform([d.text for d in docs]), info)
+
+
+def split_index(index_dir: Path, out_dir: Path, n_shards: int) -> List[Path]:
+    """Write the rows of `index_dir` (and its embeddings) as `n_shards` standalone shard indexes under `out_dir`."""
+    from .embedding_store import EMBEDDINGS_FILE
+    from .vector_store import TfidfStore
+
+    store = TfidfStore(index_dir)
+    store._load()
+    n_rows = store.matrix.shape[0]
+    dead = store.tombstones
+    npy = Path(index_dir) / EMBEDDINGS_FILE
+    embs = np.load(npy, mmap_mode="r") if npy.exists() else None
+    bounds = shard_bounds(n_rows, n_shards, min_rows=1)
+    paths = []
+    for i, (start, end) in enumerate(bounds):
+        shard_dir = Path(out_dir) / f"shard-{i:02d}"
+        info = {"shard": i, "shards": len(bounds), "row_offset": start, "source_generation": store.generation}
+        local_dead = (dead[(dead >= start) & (dead < end)] - start).tolist()
+        docs = store.docs[start:end]
+        shard_embs = embs[start:end] if embs is not None and len(embs) >= end else None
+        write_shard(shard_dir, docs, store.vectorizer, row_slice(store.matrix, start, end), info, local_dead, shard_embs)
+        paths.append(shard_dir)
+    return paths
@@ -0,0 +1,62 @@
+"""Top-k selection shared by every retriever.
+
+`np.argpartition` finds the k best scores in O(N); only those k are then
+sorted, instead of sorting all N document scores per query.
+
+Dense scoring builds a (questions x rows) score matrix, so `top_k_chunked`
+scores a large question batch SCORE_QUERY_CHUNK questions at a time (default
+256) and keeps only each chunk's top k: memory stays at chunk x rows however
+many questions are sent.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Callable, Tuple
+
+import numpy as np
+
+QUERY_CHUNK = int(os.getenv("SCORE_QUERY_CHUNK", "256"))
+
+
+def top_k(scores, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return `(indices, values)` of the k highest scores, best first.
+
+    `scores` may be 1-D (one query) or 2-D (one row per query); the output has
+    the same number of dimensions with the last axis truncated to
+    `min(k, n_docs)`. Sparse matrices and `np.matrix` rows are densified.
+    """
+    if hasattr(scores, "toarray"):
+        scores = scores.toarray()
+    scores = np.asarray(scores)
+    if scores.ndim not in (1, 2):
+        raise ValueError(f"top_k expects a 1-D or 2-D score array, got shape {scores.shape}")
+    n = scores.shape[-1]
+    k = max(0, min(int(k), n))
+    if k == 0:
+        empty = scores[..., :0]
+        return empty.astype(np.int64), empty
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape)
+    part_vals = np.take_along_axis(scores, part, axis=-1)
+    # Stable sort keeps the order of tied winners deterministic
+    order = np.argsort(-part_vals, axis=-1, kind="stable")
+    idx = np.take_along_axis(part, order, axis=-1)
+    return idx, np.take_along_axis(part_vals, order, axis=-1)
+
+
+def top_k_chunked(
+    score: Callable[[int, int], Tuple[np.ndarray, np.ndarray]], n_queries: int, chunk: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack `score(start, end)` -> (indices, values) over question chunks of `[0, n_queries)`.
+
+    `score` returns the top k of questions [start, end) (e.g. via `top_k`);
+    only one chunk's full score matrix exists at a time.
+    """
+    chunk = max(1, chunk or QUERY_CHUNK)
+    if n_queries <= chunk:
+        return score(0, n_queries)
+    parts = [score(start, min(start + chunk, n_queries)) for start in range(0, n_queries, chunk)]
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
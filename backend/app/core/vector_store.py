@@ -1,12 +1,147 @@
 from __future__ import annotations
 
 import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from . import index_format
+from .index_format import DocTable, read_format
+from .query_cache import cached_batch, passages, retrieval_results
+from .sharding import ShardedMatrix
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore
+
+
+GENERATION_FILE = "GENERATION"
+TOMBSTONES_FILE = "tombstones.json"
+LOCK_FILE = "index.lock"
+# Separator between documents in legacy texts.txt indexes (see index_format.py)
+LEGACY_TEXT_SEP = "\n\n"
+
+
+def write_atomic(path: Path, data) -> None:
+    """Write `data` (str or bytes) to a uniquely named temp file and rename it over `path`."""
+    raw = data if isinstance(data, bytes) else data.encode("utf-8")
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + ".", suffix=".tmp", delete=False) as fh:
+        fh.write(raw)
+    try:
+        os.replace(fh.name, path)
+    except BaseException:
+        os.unlink(fh.name)
+        raise
+
+
+def read_generation(persist_dir: Path) -> Optional[str]:
+    """Return the index generation marker for `persist_dir`.
+
+    Writers bump the marker to an odd number before replacing index files and to
+    the next even number once every file is in place, so readers can tell a
+    finished index from one that is being rewritten. Legacy indexes written
+    before the marker existed fall back to an mtime/size signature of their files.
+    Returns None when no index is present.
+    """
+    persist_dir = Path(persist_dir)
+    marker = persist_dir / GENERATION_FILE
+    try:
+        return marker.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        pass
+    sig = []
+    for name in index_format.LEGACY_FILES:
+        try:
+            st = (persist_dir / name).stat()
+        except FileNotFoundError:
+            return None
+        sig.append(f"{st.st_mtime_ns}:{st.st_size}")
+    return "legacy-" + "-".join(sig)
+
+
+def generation_is_stable(generation: Optional[str]) -> bool:
+    """True unless a writer is midway through replacing the index files."""
+    if generation is None:
+        return False
+    if generation.isdigit():
+        return int(generation) % 2 == 0
+    return True
+
+
+def bump_generation(persist_dir: Path) -> int:
+    current = read_generation(persist_dir)
+    n = int(current) if current is not None and current.isdigit() else 0
+    n += 1
+    write_atomic(Path(persist_dir) / GENERATION_FILE, str(n))
+    return n
+
+
+# Index dirs whose lock this thread already holds, with the nesting depth
+_held = threading.local()
+
+
+@contextmanager
+def index_lock(persist_dir: Path):
+    """Exclusive cross-process lock held for the whole of an index mutation.
+
+    Serializes writers (ingestion, builds, compaction, embedding builds) across
+    threads and worker processes; readers never take it and rely on
+    `writing()` instead. Reentrant within a thread, so one mutation may call
+    another.
+    """
+    persist_dir = Path(persist_dir)
+    persist_dir.mkdir(parents=True, exist_ok=True)
+    key = str(persist_dir.resolve())
+    depth = _held.__dict__.setdefault("depth", {})
+    if depth.get(key):
+        depth[key] += 1
+        try:
+            yield
+        finally:
+            depth[key] -= 1
+        return
+    with open(persist_dir / LOCK_FILE, "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        depth[key] = 1
+        try:
+            yield
+        finally:
+            depth[key] = 0
+
+
+@contextmanager
+def writing(persist_dir: Path):
+    """Bracket an index mutation with odd/even generation bumps.
+
+    Yields a one-element list that receives the final (even) generation.
+    """
+    bump_generation(persist_dir)
+    result: List[str] = []
+    try:
+        yield result
+    finally:
+        result.append(str(bump_generation(persist_dir)))
+
+
+def read_tombstones(persist_dir: Path) -> np.ndarray:
+    """Sorted row indices that have been deleted but not yet compacted away."""
+    path = Path(persist_dir) / TOMBSTONES_FILE
+    if not path.exists():
+        return np.zeros(0, dtype=np.int64)
+    return np.array(sorted(json.loads(path.read_text(encoding="utf-8"))), dtype=np.int64)
+
+
+def write_tombstones(persist_dir: Path, rows: Iterable[int]) -> None:
+    write_atomic(Path(persist_dir) / TOMBSTONES_FILE, json.dumps(sorted(int(r) for r in rows)))
 
 
 @dataclass
@@ -16,52 +151,312 @@ class Document:
     meta: dict
 
 
+class PassageTable:
+    """Lazy, read-only `List[Document]` over the on-disk doc columns.
+
+    Scoring only needs row numbers, so nothing is decoded until a row is
+    read; rows read for results go through the process-wide `passages` LRU.
+    `factory` builds the record type (`Document` or `TextRecord`).
+    """
+
+    def __init__(self, persist_dir: Path, generation: Optional[str], factory: Callable = Document):
+        self.table = DocTable(persist_dir)
+        self.factory = factory
+        # Rows are only stable within one finished generation
+        self._key = (str(Path(persist_dir)), generation) if generation_is_stable(generation) else None
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _row(self, row: int) -> int:
+        n = len(self)
+        if not -n <= row < n:
+            raise IndexError(row)
+        return row + n if row < 0 else row
+
+    def _fields(self, row: int) -> Tuple[str, str, dict]:
+        key = self._key + (row,) if self._key is not None else None
+        fields = passages.get(key) if key is not None else None
+        if fields is None:
+            fields = (self.table.id(row), self.table.text(row), self.table.meta(row))
+            if key is not None:
+                passages.put(key, fields)
+        return fields
+
+    def __getitem__(self, row: Union[int, slice]):
+        if isinstance(row, slice):
+            return [self._read(i) for i in range(*row.indices(len(self)))]
+        return self.factory(*self._fields(self._row(row)))
+
+    def _read(self, row: int):
+        # Bulk reads (builds, compaction) bypass the LRU so they don't evict hot passages
+        return self.factory(self.table.id(row), self.table.text(row), self.table.meta(row))
+
+    def __iter__(self) -> Iterator:
+        return (self._read(i) for i in range(len(self)))
+
+    def get(self, row: int, include_text: bool = True):
+        """Record for `row`; without `include_text` only the id and metadata are read."""
+        if include_text:
+            return self[row]
+        row = self._row(row)
+        return self.factory(self.table.id(row), "", self.table.meta(row))
+
+
+def load_passages(persist_dir: Path, generation: Optional[str], factory: Callable = Document) -> Sequence:
+    """Stored documents in row order: a lazy `PassageTable`, or a list for legacy indexes."""
+    if read_format(persist_dir) is not None:
+        return PassageTable(persist_dir, generation, factory)
+    return [factory(d.id, d.text, d.meta) for d in read_documents(persist_dir)]
+
+
+def get_document(docs: Sequence, row: int, include_text: bool = True):
+    """`docs[row]`, optionally with an empty text (never read from disk for a `PassageTable`)."""
+    if isinstance(docs, PassageTable):
+        return docs.get(row, include_text)
+    doc = docs[row]
+    return doc if include_text else type(doc)(doc.id, "", doc.meta)
+
+
+def read_documents(persist_dir: Path) -> List[Document]:
+    """All stored documents in row order, from either index format."""
+    persist_dir = Path(persist_dir)
+    if read_format(persist_dir) is not None:
+        table = DocTable(persist_dir)
+        return [Document(id=table.id(i), text=table.text(i), meta=table.meta(i)) for i in range(len(table))]
+    texts_file = persist_dir / "texts.txt"
+    if not texts_file.exists():
+        return []
+    texts = texts_file.read_text(encoding="utf-8").split(LEGACY_TEXT_SEP)
+    meta_file = persist_dir / "docs.json"
+    metas = json.loads(meta_file.read_text(encoding="utf-8")) if meta_file.exists() else []
+    if len(metas) != len(texts):
+        # Metadata missing or out of step with the texts: positional ids
+        metas = [{"id": str(i), "meta": {}} for i in range(len(texts))]
+    return [Document(id=m.get("id", str(i)), text=t, meta=m.get("meta", {})) for i, (m, t) in enumerate(zip(metas, texts))]
+
+
 class TfidfStore:
     def __init__(self, persist_dir: Path):
         self.persist_dir = Path(persist_dir)
         self.persist_dir.mkdir(parents=True, exist_ok=True)
         self.vectorizer: TfidfVectorizer | None = None
         self.matrix = None
-        self.docs: List[Document] = []
+        # A list while building in memory; a lazy PassageTable once loaded from disk
+        self.docs: Sequence[Document] = []
+        # Rows deleted since the last full build/compaction; excluded from results
+        self.tombstones = np.zeros(0, dtype=np.int64)
+        self.generation: Optional[str] = None
+        self._sharded: Optional[ShardedMatrix] = None
 
     def add_texts(self, docs: List[Document]):
         self.docs.extend(docs)
 
-    def build(self):
-        texts = [d.text for d in self.docs]
-        self.vectorizer = TfidfVectorizer(
+    @staticmethod
+    def _new_vectorizer() -> TfidfVectorizer:
+        return TfidfVectorizer(
             lowercase=True,
             stop_words="english",
             max_features=50000,
             ngram_range=(1, 2),
         )
+
+    def build(self):
+        texts = [d.text for d in self.docs]
+        self.vectorizer = self._new_vectorizer()
         self.matrix = self.vectorizer.fit_transform(texts)
         self._save()
 
-    def query(self, q: str, k: int = 5) -> List[Tuple[Document, float]]:
+    def build_streaming(self, docs: Iterable[Document], before_commit: Optional[Callable[[], None]] = None) -> int:
+        """Build the index from a (lazy) stream of documents with flat memory use.
+
+        Each document is appended to temporary doc columns as it arrives; the
+        vectorizer is then fitted by streaming the texts back from disk, so
+        only the sparse matrix is ever resident. Returns the document count; an
+        empty stream leaves the existing index untouched.
+        `before_commit` runs inside the generation bracket just before the new
+        files replace the old ones (e.g. to remove data keyed by the old rows).
+        """
+        with index_lock(self.persist_dir):
+            n = index_format.write_docs(self.persist_dir, docs)
+            if n == 0:
+                index_format.discard(self.persist_dir)
+                return 0
+
+            vectorizer = self._new_vectorizer()
+            texts = index_format.Blob(self.persist_dir, "texts", index_format.TMP_SUFFIX)
+            matrix = vectorizer.fit_transform(iter(texts))
+            del texts
+            settings = index_format.write_vectorizer(self.persist_dir, vectorizer)
+            index_format.write_csr(self.persist_dir, matrix)
+
+            with writing(self.persist_dir) as gen:
+                if before_commit is not None:
+                    before_commit()
+                index_format.commit(self.persist_dir, settings)
+                write_tombstones(self.persist_dir, [])
+                self._sync_derived()
+        self.generation = gen[0]
+        # Nothing stays resident here; the next query (or the registry) loads the new index
+        self.docs, self.vectorizer, self.matrix = [], None, None
+        self.tombstones = np.zeros(0, dtype=np.int64)
+        return n
+
+    def update(self, add: Iterable[Document] = (), remove_rows: Iterable[int] = ()) -> List[int]:
+        """Append documents and tombstone rows without refitting the vectorizer.
+
+        New rows are transformed with the existing vocabulary/idf and appended in
+        place to the doc columns and the CSR arrays. Removed rows stay on disk,
+        hidden from results until `compact()`. A legacy index is first rewritten
+        in the current format. Returns the row numbers assigned to the added
+        documents.
+        """
+        add = list(add)
+        with index_lock(self.persist_dir):
+            self._load_current()
+            self.upgrade()
+            first = self.matrix.shape[0]
+            rows = list(range(first, first + len(add)))
+            dead = set(self.tombstones.tolist()) | {int(r) for r in remove_rows}
+            new_rows = self.vectorizer.transform([d.text for d in add]) if add else None
+
+            with writing(self.persist_dir) as gen:
+                if add:
+                    index_format.append_docs(self.persist_dir, add)
+                    index_format.append_csr(self.persist_dir, new_rows)
+                    self._sync_derived(appended_from=first)
+                write_tombstones(self.persist_dir, dead)
+        self.generation = gen[0]
+        if add:
+            self.matrix = index_format.load_csr(self.persist_dir, len(self.vectorizer.vocabulary_))
+            self.docs = load_passages(self.persist_dir, self.generation)
+        self.tombstones = np.array(sorted(dead), dtype=np.int64)
+        return rows
+
+    def upgrade(self) -> bool:
+        """Rewrite a legacy index in the current format without refitting.
+
+        Row numbers and tombstones are kept. Returns False when the index is
+        already current.
+        """
+        with index_lock(self.persist_dir):
+            if read_format(self.persist_dir) is not None:
+                return False
+            self._load_current()
+            with writing(self.persist_dir) as gen:
+                self._write()
+                self._sync_derived()
+        self.generation = gen[0]
+        return True
+
+    def compact(self, before_commit: Optional[Callable[[np.ndarray], None]] = None) -> np.ndarray:
+        """Drop tombstoned rows and refit the vectorizer over the live documents.
+
+        Returns an array mapping each old row to its new row (-1 if dropped), so
+        callers can renumber anything keyed by row. `before_commit` receives
+        that array inside the generation bracket that publishes the new rows
+        (see `build_streaming`), so row-keyed data can be renumbered in step.
+        """
+        with index_lock(self.persist_dir):
+            self._load_current()
+            n_rows = len(self.docs)
+            live = np.ones(n_rows, dtype=bool)
+            live[self.tombstones[self.tombstones < n_rows]] = False
+            row_map = np.full(n_rows, -1, dtype=np.int64)
+            row_map[live] = np.arange(int(live.sum()))
+            # Streamed from the old doc columns into the new ones
+            self.build_streaming(
+                (d for d, keep in zip(self.docs, live) if keep),
+                before_commit=(lambda: before_commit(row_map)) if before_commit is not None else None,
+            )
+        return row_map
+
+    def live_mask(self) -> np.ndarray:
+        mask = np.ones(len(self.docs), dtype=bool)
+        mask[self.tombstones[self.tombstones < len(mask)]] = False
+        return mask
+
+    def query(self, q: str, k: int = 5, include_text: bool = True) -> List[Tuple[Document, float]]:
+        return self.query_batch([q], k=k, include_text=include_text)[0]
+
+    def query_batch(self, qs: List[str], k: int = 5, include_text: bool = True) -> List[List[Tuple[Document, float]]]:
+        """Score many questions with one transform and one sparse matrix product.
+
+        Only the top-k rows are read from disk; with `include_text=False` their
+        text is left empty and never read.
+        """
+        return [[(get_document(self.docs, i, include_text), s) for i, s in rows] for rows in self.search_rows(qs, k)]
+
+    def search_rows(self, qs: List[str], k: int = 5) -> List[List[Tuple[int, float]]]:
+        """Like `query_batch` but returns (row, score) pairs; rows index `docs` and the embedding matrix alike."""
         if not self.vectorizer or self.matrix is None:
             self._load()
-        q_vec = self.vectorizer.transform([q])
-        sims = cosine_similarity(q_vec, self.matrix)[0]
-        top_idx = sims.argsort()[::-1][:k]
-        return [(self.docs[i], float(sims[i])) for i in top_idx]
+        if not qs:
+            return []
+        # Results are cached per index generation; unsaved in-memory stores are not cached
+        cacheable = self.generation is not None and generation_is_stable(self.generation)
+        prefix = ("tfidf", str(self.persist_dir), self.generation, k)
+        keys = [prefix + (q,) if cacheable else None for q in qs]
+        return cached_batch(retrieval_results, keys, lambda missing: self._score_batch([qs[i] for i in missing], k))
+
+    def _shards(self) -> ShardedMatrix:
+        # Shard views are rebuilt whenever the matrix is replaced (load, update, build)
+        if self._sharded is None or self._sharded.matrix is not self.matrix:
+            self._sharded = ShardedMatrix(self.matrix)
+        return self._sharded
+
+    def _score_batch(self, qs: List[str], k: int) -> List[List[Tuple[int, float]]]:
+        q_vecs = self.vectorizer.transform(qs)
+        # Rows of both sides are L2-normalized by the vectorizer, so the dot product is the cosine;
+        # row shards are scored in parallel (see sharding.py)
+        top_idx, top_scores = self._shards().top_k(q_vecs, k, self.tombstones)
+        return [
+            [(int(i), float(s)) for i, s in zip(row_idx, row_scores) if np.isfinite(s)]
+            for row_idx, row_scores in zip(top_idx, top_scores)
+        ]
+
+    # Persistence: see index_format.py for the on-disk layout
+    def _sync_derived(self, appended_from: Optional[int] = None) -> None:
+        # The BM25 index (if in use) is derived from the same rows; updated in the writer's
+        # generation bracket so it is never behind the doc columns. Appends only index the new rows.
+        from . import bm25
+
+        bm25.sync(self.persist_dir, appended_from)
+
+    def _write(self) -> None:
+        index_format.write_docs(self.persist_dir, self.docs)
+        settings = index_format.write_vectorizer(self.persist_dir, self.vectorizer)
+        index_format.write_csr(self.persist_dir, self.matrix)
+        index_format.commit(self.persist_dir, settings)
 
-    # Persistence as simple JSON + sklearn internal pickles via vectorizer vocabulary
     def _save(self):
-        meta = [{"id": d.id, "meta": d.meta} for d in self.docs]
-        (self.persist_dir / "docs.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2))
-        (self.persist_dir / "texts.txt").write_text("\n\n".join(d.text for d in self.docs))
-        # Save vectorizer vocabulary
-        import joblib
+        # Odd generation while files are being swapped; readers keep their old copy
+        with index_lock(self.persist_dir), writing(self.persist_dir) as gen:
+            self._write()
+            write_tombstones(self.persist_dir, [])
+            self._sync_derived()
+        self.generation = gen[0]
+        self.tombstones = np.zeros(0, dtype=np.int64)
 
-        joblib.dump(self.vectorizer, self.persist_dir / "vectorizer.joblib")
-        joblib.dump(self.matrix, self.persist_dir / "matrix.joblib")
+    def _load_current(self) -> None:
+        # Writers hold `index_lock`: anything another writer committed since our last load is reloaded
+        if not self.vectorizer or self.matrix is None or self.generation != read_generation(self.persist_dir):
+            self._load()
 
     def _load(self):
+        self.generation = read_generation(self.persist_dir)
+        fmt = read_format(self.persist_dir)
+        self.docs = load_passages(self.persist_dir, self.generation)
+        if fmt is None:
+            self._load_legacy()
+        else:
+            self.vectorizer = index_format.load_vectorizer(self.persist_dir, fmt["vectorizer"])
+            # Memory-mapped CSR arrays: nothing is copied until rows are touched
+            self.matrix = index_format.load_csr(self.persist_dir, len(self.vectorizer.vocabulary_))
+        self.tombstones = read_tombstones(self.persist_dir)
+
+    def _load_legacy(self):
         import joblib
 
-        docs_meta = json.loads((self.persist_dir / "docs.json").read_text())
-        texts = (self.persist_dir / "texts.txt").read_text().split("\n\n")
-        self.docs = [Document(id=m["id"], meta=m["meta"], text=t) for m, t in zip(docs_meta, texts)]
         self.vectorizer = joblib.load(self.persist_dir / "vectorizer.joblib")
         self.matrix = joblib.load(self.persist_dir / "matrix.joblib")
@@ -1,12 +1,34 @@
-from fastapi import FastAPI
-from pathlib import Path
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 import os
+import threading
 
 from .core import llm as _llm
+from .core import query_cache
+from .core.answer_cache import answer_cache
+from .core.encoder_registry import registry as encoder_registry
+from .core.executor import Overloaded, inference_executor, retrieval_executor
+from .core.index_format import has_index
+from .core.index_registry import INDEX_DIR
+from .core.preload import component_report, preload, readiness
+from .core.scatter_gather import coordinator
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import ingest, query, generate, embed, hybrid, warm, generate_stream
+from .routers import ingest, query, generate, embed, hybrid, warm, generate_stream, admin, shard
 
-app = FastAPI(title="Legal RAG Backend", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load index, encoder and LLM before traffic arrives; /health gates on it (see core/preload.py)
+    if readiness.mode == "blocking":
+        await run_in_threadpool(preload, INDEX_DIR)
+    elif readiness.mode == "background":
+        threading.Thread(target=preload, args=(INDEX_DIR,), name="preload", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="Legal RAG Backend", version="0.1.0", lifespan=lifespan)
 
 # Allow local dev and mobile emulator
 app.add_middleware(
@@ -24,6 +46,17 @@ app.include_router(embed.router, prefix="/embed", tags=["embed"])
 app.include_router(hybrid.router, prefix="/hybrid", tags=["hybrid"])
 app.include_router(warm.router, prefix="/warm", tags=["warm"])
 app.include_router(generate_stream.router, prefix="/generate_stream", tags=["generate_stream"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+app.include_router(shard.router, prefix="/shard", tags=["shard"])
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # Shed load quickly instead of letting requests pile up behind busy workers
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "pool": exc.pool},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 @app.get("/")
 def root():
@@ -32,15 +65,35 @@ def root():
 
 @app.get("/health")
 def health():
-    """Health endpoint for readiness checks.
+    """Readiness endpoint.
 
-    - index_ready: True if any files exist under `app/index`
-    - model_ready: True if OPENAI_API_KEY is set or local HF tokenizer is available
+    Returns 503 with status "starting" while components are still preloading,
+    then 200 with status "ok" (every component ready or not applicable) or
+    "degraded" (a component failed to load). `components` lists each
+    component's state, load time in seconds and detail.
     """
-    # Check index dir located under backend/app/index
-    idx = Path(__file__).resolve().parent / "index"
-    index_ready = idx.exists() and any(idx.iterdir())
-    # model readiness: either OpenAI API key present or HF tokenizer available
-    model_ready = bool(os.getenv("OPENAI_API_KEY")) or (getattr(_llm, "AutoTokenizer", None) is not None)
-    status = "ok" if index_ready and model_ready else "degraded" if index_ready else "starting"
-    return {"status": status, "index_ready": index_ready, "model_ready": model_ready}
+    components = component_report(INDEX_DIR)
+    failed = [name for name, c in components.items() if c["state"] == "failed"]
+    if readiness.loading:
+        status = "starting"
+    else:
+        status = "degraded" if failed else "ok"
+    # Without preloading, fall back to what is on disk / already loaded
+    index_ready = components["index"]["state"] == "ready" or (
+        readiness.mode == "off" and has_index(INDEX_DIR)
+    )
+    model_ready = bool(os.getenv("OPENAI_API_KEY")) or components["llm"]["state"] == "ready" or _llm.model_loaded()
+    body = {
+        "status": status,
+        "index_ready": index_ready,
+        "model_ready": model_ready,
+        "components": components,
+        "pools": {"inference": inference_executor.stats(), "retrieval": retrieval_executor.stats()},
+        "batching": _llm.batch_stats(),
+        "answer_cache": answer_cache.stats(),
+        "query_cache": query_cache.stats(),
+        "encoders": encoder_registry.stats(),
+    }
+    if coordinator() is not None:
+        body["shards"] = coordinator().stats()
+    return JSONResponse(status_code=503 if status == "starting" else 200, content=body)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+import logging
+from ..core import llm
+
+logger = logging.getLogger("admin")
+
+router = APIRouter()
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+
+class SwapRequest(BaseModel):
+    # HF model id or local path (e.g. a checkpoint written by scripts/merge_lora_adapter.py); default LLM_MODEL
+    model: Optional[str] = None
+    # PEFT adapter dir merged into `model` at load time
+    adapter: Optional[str] = None
+    # Seconds to wait for in-flight generations before giving up
+    drain_timeout: float = 60.0
+
+
+def _check_token(token: Optional[str]) -> None:
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.get("/model")
+def model_status(x_admin_token: Optional[str] = Header(None)) -> dict:
+    _check_token(x_admin_token)
+    return llm.model_status()
+
+
+@router.post("/model")
+async def swap_model(req: SwapRequest, x_admin_token: Optional[str] = Header(None)) -> dict:
+    """Load a new model next to the current one, drain in-flight generations, then switch."""
+    _check_token(x_admin_token)
+    try:
+        result = await run_in_threadpool(llm.swap_model, req.model, req.adapter, req.drain_timeout)
+    except (TimeoutError, llm.SwapInProgress) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info("Model swap: %s", result)
+    return result
@@ -1,35 +1,103 @@
 from __future__ import annotations
 
-from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 import logging
+import threading
+from dataclasses import asdict, replace
+from ..core.embed_build import EmbedBuildSettings, read_status
 from ..core.embedding_store import EmbeddingStore, TextRecord
+from ..core.index_registry import INDEX_DIR
 
 logger = logging.getLogger("embed")
 
 router = APIRouter()
 
-INDEX_DIR = Path(__file__).resolve().parents[1] / "index"
+
+# One build at a time per worker; a second request gets 409 instead of racing the first
+_build_lock = threading.Lock()
 
 
 class EmbedRequest(BaseModel):
 	force: bool = False
+	# ANN backend: "exact", "hnsw" or "ivfpq"; None keeps the current one
+	ann: Optional[str] = None
+	# Build params, e.g. {"M": 16, "ef_construction": 200} or {"nlist": 1024, "m": 16}
+	ann_params: Dict[str, Any] = {}
+	# Overrides for EMB_BUILD_WORKERS / EMB_BATCH_SIZE / EMB_SHARD_SIZE / EMB_THREADS_PER_WORKER
+	workers: Optional[int] = None
+	batch_size: Optional[int] = None
+	shard_size: Optional[int] = None
+	threads_per_worker: Optional[int] = None
+	# Return immediately and poll /embed/status instead of blocking until done
+	background: bool = False
 
 
 class EmbedResponse(BaseModel):
 	count: int
+	state: str = "done"
+
+
+class EmbedStatusResponse(BaseModel):
+	state: str
+	total: int
+	done: int
+	shards_total: int
+	shards_done: int
+	resumed_shards: int
+	workers: int
+	started_at: Optional[float] = None
+	updated_at: Optional[float] = None
+	eta_seconds: Optional[float] = None
+	error: Optional[str] = None
+
+
+def _settings(req: EmbedRequest) -> EmbedBuildSettings:
+	overrides = {
+		name: getattr(req, name)
+		for name in ("workers", "batch_size", "shard_size", "threads_per_worker")
+		if getattr(req, name) is not None
+	}
+	return replace(EmbedBuildSettings(), **overrides)
+
+
+def _run_build(req: EmbedRequest) -> int:
+	try:
+		store = EmbeddingStore(INDEX_DIR)
+		return store.build(force=req.force, ann=req.ann, ann_params=req.ann_params, settings=_settings(req))
+	finally:
+		_build_lock.release()
+
+
+def _run_build_logged(req: EmbedRequest) -> None:
+	try:
+		n = _run_build(req)
+		logger.info("Background embedding build finished: %d records", n)
+	except Exception:
+		logger.exception("Background embedding build failed")
 
 
 @router.post("/")
 def embed(req: EmbedRequest) -> EmbedResponse:
-	store = EmbeddingStore(INDEX_DIR)
+	if not _build_lock.acquire(blocking=False):
+		raise HTTPException(status_code=409, detail="An embedding build is already running; see /embed/status")
+	if req.background:
+		threading.Thread(target=_run_build_logged, args=(req,), name="embed-build", daemon=True).start()
+		return EmbedResponse(count=0, state="running")
 	try:
-		n = store.build(force=req.force)
+		n = _run_build(req)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
 	except RuntimeError as e:
 		raise HTTPException(status_code=500, detail=str(e))
 	return EmbedResponse(count=n)
 
+
+@router.get("/status")
+def embed_status() -> EmbedStatusResponse:
+	"""Progress of the current/last embedding build (shared across workers via the index dir)."""
+	return EmbedStatusResponse(**asdict(read_status(INDEX_DIR)))
+
@@ -1,17 +1,19 @@
 from __future__ import annotations
-from pathlib import Path
 from typing import List
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 import logging
-from ..core.vector_store import TfidfStore
+from ..core.answer_cache import answer_cache
+from ..core.context_packer import pack_contexts
+from ..core.embedding_store import EMBEDDINGS_FILE
+from ..core.executor import inference_executor, retrieval_executor
+from ..core.index_registry import INDEX_DIR, get_embedding_store, get_tfidf_store
 from ..core import llm
 
 logger = logging.getLogger("generate")
 
 router = APIRouter()
-INDEX_DIR = Path(__file__).resolve().parents[1] / "index"
 
 class GenerateRequest(BaseModel):
     question: str
@@ -24,23 +26,47 @@ class GenerateResponse(BaseModel):
     tokens_in: int
     tokens_out: int
     prompt_tokens: int
+    cached: bool = False
+    # Token budget and per-passage full/trimmed/dropped decisions
+    packing: dict = {}
+
+def _retrieve(question: str, k: int):
+    store = get_tfidf_store(INDEX_DIR)
+    results = store.query(question, k=k)
+    # Fit passages into the input budget so the question is never truncated
+    packed = pack_contexts(question, results)
+    embedding = None
+    # Question embedding for near-duplicate cache lookups, only when an encoder is already in use
+    if answer_cache.semantic_threshold > 0 and (INDEX_DIR / EMBEDDINGS_FILE).exists():
+        emb_store = get_embedding_store(INDEX_DIR)
+        if emb_store.model is not None:
+            embedding = emb_store.encode_queries([question])[0]
+    return packed, store.generation, embedding
 
 @router.post("/")
-def generate_answer(req: GenerateRequest) -> GenerateResponse:
+async def generate_answer(req: GenerateRequest) -> GenerateResponse:
     q = req.question.strip()
     if not q:
         raise HTTPException(status_code=400, detail="Empty question")
 
     # Retrieve
-    store = TfidfStore(INDEX_DIR)
-    results = store.query(q, k=req.top_k)
-    contexts = [d.text for d, _ in results]
-
     try:
-        gen = llm.generate(q, contexts)
-    except RuntimeError as e:
-        # Likely missing deps
-        raise HTTPException(status_code=500, detail=str(e))
+        packed, generation, embedding = await retrieval_executor.run(_retrieve, q, req.top_k)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    contexts = packed.contexts
+    context_ids = packed.context_keys()
+
+    gen = answer_cache.get(q, context_ids, generation, embedding)
+    cached = gen is not None
+    if gen is None:
+        # Batched with concurrent requests; batches run on the bounded inference pool, a full pool raises Overloaded (503)
+        try:
+            gen = await llm.agenerate(q, contexts, submit=inference_executor.submit)
+        except RuntimeError as e:
+            # Likely missing deps
+            raise HTTPException(status_code=500, detail=str(e))
+        answer_cache.put(q, context_ids, generation, gen, embedding)
 
     return GenerateResponse(
         answer=gen.completion,
@@ -49,4 +75,6 @@ def generate_answer(req: GenerateRequest) -> GenerateResponse:
         tokens_in=gen.tokens_in,
         tokens_out=gen.tokens_out,
         prompt_tokens=gen.usage["prompt_tokens"],
+        cached=cached,
+        packing=packed.report(),
     )
@@ -1,16 +1,20 @@
 from __future__ import annotations
 
+import json
+import threading
 from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 
-from ..core.llm import generate, GenerationResult
-from ..core.vector_store import TfidfStore
+from ..core.context_packer import pack_contexts
+from ..core.executor import inference_executor, retrieval_executor
+from ..core.llm import generate_stream, GenerationResult
+from ..core.index_registry import INDEX_DIR, get_tfidf_store
 
 router = APIRouter()
-INDEX_DIR = __import__("pathlib").Path(__file__).resolve().parents[1] / "index"
 
 
 class StreamRequest(BaseModel):
@@ -18,22 +22,60 @@ class StreamRequest(BaseModel):
 	top_k: int = 3
 
 
+def _sse(payload: dict) -> str:
+	return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
 @router.post("/")
-def stream_generate(req: StreamRequest):
+async def stream_generate(req: StreamRequest, request: Request):
+	"""Server-sent events: one `{"delta": ...}` event per decoded token chunk, then a
+	final `{"done": true, "usage": ..., "contexts": [...], "packing": {...}}` event.
+
+	Generation stops at the next token when the client disconnects.
+	"""
 	q = req.question.strip()
 	if not q:
 		raise HTTPException(status_code=400, detail="Empty question")
 
-	store = TfidfStore(INDEX_DIR)
-	results = store.query(q, k=req.top_k)
-	contexts = [d.text for d, _ in results]
+	def _retrieve():
+		results = get_tfidf_store(INDEX_DIR).query(q, k=req.top_k)
+		return results, pack_contexts(q, results)
 
-	# This is a simple non-incremental stream; for real streaming attach to model's streamer
-	gen = generate(q, contexts)
+	try:
+		results, packed = await retrieval_executor.run(_retrieve)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	contexts = packed.contexts
+	context_meta = [{"id": d.id, "score": score, "meta": d.meta} for d, score in results]
 
-	def iter_func():
-		# Send a small SSE-like stream
-		yield f"data: {gen.completion}\n\n"
+	cancel = threading.Event()
+	# The local model.generate call holds an inference slot for the whole stream
+	events = generate_stream(q, contexts, cancel=cancel, submit=inference_executor.submit)
+	try:
+		# Pull the first event here so missing deps (500) and a full pool (503) surface
+		# as status codes, not a broken stream
+		first = await run_in_threadpool(next, events, None)
+	except RuntimeError as e:
+		raise HTTPException(status_code=500, detail=str(e))
 
-	return StreamingResponse(iter_func(), media_type="text/event-stream")
+	def _chain():
+		if first is not None:
+			yield first
+		yield from events
+
+	async def iter_func():
+		try:
+			async for event in iterate_in_threadpool(_chain()):
+				if await request.is_disconnected():
+					cancel.set()
+					break
+				if event.get("done"):
+					event = {**event, "contexts": context_meta, "packing": packed.report()}
+				yield _sse(event)
+		except RuntimeError as e:
+			# Missing deps or a failed generation: report in-band, the 200 header is already sent
+			yield _sse({"error": str(e)})
+		finally:
+			cancel.set()
 
+	return StreamingResponse(iter_func(), media_type="text/event-stream")
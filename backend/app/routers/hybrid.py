@@ -1,46 +1,122 @@
 from __future__ import annotations
 
-from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 import logging
-from ..core.vector_store import TfidfStore
+from ..core.executor import MAX_BATCH_QUESTIONS, retrieval_executor
 from ..core.hybrid import HybridRetriever
+from ..core.scatter_gather import ShardUnavailable
+from ..core.index_registry import INDEX_DIR
 
 logger = logging.getLogger("hybrid")
 
 router = APIRouter()
-INDEX_DIR = Path(__file__).resolve().parents[1] / "index"
 
 
 class HybridRequest(BaseModel):
 	question: str
 	k: int = 5
+	# Per-query ANN accuracy/latency knobs (hnsw / ivfpq backends)
+	ef: Optional[int] = None
+	nprobe: Optional[int] = None
+	# Fusion overrides: "rrf" | "weighted", candidates per backend, TF-IDF weight (embeddings get 1 - w)
+	fusion: Optional[str] = None
+	depth: Optional[int] = None
+	tfidf_weight: Optional[float] = None
+	# Lexical backend: "tfidf" | "bm25" (default LEXICAL_BACKEND); tfidf_weight applies to it
+	lexical: Optional[str] = None
+	# False: return ids, scores and metadata only; passage text is never read
+	include_text: bool = True
 
 
 class Hit(BaseModel):
 	id: str
 	score: float
-	text: str
+	text: Optional[str] = None
 	meta: dict
+	# Rank of this passage in each backend's candidate list
+	ranks: Dict[str, int] = {}
 
 
 class HybridResponse(BaseModel):
 	hits: List[Hit]
+	# Milliseconds per backend and for fusion
+	timings: Dict[str, float] = {}
+	# Coordinator mode: some shards failed or timed out and were left out
+	partial: bool = False
+
+
+class HybridBatchRequest(BaseModel):
+	questions: List[str] = Field(..., max_length=MAX_BATCH_QUESTIONS)
+	k: int = 5
+	ef: Optional[int] = None
+	nprobe: Optional[int] = None
+	fusion: Optional[str] = None
+	depth: Optional[int] = None
+	tfidf_weight: Optional[float] = None
+	lexical: Optional[str] = None
+	include_text: bool = True
+
+
+class HybridBatchResponse(BaseModel):
+	results: List[HybridResponse]
+	timings: Dict[str, float] = {}
+	partial: bool = False
+
+
+def _search_params(req) -> dict:
+	params = {name: v for name, v in (("ef", req.ef), ("nprobe", req.nprobe)) if v is not None}
+	if req.fusion is not None:
+		params["method"] = req.fusion
+	return {**params, "depth": req.depth, "tfidf_weight": req.tfidf_weight, "include_text": req.include_text}
+
+
+def _search(questions: List[str], k: int, search_params: dict, lexical: Optional[str] = None):
+	hy = HybridRetriever(INDEX_DIR, lexical=lexical)
+	return hy.search(questions, k=k, **search_params), hy.timings, hy.partial
+
+
+def _response(hits, include_text: bool, timings=None, partial: bool = False) -> HybridResponse:
+	return HybridResponse(
+		hits=[
+			Hit(id=h.doc.id, score=h.score, text=h.doc.text if include_text else None, meta=h.doc.meta, ranks=h.ranks)
+			for h in hits
+		],
+		timings=timings or {},
+		partial=partial,
+	)
+
+
+async def _run(questions: List[str], req):
+	try:
+		return await retrieval_executor.run(_search, questions, req.k, _search_params(req), req.lexical)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	except ShardUnavailable as e:
+		raise HTTPException(status_code=503, detail=str(e))
 
 
 @router.post("/")
-def hybrid(req: HybridRequest) -> HybridResponse:
+async def hybrid(req: HybridRequest) -> HybridResponse:
 	q = req.question.strip()
 	if not q:
 		raise HTTPException(status_code=400, detail="Empty question")
 
-	tf = TfidfStore(INDEX_DIR)
-	hy = HybridRetriever(INDEX_DIR)
-	results = hy.query(q, k=req.k)
-	hits = [Hit(id=d.id, score=score, text=d.text, meta=d.meta) for d, score in results]
-	return HybridResponse(hits=hits)
+	batches, timings, partial = await _run([q], req)
+	return _response(batches[0], req.include_text, timings, partial)
+
+
+@router.post("/batch")
+async def hybrid_batch(req: HybridBatchRequest) -> HybridBatchResponse:
+	empty = [i for i, q in enumerate(req.questions) if not q.strip()]
+	if empty:
+		raise HTTPException(status_code=400, detail=f"Empty question at positions {empty}")
 
+	questions = [q.strip() for q in req.questions]
+	batches, timings, partial = await _run(questions, req)
+	return HybridBatchResponse(
+		results=[_response(hits, req.include_text) for hits in batches], timings=timings, partial=partial
+	)
@@ -1,38 +1,70 @@
 from __future__ import annotations
 
-from dataclasses import asdict
 from pathlib import Path
-from typing import List
+from typing import Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 import logging
-from ..core.vector_store import TfidfStore, Document
+from ..core.chunking import CHUNK_OVERLAP, CHUNK_SIZE
+from ..core.embedding_store import EMBEDDINGS_FILE
+from ..core.incremental import sync_index
+from ..core.index_registry import INDEX_DIR, get_embedding_store
 
 logger = logging.getLogger("ingest")
 
 router = APIRouter()
 
 DATA_DIR = Path(__file__).resolve().parents[2] / "data"
-INDEX_DIR = Path(__file__).resolve().parents[1] / "index"
 INDEX_DIR.mkdir(parents=True, exist_ok=True)
 
 
+class IngestRequest(BaseModel):
+    # Chunk size and overlap in words; defaults come from INGEST_CHUNK_SIZE / INGEST_CHUNK_OVERLAP
+    chunk_size: int = CHUNK_SIZE
+    chunk_overlap: int = CHUNK_OVERLAP
+    # Re-chunk and refit everything instead of only syncing changed files
+    rebuild: bool = False
+
+
 class IngestResponse(BaseModel):
     count: int
+    added_files: int = 0
+    changed_files: int = 0
+    removed_files: int = 0
+    unchanged_files: int = 0
+    new_chunks: int = 0
+    compacted: bool = False
+    rebuilt: bool = False
 
 
 @router.post("/")
-def ingest() -> IngestResponse:
-    # Read all .txt files under backend/data
-    texts: List[Document] = []
-    for p in sorted((DATA_DIR).glob("*.txt")):
-        content = p.read_text(encoding="utf-8")
-        texts.append(Document(id=p.name, text=content, meta={"path": str(p)}))
-
-    store = TfidfStore(INDEX_DIR)
-    store.add_texts(texts)
-    store.build()
-
-    return IngestResponse(count=len(texts))
+def ingest(req: Optional[IngestRequest] = None) -> IngestResponse:
+    req = req or IngestRequest()
+    if req.chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+
+    # Only new/changed .txt files under backend/data are chunked and appended; the
+    # first run (or rebuild=true) streams every file into a fresh index
+    encoder = get_embedding_store(INDEX_DIR).model if (INDEX_DIR / EMBEDDINGS_FILE).exists() else None
+    res = sync_index(
+        DATA_DIR,
+        INDEX_DIR,
+        chunk_size=req.chunk_size,
+        overlap=req.chunk_overlap,
+        rebuild=req.rebuild,
+        encoder=encoder,
+    )
+    logger.info("Ingest: %s", res)
+
+    return IngestResponse(
+        count=res.chunks,
+        added_files=res.added_files,
+        changed_files=res.changed_files,
+        removed_files=res.removed_files,
+        unchanged_files=res.unchanged_files,
+        new_chunks=res.new_chunks,
+        compacted=res.compacted,
+        rebuilt=res.rebuilt,
+    )
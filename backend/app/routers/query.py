@@ -1,30 +1,32 @@
 from __future__ import annotations
 
-from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 import logging
-from ..core.vector_store import TfidfStore
+from ..core.executor import MAX_BATCH_QUESTIONS, retrieval_executor
+from ..core.index_registry import INDEX_DIR, get_lexical_store
 
 logger = logging.getLogger("query")
 
 router = APIRouter()
 
-INDEX_DIR = Path(__file__).resolve().parents[1] / "index"
-
 
 class QueryRequest(BaseModel):
     question: str
     k: int = 5
+    # False: return ids, scores and metadata only; passage text is never read
+    include_text: bool = True
+    # "tfidf" | "bm25"; default LEXICAL_BACKEND
+    backend: Optional[str] = None
 
 
 class Passage(BaseModel):
     id: str
     score: float
-    text: str
+    text: Optional[str] = None
     meta: dict
 
 
@@ -32,12 +34,51 @@ class QueryResponse(BaseModel):
     hits: List[Passage]
 
 
+class QueryBatchRequest(BaseModel):
+    questions: List[str] = Field(..., max_length=MAX_BATCH_QUESTIONS)
+    k: int = 5
+    include_text: bool = True
+    backend: Optional[str] = None
+
+
+class QueryBatchResponse(BaseModel):
+    results: List[QueryResponse]
+
+
+def _query(question: str, k: int, include_text: bool = True, backend: Optional[str] = None):
+    return get_lexical_store(INDEX_DIR, backend).query(question, k=k, include_text=include_text)
+
+
+def _query_batch(questions: List[str], k: int, include_text: bool = True, backend: Optional[str] = None):
+    return get_lexical_store(INDEX_DIR, backend).query_batch(questions, k=k, include_text=include_text)
+
+
+async def _run(fn, *args):
+    try:
+        return await retrieval_executor.run(fn, *args)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _passages(results, include_text: bool) -> List[Passage]:
+    return [Passage(id=d.id, score=score, text=d.text if include_text else None, meta=d.meta) for d, score in results]
+
+
 @router.post("/")
-def query(req: QueryRequest) -> QueryResponse:
+async def query(req: QueryRequest) -> QueryResponse:
     if not req.question.strip():
         raise HTTPException(status_code=400, detail="Empty question")
 
-    store = TfidfStore(INDEX_DIR)
-    results = store.query(req.question, k=req.k)
-    hits = [Passage(id=d.id, score=score, text=d.text, meta=d.meta) for d, score in results]
-    return QueryResponse(hits=hits)
+    results = await _run(_query, req.question.strip(), req.k, req.include_text, req.backend)
+    return QueryResponse(hits=_passages(results, req.include_text))
+
+
+@router.post("/batch")
+async def query_batch(req: QueryBatchRequest) -> QueryBatchResponse:
+    """Retrieve for many questions in one call (one vectorizer transform and one matrix product for TF-IDF)."""
+    empty = [i for i, q in enumerate(req.questions) if not q.strip()]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Empty question at positions {empty}")
+
+    batches = await _run(_query_batch, [q.strip() for q in req.questions], req.k, req.include_text, req.backend)
+    return QueryBatchResponse(results=[QueryResponse(hits=_passages(results, req.include_text)) for results in batches])
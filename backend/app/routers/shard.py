@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+from fastapi import APIRouter
+from pydantic import BaseModel, Field
+
+import logging
+from ..core.executor import MAX_BATCH_QUESTIONS, retrieval_executor
+from ..core.index_registry import INDEX_DIR
+from ..core.scatter_gather import BACKENDS, shard_passages, shard_search
+from ..core.sharding import read_shard_info
+
+logger = logging.getLogger("shard")
+
+router = APIRouter()
+
+
+class ShardSearchRequest(BaseModel):
+    questions: List[str] = Field(..., max_length=MAX_BATCH_QUESTIONS)
+    k: int = 50
+    backends: List[str] = list(BACKENDS)
+    # ANN knobs (ef / nprobe) for the embedding backend
+    params: Dict[str, Any] = {}
+
+
+class ShardPassagesRequest(BaseModel):
+    rows: List[int]
+
+
+@router.get("/info")
+def info():
+    """Which rows of the global index this instance serves (see scripts/shard_index.py)."""
+    return read_shard_info(INDEX_DIR) or {"row_offset": 0}
+
+
+@router.post("/search")
+async def search(req: ShardSearchRequest) -> dict:
+    """Candidates for a coordinator: global row ids, scores, ids and metadata, no text."""
+    return await retrieval_executor.run(shard_search, INDEX_DIR, req.questions, req.k, req.backends, req.params)
+
+
+@router.post("/passages")
+async def passages(req: ShardPassagesRequest) -> dict:
+    return await retrieval_executor.run(shard_passages, INDEX_DIR, req.rows)
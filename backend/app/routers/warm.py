@@ -1,38 +1,41 @@
 from __future__ import annotations
 
-from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 import logging
-from ..core.vector_store import TfidfStore
-from ..core.embedding_store import EmbeddingStore
+from ..core import query_cache
+from ..core.hybrid import warm as warm_caches
+from ..core.index_registry import INDEX_DIR
 
 logger = logging.getLogger("warm")
 
 router = APIRouter()
-INDEX_DIR = Path(__file__).resolve().parents[1] / "index"
 
 
 class WarmRequest(BaseModel):
 	queries: List[str]
+	# Result lists are cached per k, so warm the k values clients actually request
+	ks: List[int] = [5]
+	# Lexical backend to warm for /query/ and /hybrid/ (default LEXICAL_BACKEND)
+	lexical: Optional[str] = None
 
 
 class WarmResponse(BaseModel):
 	warmed: int
+	cache: dict
 
 
 @router.post("/")
 def warm(req: WarmRequest) -> WarmResponse:
-	# Ensure indexes exist
-	tf = TfidfStore(INDEX_DIR)
-	emb = EmbeddingStore(INDEX_DIR)
-	count = 0
-	for q in req.queries:
-		_ = tf.query(q, k=3)
-		_ = emb.search(q, k=3)
-		count += 1
-	return WarmResponse(warmed=count)
+	"""Load the indexes and pre-populate the query-vector and retrieval caches."""
+	# Strip like /query/ and /hybrid/ do; see hybrid.warm for which keys are filled
+	queries = [q.strip() for q in req.queries if q.strip()]
+	try:
+		warm_caches(INDEX_DIR, queries, req.ks, req.lexical)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return WarmResponse(warmed=len(queries), cache=query_cache.stats())
 
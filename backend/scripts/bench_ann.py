@@ -0,0 +1,91 @@
+"""Recall-vs-latency report for the EmbeddingStore ANN backends.
+
+Compares each approximate backend against the exact scan on the same queries
+and prints a markdown table of recall@k and per-query latency for a sweep of
+query-time settings (`ef` for hnsw, `nprobe` for ivfpq).
+
+Usage example:
+  python -m scripts.bench_ann --index-dir app/index --k 10
+  python -m scripts.bench_ann --synthetic 200000 --dim 384 --queries 500
+
+Backends whose library is not installed (hnswlib, faiss-cpu) are skipped.
+"""
+from __future__ import annotations
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.core.ann import ExactIndex, build_ann_index
+from app.core.embedding_store import EMBEDDINGS_FILE, normalize_rows
+
+SWEEPS = {
+    "hnsw": ("ef", [16, 32, 64, 128, 256]),
+    "ivfpq": ("nprobe", [1, 4, 16, 64]),
+}
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.index_dir:
+        return np.asarray(np.load(Path(args.index_dir) / EMBEDDINGS_FILE, mmap_mode="r"), dtype=np.float32)
+    rng = np.random.default_rng(args.seed)
+    return normalize_rows(rng.standard_normal((args.synthetic, args.dim), dtype=np.float32))
+
+
+def make_queries(embs: np.ndarray, n: int, seed: int) -> np.ndarray:
+    # Perturbed corpus rows: realistic neighbourhoods without needing an encoder
+    rng = np.random.default_rng(seed + 1)
+    rows = embs[rng.integers(0, len(embs), size=n)]
+    return normalize_rows(rows + 0.1 * rng.standard_normal(rows.shape, dtype=np.float32))
+
+
+def timed_search(index, queries: np.ndarray, k: int, **params):
+    ids = []
+    start = time.perf_counter()
+    for q in queries:
+        _, row = index.search(q[None, :], k, **params)
+        ids.append(row[0])
+    elapsed = time.perf_counter() - start
+    return np.array(ids), elapsed / len(queries) * 1000.0
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index-dir", help="Directory containing embeddings.npy (default: synthetic data)")
+    ap.add_argument("--synthetic", type=int, default=100000, help="Synthetic corpus size when no index dir")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    embs = load_vectors(args)
+    queries = make_queries(embs, args.queries, args.seed)
+    exact = ExactIndex.load(None, {}, embs)
+    truth, exact_ms = timed_search(exact, queries, args.k)
+
+    print(f"corpus={len(embs)} dim={embs.shape[1]} queries={len(queries)} k={args.k}\n")
+    print("| backend | setting | build s | recall@k | ms/query |")
+    print("|---|---|---|---|---|")
+    print(f"| exact | - | 0.00 | 1.000 | {exact_ms:.3f} |")
+    for kind, (param, values) in SWEEPS.items():
+        start = time.perf_counter()
+        try:
+            index = build_ann_index(kind, embs)
+        except RuntimeError as e:
+            print(f"| {kind} | skipped: {e} | | | |")
+            continue
+        build_s = time.perf_counter() - start
+        for v in values:
+            found, ms = timed_search(index, queries, args.k, **{param: v})
+            print(f"| {kind} | {param}={v} | {build_s:.2f} | {recall(found, truth):.3f} | {ms:.3f} |")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
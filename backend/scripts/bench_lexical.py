@@ -0,0 +1,129 @@
+"""Latency and hit-quality report: TF-IDF (dense scoring) vs. the BM25 inverted index.
+
+Queries are known-item searches: a few words sampled from a random passage,
+which then counts as the relevant hit. For each backend the report lists
+success@k and MRR for that passage, the share of its top k also returned by
+the other backend, and p50/p95 latency per question (one question per call,
+result caches bypassed). For BM25 it also lists the build time and the
+fraction of the query terms' postings actually decoded.
+
+Usage example:
+  python -m scripts.bench_lexical --index-dir app/index --k 10
+  python -m scripts.bench_lexical --synthetic 200000 --queries 500
+  python -m scripts.bench_lexical --index-dir app/index --queries-file questions.txt
+
+With `--queries-file` there is no known relevant passage, so only latency and
+overlap are reported.
+"""
+from __future__ import annotations
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.bm25 import BM25Store, _analyzer
+from app.core.vector_store import Document, TfidfStore
+
+
+def synthetic_index(path: Path, n: int, seed: int) -> None:
+    # Zipf-distributed vocabulary, passage lengths like the chunker's output
+    rng = np.random.default_rng(seed)
+    words = np.array([f"t{i}" for i in range(50000)])
+    p = 1 / np.arange(1, len(words) + 1) ** 1.1
+    p /= p.sum()
+    docs = (Document(str(i), " ".join(rng.choice(words, size=rng.integers(40, 200), p=p)), {}) for i in range(n))
+    TfidfStore(path).build_streaming(docs)
+
+
+def make_queries(docs, n: int, seed: int) -> List[tuple]:
+    rng = np.random.default_rng(seed + 1)
+    analyze = _analyzer().build_analyzer()
+    queries = []
+    while len(queries) < n:
+        row = int(rng.integers(0, len(docs)))
+        tokens = analyze(docs[row].text)
+        if len(tokens) >= 3:
+            size = int(rng.integers(3, min(6, len(tokens)) + 1))
+            queries.append((" ".join(rng.choice(tokens, size=size, replace=False)), row))
+    return queries
+
+
+def run(search, questions: List[str]):
+    results, ms = [], []
+    for q in questions:
+        start = time.perf_counter()
+        results.append([row for row, _ in search(q)])
+        ms.append((time.perf_counter() - start) * 1000.0)
+    return results, np.array(ms)
+
+
+def quality(results: List[List[int]], relevant: Optional[List[int]]) -> Dict[str, float]:
+    if relevant is None:
+        return {}
+    ranks = [rows.index(r) + 1 if r in rows else 0 for rows, r in zip(results, relevant)]
+    return {
+        "success": float(np.mean([r > 0 for r in ranks])),
+        "mrr": float(np.mean([1.0 / r if r else 0.0 for r in ranks])),
+    }
+
+
+def overlap(a: List[List[int]], b: List[List[int]], k: int) -> float:
+    return float(np.mean([len(set(x) & set(y)) / k for x, y in zip(a, b)]))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index-dir", help="Index to benchmark (default: synthetic corpus in a temp dir)")
+    ap.add_argument("--synthetic", type=int, default=100000, help="Synthetic corpus size when no index dir")
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--queries-file", help="One question per line instead of sampled known-item queries")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.index_dir:
+        index_dir = Path(args.index_dir)
+    else:
+        index_dir = Path(tempfile.mkdtemp(prefix="bench_lexical_"))
+        synthetic_index(index_dir, args.synthetic, args.seed)
+
+    tfidf = TfidfStore(index_dir)
+    tfidf._load()
+    start = time.perf_counter()
+    bm25 = BM25Store(index_dir)
+    bm25.build()
+    bm25.load()
+    build_s = time.perf_counter() - start
+
+    if args.queries_file:
+        questions = [q.strip() for q in Path(args.queries_file).read_text(encoding="utf-8").splitlines() if q.strip()]
+        relevant = None
+    else:
+        sampled = make_queries(tfidf.docs, args.queries, args.seed)
+        questions, relevant = [q for q, _ in sampled], [r for _, r in sampled]
+
+    stats: Dict[str, int] = {}
+    runs = {
+        "tfidf": run(lambda q: tfidf._score_batch([q], args.k)[0], questions),
+        "bm25": run(lambda q: bm25.search_one(q, args.k, stats), questions),
+    }
+
+    print(f"rows={len(tfidf.docs)} queries={len(questions)} k={args.k} bm25_build_s={build_s:.2f}")
+    print(f"bm25 postings decoded: {stats.get('decoded', 0) / max(1, stats.get('postings', 0)):.1%} of the query terms' postings\n")
+    print("| backend | success@k | MRR | overlap@k | p50 ms | p95 ms |")
+    print("|---|---|---|---|---|---|")
+    for name, other in (("tfidf", "bm25"), ("bm25", "tfidf")):
+        results, ms = runs[name]
+        q = quality(results, relevant)
+        cells = [f"{q[m]:.3f}" if q else "-" for m in ("success", "mrr")]
+        print(
+            f"| {name} | {cells[0]} | {cells[1]} | {overlap(results, runs[other][0], args.k):.3f} "
+            f"| {np.percentile(ms, 50):.3f} | {np.percentile(ms, 95):.3f} |"
+        )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
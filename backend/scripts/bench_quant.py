@@ -0,0 +1,122 @@
+"""Benchmark LLM_QUANT modes: memory, tokens/sec and answer drift vs. fp32.
+
+Usage example:
+  python -m scripts.bench_quant --modes none int8 bf16
+  python -m scripts.bench_quant --questions questions.txt --index-dir app/index --max-new-tokens 64
+  python -m scripts.bench_quant --encoder all-MiniLM-L6-v2
+
+For every mode the local LLM is loaded fresh and answers a fixed question set
+with greedy decoding, so differences come from precision alone. Contexts are
+retrieved from the TF-IDF index when `--index-dir` exists. Drift is measured
+against the first mode (normally `none` = fp32): exact-match rate and mean
+difflib similarity of the answers. With `--encoder`, the embedding model is
+benchmarked the same way (encode throughput and cosine to fp32 vectors).
+"""
+from __future__ import annotations
+import argparse
+import difflib
+import gc
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from app.core import llm
+from app.core.index_format import has_index
+from app.core.quant import QUANT_MODES, quantize_encoder, weights_bytes
+
+DEFAULT_QUESTIONS = [
+    "What is negligence under Indian law?",
+    "When can bail be granted for a non-bailable offence?",
+    "What is the punishment for murder under Section 302?",
+    "What are the essentials of a valid contract?",
+    "What remedies are available for breach of contract?",
+    "What does Article 21 of the Constitution protect?",
+]
+
+
+def _contexts(index_dir: Path, questions: List[str], k: int) -> List[List[str]]:
+    if not has_index(index_dir):
+        return [[] for _ in questions]
+    from app.core.vector_store import TfidfStore
+
+    store = TfidfStore(index_dir)
+    return [[d.text for d, _ in hits] for hits in store.query_batch(questions, k=k)]
+
+
+def _answer(tokenizer, model, prompt: str, max_new_tokens: int):
+    import torch
+
+    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=llm.MAX_INPUT_TOKENS).to(model.device)
+    start = time.perf_counter()
+    with torch.no_grad():
+        out = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tokenizer.eos_token_id)
+    elapsed = time.perf_counter() - start
+    new_ids = out[0, inputs["input_ids"].shape[1]:]
+    return tokenizer.decode(new_ids, skip_special_tokens=True).strip(), len(new_ids), elapsed
+
+
+def bench_llm(modes: List[str], prompts: List[str], max_new_tokens: int) -> None:
+    print(f"LLM {llm.DEFAULT_MODEL}, {len(prompts)} questions, greedy, max_new_tokens={max_new_tokens}\n")
+    print("| mode | weights MB | tokens/s | exact match | similarity |")
+    print("|---|---|---|---|---|")
+    baseline = None
+    for mode in modes:
+        tokenizer, model, _ = llm.load_model(mode)
+        answers, tokens, seconds = [], 0, 0.0
+        for prompt in prompts:
+            text, n, elapsed = _answer(tokenizer, model, prompt, max_new_tokens)
+            answers.append(text)
+            tokens += n
+            seconds += elapsed
+        baseline = baseline or answers
+        exact = np.mean([a == b for a, b in zip(answers, baseline)])
+        sim = np.mean([difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(answers, baseline)])
+        print(f"| {mode} | {weights_bytes(model) / 2**20:.0f} | {tokens / seconds:.1f} | {exact:.2f} | {sim:.3f} |")
+        del model
+        gc.collect()
+
+
+def bench_encoder(name: str, modes: List[str], texts: List[str], repeat: int) -> None:
+    from sentence_transformers import SentenceTransformer
+
+    print(f"\nEncoder {name}, {len(texts)} texts x {repeat}\n")
+    print("| mode | weights MB | texts/s | min cosine to first mode |")
+    print("|---|---|---|---|")
+    baseline = None
+    for mode in modes:
+        model = quantize_encoder(SentenceTransformer(name, device="cpu"), mode)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            embs = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        rate = len(texts) * repeat / (time.perf_counter() - start)
+        baseline = embs if baseline is None else baseline
+        cos = float(np.min(np.sum(embs * baseline, axis=1)))
+        print(f"| {mode} | {weights_bytes(model) / 2**20:.0f} | {rate:.1f} | {cos:.4f} |")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", nargs="+", default=list(QUANT_MODES), choices=QUANT_MODES, help="First mode is the drift baseline")
+    ap.add_argument("--questions", type=Path, help="One question per line (default: built-in set)")
+    ap.add_argument("--index-dir", type=Path, default=Path("app/index"))
+    ap.add_argument("--k", type=int, default=3, help="Contexts per question")
+    ap.add_argument("--max-new-tokens", type=int, default=64)
+    ap.add_argument("--encoder", help="Also benchmark this SentenceTransformer model")
+    ap.add_argument("--repeat", type=int, default=5, help="Encoder passes over the question set")
+    ap.add_argument("--skip-llm", action="store_true")
+    args = ap.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        questions = [q.strip() for q in args.questions.read_text(encoding="utf-8").splitlines() if q.strip()]
+    if not args.skip_llm:
+        contexts = _contexts(args.index_dir, questions, args.k)
+        bench_llm(args.modes, [llm.build_prompt(q, c) for q, c in zip(questions, contexts)], args.max_new_tokens)
+    if args.encoder:
+        bench_encoder(args.encoder, args.modes, questions, args.repeat)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,48 @@
+"""Microbenchmark: full argsort vs. argpartition top-k.
+
+Usage example:
+  python -m scripts.bench_topk --k 5 --repeat 20
+  python -m scripts.bench_topk --sizes 10000 100000 1000000 --batch 32
+
+Prints a markdown table of milliseconds per call for single-query (1-D) and
+batched (2-D) score arrays at each corpus size.
+"""
+from __future__ import annotations
+import argparse
+import timeit
+
+import numpy as np
+
+from app.core.topk import top_k
+
+
+def _argsort_topk(scores: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(scores, axis=-1)[..., ::-1][..., :k]
+
+
+def bench(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000.0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--batch", type=int, default=16, help="Rows in the batched score matrix")
+    ap.add_argument("--repeat", type=int, default=10)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"k={args.k} batch={args.batch} (best of {args.repeat})\n")
+    print("| docs | shape | argsort ms | top_k ms | speedup |")
+    print("|---|---|---|---|---|")
+    for n in args.sizes:
+        for shape in ((n,), (args.batch, n)):
+            scores = rng.random(shape, dtype=np.float32)
+            base = bench(lambda: _argsort_topk(scores, args.k), args.repeat)
+            fast = bench(lambda: top_k(scores, args.k), args.repeat)
+            print(f"| {n:,} | {'x'.join(map(str, shape))} | {base:.3f} | {fast:.3f} | {base / fast:.1f}x |")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,34 @@
+"""Convert a legacy texts.txt/docs.json/joblib index to the binary format.
+
+Usage example:
+  python -m scripts.convert_index --index-dir app/index
+
+Rows, ids and tombstones are kept and the vectorizer is not refitted, so
+embeddings.npy and sources.json stay valid. Loading the legacy pickles needs a
+scikit-learn version compatible with the one that wrote them; after the
+conversion the index no longer depends on it.
+"""
+from __future__ import annotations
+import argparse
+from pathlib import Path
+
+from app.core.index_format import has_index
+from app.core.vector_store import TfidfStore
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index-dir", default=str(Path(__file__).resolve().parents[1] / "app" / "index"))
+    args = ap.parse_args()
+
+    index_dir = Path(args.index_dir)
+    if not has_index(index_dir):
+        raise SystemExit(f"No index in {index_dir}")
+    store = TfidfStore(index_dir)
+    if store.upgrade():
+        print(f"Converted {len(store.docs)} rows in {index_dir} (generation {store.generation})")
+    else:
+        print(f"{index_dir} is already in the current format")
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
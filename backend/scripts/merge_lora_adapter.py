@@ -0,0 +1,59 @@
+"""Fuse a LoRA adapter into its base model and save a standalone checkpoint.
+
+Usage example:
+  python -m scripts.merge_lora_adapter \
+    --adapter models/lora/run1 \
+    --output-dir models/merged/run1
+
+Serve the result with `LLM_MODEL=models/merged/run1`, or hot-swap it into a
+running server via `POST /admin/model {"model": "models/merged/run1"}`. The
+merged weights need neither peft nor the per-forward adapter computation.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+from pathlib import Path
+
+try:
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from peft import PeftModel
+except ImportError as e:  # pragma: no cover
+    raise SystemExit("Missing dependencies. Install extras: pip install .[llm]") from e
+
+DTYPES = {"float32": torch.float32, "float16": torch.float16, "bfloat16": torch.bfloat16}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--adapter", required=True, help="Adapter dir written by finetune_lora.py")
+    ap.add_argument("--output-dir", required=True, help="Directory for the fused checkpoint")
+    ap.add_argument("--base", default=None, help="Base model (default: the adapter's base_model_name_or_path, then LLM_MODEL)")
+    ap.add_argument("--dtype", choices=sorted(DTYPES), default="float32", help="Precision of the saved weights")
+    args = ap.parse_args()
+
+    adapter = Path(args.adapter)
+    base = args.base
+    if base is None:
+        cfg = adapter / "adapter_config.json"
+        if cfg.exists():
+            base = json.loads(cfg.read_text(encoding="utf-8")).get("base_model_name_or_path")
+        base = base or os.getenv("LLM_MODEL", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+
+    model = AutoModelForCausalLM.from_pretrained(base, torch_dtype=DTYPES[args.dtype])
+    model = PeftModel.from_pretrained(model, str(adapter)).merge_and_unload()
+    tok_src = adapter if (adapter / "tokenizer_config.json").exists() else base
+    tok = AutoTokenizer.from_pretrained(str(tok_src))
+
+    out = Path(args.output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    model.save_pretrained(out, safe_serialization=True)
+    tok.save_pretrained(out)
+    (out / "merge_info.json").write_text(
+        json.dumps({"base": base, "adapter": str(adapter), "dtype": args.dtype}, indent=2), encoding="utf-8"
+    )
+    print(f"Saved merged model ({base} + {adapter}) to {out}")
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,60 @@
+"""Run a local scatter-gather cluster: one uvicorn process per shard plus a coordinator.
+
+Usage example:
+  python -m scripts.shard_index --index-dir app/index --out-dir shards --shards 2
+  python -m scripts.run_shards --shards-dir shards --port 8000 --replicas 2
+
+Shard k, replica r listens on port + 1 + k * replicas + r with INDEX_DIR set to
+`shards/shard-0k`. The coordinator listens on `--port` with SHARD_URLS
+pointing at them, so `POST http://127.0.0.1:8000/hybrid/` fans out over the
+shards. Stop everything with Ctrl-C. Extra SHARD_* settings (timeouts,
+hedging) are passed through from the environment.
+"""
+from __future__ import annotations
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+def _uvicorn(port: int, env: dict) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)]
+    return subprocess.Popen(cmd, env={**os.environ, **env}, cwd=Path(__file__).resolve().parents[1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shards-dir", required=True, help="Output dir of scripts.shard_index")
+    ap.add_argument("--port", type=int, default=8000, help="Coordinator port; shards use the ports after it")
+    ap.add_argument("--replicas", type=int, default=1, help="Processes per shard (targets for hedged requests)")
+    args = ap.parse_args()
+
+    shard_dirs = sorted(p for p in Path(args.shards_dir).iterdir() if (p / "shard.json").exists())
+    if not shard_dirs:
+        raise SystemExit(f"No shards in {args.shards_dir}; run scripts.shard_index first")
+    procs, urls = [], []
+    for k, shard_dir in enumerate(shard_dirs):
+        replicas = []
+        for r in range(args.replicas):
+            port = args.port + 1 + k * args.replicas + r
+            procs.append(_uvicorn(port, {"INDEX_DIR": str(shard_dir.resolve()), "SHARD_URLS": "", "PRELOAD": "blocking"}))
+            replicas.append(f"http://127.0.0.1:{port}")
+        urls.append("|".join(replicas))
+    shard_urls = ",".join(urls)
+    procs.append(_uvicorn(args.port, {"SHARD_URLS": shard_urls}))
+    print(f"Coordinator http://127.0.0.1:{args.port} with SHARD_URLS={shard_urls}")
+    try:
+        while all(p.poll() is None for p in procs):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,35 @@
+"""Split an index into standalone row shards for multi-process serving.
+
+Usage example:
+  python -m scripts.shard_index --index-dir app/index --out-dir shards --shards 4
+
+Each `shards/shard-NN/` directory is a complete index that one backend
+instance can serve (point its INDEX_DIR at it). All shards share the source
+index's vocabulary and idf, so their scores are comparable, and `shard.json`
+records the global row offset used to merge results. In-process parallel
+scoring does not need this; it shards the loaded matrix on the fly
+(TFIDF_SHARDS).
+"""
+from __future__ import annotations
+import argparse
+from pathlib import Path
+
+from app.core.index_format import has_index
+from app.core.sharding import read_shard_info, split_index
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index-dir", default=str(Path(__file__).resolve().parents[1] / "app" / "index"))
+    ap.add_argument("--out-dir", required=True, help="Directory that receives shard-NN/ subdirectories")
+    ap.add_argument("--shards", type=int, required=True, help="Number of row shards")
+    args = ap.parse_args()
+
+    if not has_index(Path(args.index_dir)):
+        raise SystemExit(f"No index in {args.index_dir}")
+    for shard_dir in split_index(Path(args.index_dir), Path(args.out_dir), args.shards):
+        info = read_shard_info(shard_dir)
+        print(f"{shard_dir}: rows {info['row_offset']}..{info['row_offset'] + info['rows'] - 1}")
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,55 @@
+import numpy as np
+
+from app.core.answer_cache import AnswerCache
+from app.core.llm import GenerationResult
+
+
+def _result(text):
+    return GenerationResult(prompt="p", completion=text, model="m", tokens_in=3, tokens_out=2, usage={"prompt_tokens": 3})
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = AnswerCache(max_entries=8, ttl=60, db_path=None)
+    cache.put("What is negligence?", ["a.txt#0"], "2", _result("duty of care"))
+    assert cache.get("what is  NEGLIGENCE", ["a.txt#0"], "2").completion == "duty of care"
+    # Different retrieved contexts are a different prompt
+    assert cache.get("What is negligence?", ["b.txt#0"], "2") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_new_generation_and_ttl_invalidate(monkeypatch):
+    cache = AnswerCache(max_entries=8, ttl=60, db_path=None)
+    cache.put("q", ["a.txt#0"], "2", _result("old"))
+    assert cache.get("q", ["a.txt#0"], "4") is None
+    cache.put("q", ["a.txt#0"], "4", _result("new"))
+    monkeypatch.setattr("app.core.answer_cache.time.time", lambda: 10**12)
+    assert cache.get("q", ["a.txt#0"], "4") is None
+
+
+def test_semantic_near_duplicate_within_same_contexts():
+    cache = AnswerCache(max_entries=8, ttl=60, db_path=None, semantic_threshold=0.9)
+    emb = np.array([1.0, 0.0])
+    cache.put("What is negligence under Indian law?", ["a.txt#0"], "2", _result("duty"), embedding=emb)
+    close = np.array([0.99, 0.141])
+    assert cache.get("Define negligence in India", ["a.txt#0"], "2", embedding=close).completion == "duty"
+    assert cache.get("Define negligence in India", ["c.txt#1"], "2", embedding=close) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    db = str(tmp_path / "answers.sqlite")
+    AnswerCache(max_entries=8, ttl=60, db_path=db).put("q", ["a.txt#0"], "2", _result("kept"))
+    assert AnswerCache(max_entries=8, ttl=60, db_path=db).get("q", ["a.txt#0"], "2").completion == "kept"
+
+
+def test_lagging_worker_keeps_newer_generation_rows(tmp_path):
+    db = str(tmp_path / "answers.sqlite")
+    ahead, lagging = AnswerCache(max_entries=8, ttl=60, db_path=db), AnswerCache(max_entries=8, ttl=60, db_path=db)
+    ahead.put("q", ["a.txt#0"], "6", _result("new"))
+    # A worker still on generation 4 must neither see nor delete the generation-6 answer
+    assert lagging.get("q", ["a.txt#0"], "4") is None
+    assert AnswerCache(max_entries=8, ttl=60, db_path=db).get("q", ["a.txt#0"], "6").completion == "new"
+    # Older generations are pruned once a worker moves past them
+    lagging.put("p", ["a.txt#0"], "4", _result("old"))
+    AnswerCache(max_entries=8, ttl=60, db_path=db).get("x", ["a.txt#0"], "6")
+    assert AnswerCache(max_entries=8, ttl=60, db_path=db).get("p", ["a.txt#0"], "4") is None
@@ -0,0 +1,124 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.core import bm25
+from app.core.bm25 import BM25_FILE, BM25Store, _analyzer, idf, vbyte_decode, vbyte_encode
+from app.core.vector_store import Document, TfidfStore
+
+
+def _corpus(n=1500, seed=0):
+    rng = np.random.default_rng(seed)
+    words = [f"w{i}" for i in range(400)]
+    p = 1 / np.arange(1, len(words) + 1)
+    p /= p.sum()
+    texts = [" ".join(rng.choice(words, size=rng.integers(3, 40), p=p)) for _ in range(n)]
+    queries = [" ".join(rng.choice(words, size=rng.integers(1, 5), p=p)) for _ in range(60)]
+    return texts, queries
+
+
+def _exhaustive(texts, q, k, dead=(), k1=1.2, b=0.75):
+    cv = _analyzer()
+    counts = cv.fit_transform(texts).tocsc().astype(float)
+    doclen = np.asarray(counts.sum(axis=1)).ravel()
+    norm = k1 * (1 - b + b * doclen / doclen.mean())
+    w = idf(np.diff(counts.indptr), len(texts))
+    scores = np.zeros(len(texts))
+    for token in cv.build_analyzer()(q):
+        if token in cv.vocabulary_:
+            t = cv.vocabulary_[token]
+            tf = counts[:, t].toarray().ravel()
+            scores += w[t] * tf * (k1 + 1) / (tf + norm)
+    scores[list(dead)] = 0
+    order = np.lexsort((np.arange(len(texts)), -scores))[:k]
+    return [(int(r), scores[r]) for r in order if scores[r] > 0]
+
+
+def test_vbyte_round_trip():
+    values = np.array([0, 1, 127, 128, 16383, 16384, 2**31 + 7])
+    data, starts = vbyte_encode(values)
+    assert starts.tolist() == [0, 1, 2, 3, 5, 7, 10]
+    assert vbyte_decode(data).tolist() == values.tolist()
+
+
+def test_maxscore_matches_exhaustive_bm25(tmp_path):
+    texts, queries = _corpus()
+    TfidfStore(tmp_path).build_streaming(Document(str(i), t, {}) for i, t in enumerate(texts))
+    store = BM25Store(tmp_path).load()
+    stats = {}
+    for q in queries:
+        got = store.search_one(q, 10, stats)
+        expected = _exhaustive(texts, q, 10)
+        assert [r for r, _ in got] == [r for r, _ in expected], q
+        np.testing.assert_allclose([s for _, s in got], [s for _, s in expected])
+    # Early termination skipped part of the postings of the query terms
+    assert stats["decoded"] < stats["postings"]
+
+
+def test_ingest_appends_a_segment_in_the_write_and_skips_tombstones(tmp_path, monkeypatch):
+    texts, queries = _corpus(300, seed=1)
+    tf = TfidfStore(tmp_path)
+    tf.build_streaming(Document(str(i), t, {"i": i}) for i, t in enumerate(texts))
+    store = BM25Store(tmp_path).load()
+    assert store.is_current()
+    top = store.search_rows([queries[0]], k=3)[0]
+
+    # BM25 is in use, so the append indexes the new row inside the same generation bracket, without a rebuild
+    monkeypatch.setattr(BM25Store, "_build", lambda self: pytest.fail("full rebuild"))
+    rows = tf.update(add=[Document("new", "zebra crossing", {})], remove_rows=[top[0][0]])
+    assert store.is_current()
+    assert [seg["docs"] for seg in json.loads((tmp_path / BM25_FILE).read_text())["segments"]] == [300, 1]
+    assert not list(tmp_path.glob("*.tmp"))
+    store = BM25Store(tmp_path).load()
+    assert store.search_rows(["zebra"], k=1)[0][0][0] == rows[0]
+    assert top[0][0] not in [r for r, _ in store.search_rows([queries[0]], k=3)[0]]
+    assert [r for r, _ in store.search_rows([queries[0]], k=3)[0]] == [
+        r for r, _ in _exhaustive(texts + ["zebra crossing"], queries[0], 3, dead=[top[0][0]])
+    ]
+    doc, _ = store.query("zebra", k=1, include_text=False)[0]
+    assert (doc.id, doc.text) == ("new", "")
+
+
+def test_appended_segments_merge_and_stay_exact(tmp_path, monkeypatch):
+    monkeypatch.setattr(bm25, "MAX_SEGMENTS", 2)
+    texts, queries = _corpus(600, seed=2)
+    tf = TfidfStore(tmp_path)
+    tf.build_streaming(Document(str(i), t, {}) for i, t in enumerate(texts[:300]))
+    BM25Store(tmp_path).build()
+    dead = [5, 310]
+    for start in range(300, 600, 60):
+        tf.update(add=[Document(str(i), t, {}) for i, t in enumerate(texts[start : start + 60], start)])
+        store = BM25Store(tmp_path).load()
+        for q in queries[:5]:
+            assert [r for r, _ in store.search_one(q, 10)] == [r for r, _ in _exhaustive(texts[: start + 60], q, 10)]
+    tf.update(remove_rows=dead)
+    # The base segment is never re-encoded; appended ones are merged with the new rows at MAX_SEGMENTS
+    segments = json.loads((tmp_path / BM25_FILE).read_text())["segments"]
+    assert [(seg["first"], seg["docs"]) for seg in segments] == [(0, 300), (300, 300)]
+    assert not list(tmp_path.glob("bm25.2.*"))
+    store = BM25Store(tmp_path).load()
+    for q in queries[:20]:
+        got = store.search_one(q, 10)
+        expected = _exhaustive(texts, q, 10, dead=dead)
+        assert [r for r, _ in got] == [r for r, _ in expected], q
+        np.testing.assert_allclose([s for _, s in got], [s for _, s in expected])
+
+    # Compaction rebuilds everything as one segment
+    tf.compact()
+    assert len(json.loads((tmp_path / BM25_FILE).read_text())["segments"]) == 1
+    assert not list(tmp_path.glob("bm25.[0-9]*"))
+
+
+def test_not_built_unless_in_use(tmp_path):
+    TfidfStore(tmp_path).build_streaming([Document("a", "bail is the rule", {})])
+    assert not (tmp_path / BM25_FILE).exists()
+    TfidfStore(tmp_path).update(add=[Document("b", "contract offer", {})])
+    assert not (tmp_path / BM25_FILE).exists()
+
+
+def test_empty_and_unknown_queries(tmp_path):
+    TfidfStore(tmp_path).build_streaming([Document("a", "bail is the rule", {})])
+    store = BM25Store(tmp_path).load()
+    assert store.search_rows(["the of and", "unseen"], k=5) == [[], []]
+    assert store.query("bail")[0][0].id == "a"
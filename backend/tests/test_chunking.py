@@ -0,0 +1,33 @@
+from app.core.chunking import chunk_file, chunk_paragraphs, iter_paragraphs
+
+
+def test_iter_paragraphs_joins_wrapped_lines(tmp_path):
+    p = tmp_path / "act.txt"
+    p.write_text("first line\nstill first\n\n\nsecond para\n", encoding="utf-8")
+    assert list(iter_paragraphs(p)) == ["first line still first", "second para"]
+
+
+def test_sections_start_new_chunks_without_overlap():
+    paras = ["Preamble words.", "Section 1. Short title and extent.", "Section 2. Definitions."]
+    chunks = list(chunk_paragraphs(paras, chunk_size=50, overlap=5))
+    assert [c["section"] for c in chunks] == [None, "Section 1", "Section 2"]
+    assert chunks[2]["text"] == "Section 2. Definitions."
+
+
+def test_long_paragraph_is_split_with_overlap():
+    words = [f"w{i}" for i in range(25)]
+    chunks = list(chunk_paragraphs([" ".join(words)], chunk_size=10, overlap=2))
+    texts = [c["text"].split() for c in chunks]
+    assert texts[0] == words[:10]
+    assert texts[1][:2] == words[8:10]
+    assert texts[-1][-1] == "w24"
+    assert all("\n\n" not in c["text"] for c in chunks)
+
+
+def test_chunk_file_ids_and_meta(tmp_path):
+    p = tmp_path / "ipc.txt"
+    p.write_text("Section 299. Culpable homicide.\n\nSection 300. Murder.\n", encoding="utf-8")
+    docs = list(chunk_file(p, chunk_size=100, overlap=10))
+    assert [d.id for d in docs] == ["ipc.txt#0", "ipc.txt#1"]
+    assert docs[1].meta["section"] == "Section 300"
+    assert docs[1].meta["source"] == "ipc.txt"
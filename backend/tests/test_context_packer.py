@@ -0,0 +1,61 @@
+import re
+
+import pytest
+
+from app.core import context_packer, llm
+from app.core.context_packer import MIN_TRIM_TOKENS, count_tokens, pack_contexts, trim_to_tokens
+from app.core.vector_store import Document
+
+
+def _doc(i, words, tokens=None):
+    meta = {"tokens": tokens} if tokens is not None else {}
+    return Document(id=f"d{i}", text=" ".join(f"w{i}x{j}" for j in range(words)), meta=meta)
+
+
+def test_packs_by_score_then_trims_and_drops():
+    base = pack_contexts("What is bail?", [], max_input_tokens=10_000).reserved_tokens
+    hits = [(_doc(1, 50), 0.2), (_doc(2, 50), 0.9), (_doc(3, 200), 0.5), (_doc(4, 10), 0.1)]
+    budget = base + count_tokens(hits[1][0].text) + 120
+    packed = pack_contexts("What is bail?", hits, max_input_tokens=budget)
+    status = {d.id: d.status for d in packed.decisions}
+    # Highest score first, the big passage is trimmed to what is left, the rest dropped
+    assert [d.id for d in packed.decisions] == ["d2", "d3", "d1", "d4"]
+    assert status == {"d2": "full", "d3": "trimmed", "d1": "dropped", "d4": "dropped"}
+    assert packed.used_tokens <= packed.budget
+    assert packed.contexts[0] == hits[1][0].text
+    assert packed.context_keys()[0] == "d2" and packed.context_keys()[1].startswith("d3:")
+
+
+def test_uses_precomputed_token_counts():
+    packed = pack_contexts("q", [(_doc(1, 5, tokens=10_000), 1.0)], max_input_tokens=500)
+    assert packed.decisions[0].tokens == 10_000
+
+
+def test_question_must_fit():
+    with pytest.raises(ValueError):
+        pack_contexts("long " * 500, [], max_input_tokens=100)
+
+
+def test_trim_respects_budget():
+    text = " ".join(["negligence"] * 100)
+    assert count_tokens(trim_to_tokens(text, 20)) <= 20
+
+
+class _Tokenizer:
+    """Word pieces plus one token per newline, with a BOS token unless special tokens are off."""
+
+    def __call__(self, text, add_special_tokens=True):
+        ids = [0] * len(re.findall(r"\w+|[^\w\s]|\n", text))
+        return {"input_ids": ([1] if add_special_tokens else []) + ids}
+
+
+@pytest.mark.parametrize("n_docs", [1, 3, 8])
+def test_packed_prompt_fits_the_model_input(monkeypatch, n_docs):
+    monkeypatch.setattr(context_packer, "_tokenizer", lambda: _Tokenizer())
+    hits = [(_doc(i, 100), 1.0 - i / 100) for i in range(n_docs)]
+    limit = context_packer.count_prompt_tokens(llm.build_prompt("What is bail?", [d.text for d, _ in hits])) - 5
+    packed = pack_contexts("What is bail?", hits, max_input_tokens=limit)
+    prompt_tokens = _Tokenizer()(llm.build_prompt("What is bail?", packed.contexts))["input_ids"]
+    assert len(prompt_tokens) <= limit
+    # Nearly full: nothing beyond the safety margin is wasted
+    assert len(prompt_tokens) >= limit - context_packer.SAFETY_TOKENS - MIN_TRIM_TOKENS
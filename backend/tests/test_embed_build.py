@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from app.core.embed_build import EmbedBuildSettings, encode_sharded, read_status
+
+from test_embedding_store import BagOfWordsEncoder
+
+
+class FlakyEncoder(BagOfWordsEncoder):
+    def __init__(self, fail_after):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def encode(self, texts, **kwargs):
+        self.calls += 1
+        if self.calls > self.fail_after:
+            raise RuntimeError("worker died")
+        return super().encode(texts, **kwargs)
+
+
+def test_resume_skips_finished_shards(tmp_path):
+    texts = [f"contract {i}" for i in range(10)]
+    settings = EmbedBuildSettings(workers=1, batch_size=4, shard_size=3)
+    with pytest.raises(RuntimeError):
+        encode_sharded(texts, tmp_path, FlakyEncoder(fail_after=2), "fake", {"generation": "2"}, settings)
+    status = read_status(tmp_path)
+    assert status.state == "failed" and status.shards_done == 2
+
+    enc = FlakyEncoder(fail_after=100)
+    embs = encode_sharded(texts, tmp_path, enc, "fake", {"generation": "2"}, settings)
+    # 4 shards total, 2 were checkpointed before the crash
+    assert enc.calls == 2
+    assert embs.shape == (10, 4)
+    np.testing.assert_allclose(embs, encode_sharded(texts, tmp_path / "fresh", BagOfWordsEncoder(), "fake", {}, settings))
+    assert not (tmp_path / "embed_checkpoints").exists()
+    assert read_status(tmp_path).resumed_shards == 2
+
+
+def test_checkpoints_from_other_generation_are_discarded(tmp_path):
+    texts = [f"bail {i}" for i in range(6)]
+    settings = EmbedBuildSettings(workers=1, shard_size=2)
+    with pytest.raises(RuntimeError):
+        encode_sharded(texts, tmp_path, FlakyEncoder(fail_after=1), "fake", {"generation": "2"}, settings)
+    enc = FlakyEncoder(fail_after=100)
+    encode_sharded(texts, tmp_path, enc, "fake", {"generation": "4"}, settings)
+    assert enc.calls == 3
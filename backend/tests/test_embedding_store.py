@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.core.embedding_store import EmbeddingStore
+from app.core.vector_store import Document, TfidfStore
+
+VOCAB = ["contract", "negligence", "bail", "arbitration"]
+
+
+class BagOfWordsEncoder:
+    """Deterministic stand-in for a SentenceTransformer in tests."""
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        return np.array([[t.lower().count(w) + 0.01 for w in VOCAB] for t in texts], dtype=np.float32)
+
+
+def _index(path):
+    store = TfidfStore(path)
+    store.add_texts(
+        [
+            Document(id="a", text="contract contract offer", meta={}),
+            Document(id="b", text="negligence duty of care", meta={}),
+            Document(id="c", text="bail is the rule", meta={}),
+        ]
+    )
+    store.build()
+
+
+def test_build_writes_normalized_npy(tmp_path):
+    _index(tmp_path)
+    store = EmbeddingStore(tmp_path, model=BagOfWordsEncoder())
+    assert store.build() == 3
+    embs = np.load(tmp_path / "embeddings.npy")
+    assert embs.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(embs, axis=1), 1.0, rtol=1e-5)
+
+
+def test_search_uses_mmap_and_ranks(tmp_path):
+    _index(tmp_path)
+    EmbeddingStore(tmp_path, model=BagOfWordsEncoder()).build()
+    store = EmbeddingStore(tmp_path, model=BagOfWordsEncoder()).load()
+    assert isinstance(store.embs, np.memmap)
+    hits = store.search("bail", k=2)
+    assert hits[0][0].id == "c"
+    assert hits[0][1] > hits[1][1]
+
+
+def test_ann_backend_persists_and_accepts_query_params(tmp_path):
+    pytest.importorskip("hnswlib")
+    _index(tmp_path)
+    EmbeddingStore(tmp_path, model=BagOfWordsEncoder()).build(ann="hnsw", ann_params={"M": 8})
+    store = EmbeddingStore(tmp_path, model=BagOfWordsEncoder()).load()
+    assert store.ann.kind == "hnsw"
+    assert store.search("negligence", k=1, ef=8)[0][0].id == "b"
+    # Rebuilding without naming a backend keeps the recorded one
+    store.build()
+    assert json.loads((tmp_path / "ann.json").read_text())["kind"] == "hnsw"
+
+
+def test_ivfpq_builds_on_a_small_corpus():
+    pytest.importorskip("faiss")
+    from app.core.ann import build_ann_index
+
+    rng = np.random.default_rng(0)
+    embs = rng.standard_normal((100, 64)).astype(np.float32)
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+    index = build_ann_index("ivfpq", embs)
+    _, ids = index.search(embs[:5], 3)
+    assert ids.shape == (5, 3) and (ids >= 0).all()
+
+
+def test_search_batch_matches_single_queries(tmp_path):
+    _index(tmp_path)
+    store = EmbeddingStore(tmp_path, model=BagOfWordsEncoder())
+    store.build()
+    qs = ["bail", "contract", "negligence"]
+    batched = store.search_batch(qs, k=2)
+    for q, hits in zip(qs, batched):
+        assert [(r.id, round(s, 6)) for r, s in hits] == [(r.id, round(s, 6)) for r, s in store.search(q, k=2)]
@@ -0,0 +1,41 @@
+import threading
+
+from app.core.encoder_registry import EncoderRegistry
+
+from test_embedding_store import BagOfWordsEncoder
+
+
+class RecordingEncoder(BagOfWordsEncoder):
+    def __init__(self):
+        self.batch_sizes = []
+        self.threads = set()
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.batch_sizes.append(batch_size)
+        self.threads.add(threading.get_ident())
+        return super().encode(texts, **kwargs)
+
+
+def test_one_encoder_per_model_and_device():
+    loads = []
+    reg = EncoderRegistry(loader=lambda name, device: loads.append((name, device)) or RecordingEncoder())
+    first = reg.get("mini", "cpu")
+    assert reg.get("mini", "cpu") is first
+    assert reg.get("mini", "cuda") is not first
+    assert loads == [("mini", "cpu"), ("mini", "cuda")]
+
+
+def test_encode_is_serialized_and_batch_capped():
+    reg = EncoderRegistry(loader=lambda name, device: RecordingEncoder())
+    enc = reg.get("mini", "cpu")
+    enc.max_batch_size = 8
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(enc.encode(["bail"] * 3, batch_size=100))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    assert len(out) == 4 and out[0].shape == (3, 4)
+    # Every call ran on the encoder's own thread with the capped batch size
+    assert len(enc.model.threads) == 1 and set(enc.model.batch_sizes) == {8}
+    assert enc.stats()["calls"] == 4
@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.context_packer import PackResult
+from app.core.executor import BoundedExecutor, Overloaded
+
+
+def test_rejects_when_workers_and_queue_are_full():
+    ex = BoundedExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+    running = ex.submit(release.wait)
+    queued = ex.submit(lambda: "queued")
+    with pytest.raises(Overloaded) as err:
+        ex.submit(lambda: None)
+    assert err.value.retry_after >= 1
+    release.set()
+    running.result(timeout=5)
+    assert queued.result(timeout=5) == "queued"
+    # Slots are returned once tasks finish
+    assert ex.submit(lambda: 1).result(timeout=5) == 1
+    assert ex.stats()["rejected"] == 1
+
+
+def test_full_inference_pool_returns_503_with_retry_after(monkeypatch):
+    from app.main import app
+    from app.routers import generate
+
+    busy = BoundedExecutor("inference", max_workers=1, max_queue=0)
+    release = threading.Event()
+    busy.submit(release.wait)
+    monkeypatch.setattr(generate, "inference_executor", busy)
+    monkeypatch.setattr(generate, "_retrieve", lambda q, k: (PackResult([], 0, 0, 0), None, None))
+    try:
+        resp = TestClient(app).post("/generate/", json={"question": "What is bail?"})
+    finally:
+        release.set()
+    assert resp.status_code == 503
+    assert int(resp.headers["Retry-After"]) >= 1
+
+
+def test_batch_requests_cap_the_question_count():
+    from app.core.executor import MAX_BATCH_QUESTIONS
+    from app.main import app
+
+    client = TestClient(app)
+    for path in ("/query/batch", "/hybrid/batch"):
+        resp = client.post(path, json={"questions": ["bail"] * (MAX_BATCH_QUESTIONS + 1)})
+        assert resp.status_code == 422, path
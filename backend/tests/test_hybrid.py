@@ -0,0 +1,64 @@
+import pytest
+
+from app.core import hybrid
+from app.core.embedding_store import EmbeddingStore
+from app.core.fusion import fuse
+
+from test_embedding_store import BagOfWordsEncoder, _index
+
+
+def test_rrf_rewards_agreement_across_backends():
+    rankings = {"tfidf": [(0, 0.9), (1, 0.5)], "embedding": [(1, 0.8), (2, 0.7)]}
+    top = fuse(rankings, k=3, method="rrf", weights={"tfidf": 0.5, "embedding": 0.5})
+    assert [row for row, _, _ in top] == [1, 0, 2]
+    assert top[0][2] == {"tfidf": 2, "embedding": 1}
+
+
+def test_weighted_normalizes_each_backend():
+    # Raw embedding scores are far larger but min-max puts both on [0, 1]
+    rankings = {"tfidf": [(0, 0.2), (1, 0.1)], "embedding": [(1, 90.0), (0, 10.0)]}
+    top = fuse(rankings, k=2, method="weighted", weights={"tfidf": 0.75, "embedding": 0.25})
+    assert [row for row, _, _ in top] == [0, 1]
+    assert top[0][1] == pytest.approx(0.75)
+
+
+def test_unknown_method_raises():
+    with pytest.raises(ValueError):
+        fuse({"tfidf": [(0, 1.0)]}, k=1, method="borda")
+
+
+def test_retriever_fuses_by_row_and_reports_timings(tmp_path, monkeypatch):
+    _index(tmp_path)
+    EmbeddingStore(tmp_path, model=BagOfWordsEncoder()).build()
+    emb = EmbeddingStore(tmp_path, model=BagOfWordsEncoder(), model_name="bow").load()
+    monkeypatch.setattr(hybrid, "get_embedding_store", lambda _: emb)
+    hy = hybrid.HybridRetriever(tmp_path)
+    hits = hy.search(["bail rule"], k=2, depth=3)[0]
+    assert hits[0].doc.id == "c"
+    assert set(hits[0].ranks) == {"tfidf", "embedding"}
+    assert set(hy.timings) == {"tfidf_ms", "embedding_ms", "fusion_ms"}
+    assert hy.query("bail rule", k=1)[0][0].id == "c"
+
+
+def test_retriever_uses_bm25_as_lexical_backend(tmp_path):
+    _index(tmp_path)
+    hy = hybrid.HybridRetriever(tmp_path, lexical="bm25")
+    hits = hy.search(["bail rule"], k=1, depth=3)[0]
+    assert hits[0].doc.id == "c"
+    assert "bm25" in hits[0].ranks and "tfidf" not in hits[0].ranks
+    assert "bm25_ms" in hy.timings
+    with pytest.raises(ValueError):
+        hybrid.HybridRetriever(tmp_path, lexical="lucene")
+
+
+def test_warm_fills_the_keys_hybrid_search_reads(tmp_path, monkeypatch):
+    from app.core.query_cache import retrieval_results
+
+    _index(tmp_path)
+    EmbeddingStore(tmp_path, model=BagOfWordsEncoder()).build()
+    emb = EmbeddingStore(tmp_path, model=BagOfWordsEncoder(), model_name="bow").load()
+    monkeypatch.setattr(hybrid, "get_embedding_store", lambda _: emb)
+    hybrid.warm(tmp_path, ["bail rule"], [3])
+    misses = retrieval_results.misses
+    hybrid.HybridRetriever(tmp_path).search(["bail rule"], k=3)
+    assert retrieval_results.misses == misses
@@ -0,0 +1,140 @@
+import numpy as np
+
+from app.core import incremental
+from app.core.embedding_store import EmbeddingStore
+from app.core.incremental import load_manifest, sync_index
+from app.core.vector_store import TfidfStore, read_generation
+
+from test_embedding_store import BagOfWordsEncoder
+
+
+def _write(d, name, text):
+    (d / name).write_text(text, encoding="utf-8")
+
+
+def test_first_sync_builds_then_noop(tmp_path):
+    data, idx = tmp_path / "data", tmp_path / "index"
+    data.mkdir()
+    _write(data, "a.txt", "contract offer acceptance")
+    _write(data, "b.txt", "negligence duty of care")
+    res = sync_index(data, idx)
+    assert res.rebuilt and res.chunks == 2
+    res = sync_index(data, idx)
+    assert not res.rebuilt and res.new_chunks == 0 and res.unchanged_files == 2
+
+
+def test_add_change_delete_without_refit(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, "COMPACT_RATIO", 10.0)
+    data, idx = tmp_path / "data", tmp_path / "index"
+    data.mkdir()
+    _write(data, "a.txt", "contract offer acceptance")
+    _write(data, "b.txt", "negligence duty of care")
+    sync_index(data, idx)
+    before = (idx / "idf.npy").stat().st_mtime_ns
+
+    _write(data, "c.txt", "contract breach damages")
+    # Appended rows reuse the fitted vocabulary, so stick to known terms
+    _write(data, "b.txt", "duty owed by the negligent party")
+    (data / "a.txt").unlink()
+    res = sync_index(data, idx)
+    assert (res.added_files, res.changed_files, res.removed_files) == (1, 1, 1)
+    assert res.chunks == 2
+    # Vectorizer was not refitted
+    assert (idx / "idf.npy").stat().st_mtime_ns == before
+
+    store = TfidfStore(idx)
+    ids = [d.id for d, _ in store.query("contract", k=5)]
+    assert "a.txt#0" not in ids and "c.txt#0" in ids
+    hits = store.query("duty", k=5)
+    assert [d.text for d, _ in hits if d.id == "b.txt#0"] == ["duty owed by the negligent party"]
+
+
+def test_compaction_refits_and_filters_embeddings(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, "COMPACT_RATIO", 0.3)
+    data, idx = tmp_path / "data", tmp_path / "index"
+    data.mkdir()
+    for name, text in [("a.txt", "contract offer"), ("b.txt", "negligence care"), ("c.txt", "bail rule")]:
+        _write(data, name, text)
+    sync_index(data, idx)
+    enc = BagOfWordsEncoder()
+    EmbeddingStore(idx, model=enc).build()
+
+    _write(data, "d.txt", "arbitration clause")
+    (data / "a.txt").unlink()
+    res = sync_index(data, idx, encoder=enc)
+    assert res.compacted
+    store = TfidfStore(idx)
+    store._load()
+    assert len(store.docs) == 3 and len(store.tombstones) == 0
+    embs = np.load(idx / "embeddings.npy")
+    assert embs.shape[0] == 3
+    manifest = load_manifest(idx)
+    assert sorted(r for e in manifest["sources"].values() for r in e["rows"]) == [0, 1, 2]
+    emb = EmbeddingStore(idx, model=enc).load()
+    assert emb.search("arbitration", k=1)[0][0].id == "d.txt#0"
+
+
+def test_embeddings_append_only_new_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, "COMPACT_RATIO", 10.0)
+    data, idx = tmp_path / "data", tmp_path / "index"
+    data.mkdir()
+    _write(data, "a.txt", "contract offer")
+    sync_index(data, idx)
+    enc = BagOfWordsEncoder()
+    EmbeddingStore(idx, model=enc).build()
+    first_row = np.load(idx / "embeddings.npy")[0].copy()
+
+    calls = []
+    orig = enc.encode
+    enc.encode = lambda texts, **kw: calls.append(list(texts)) or orig(texts, **kw)
+    _write(data, "b.txt", "bail rule")
+    sync_index(data, idx, encoder=enc)
+    assert calls == [["bail rule"]]
+    embs = np.load(idx / "embeddings.npy")
+    assert embs.shape[0] == 2
+    np.testing.assert_array_equal(embs[0], first_row)
+
+
+def test_rebuild_drops_embeddings_before_the_new_rows_commit(tmp_path, monkeypatch):
+    from app.core import index_format
+
+    data, idx = tmp_path / "data", tmp_path / "index"
+    data.mkdir()
+    _write(data, "a.txt", "contract offer")
+    sync_index(data, idx)
+    EmbeddingStore(idx, model=BagOfWordsEncoder()).build()
+
+    seen = []
+    orig_commit = index_format.commit
+    monkeypatch.setattr(
+        index_format, "commit", lambda *a, **kw: seen.append((idx / "embeddings.npy").exists()) or orig_commit(*a, **kw)
+    )
+    sync_index(data, idx, rebuild=True)
+    assert seen == [False]
+    assert not (idx / "embeddings.npy").exists()
+
+
+def test_compaction_filters_embeddings_before_the_new_rows_commit(tmp_path, monkeypatch):
+    from app.core import index_format
+
+    monkeypatch.setattr(incremental, "COMPACT_RATIO", 0.3)
+    data, idx = tmp_path / "data", tmp_path / "index"
+    data.mkdir()
+    for name, text in [("a.txt", "contract offer"), ("b.txt", "negligence care"), ("c.txt", "bail rule")]:
+        _write(data, name, text)
+    sync_index(data, idx)
+    enc = BagOfWordsEncoder()
+    EmbeddingStore(idx, model=enc).build()
+
+    seen = []
+    orig_commit = index_format.commit
+    monkeypatch.setattr(
+        index_format, "commit", lambda *a, **kw: seen.append(len(np.load(idx / "embeddings.npy"))) or orig_commit(*a, **kw)
+    )
+    (data / "a.txt").unlink()
+    (data / "b.txt").unlink()
+    generation = read_generation(idx)
+    assert sync_index(data, idx, encoder=enc).compacted
+    # One bracket: the filtered vectors are in place when the compacted rows are published
+    assert seen == [1]
+    assert int(read_generation(idx)) == int(generation) + 4
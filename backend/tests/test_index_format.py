@@ -0,0 +1,100 @@
+import json
+
+import joblib
+import numpy as np
+
+from app.core import index_format
+from app.core.index_format import Blob, BlobWriter, append_blob, has_index
+from app.core.vector_store import Document, TfidfStore
+
+
+def _docs():
+    return [
+        Document(id="a", text="offer and acceptance\n\nform a contract", meta={"page": 1}),
+        Document(id="b", text="negligence requires a duty of care", meta={}),
+        Document(id="c", text="bail is the rule — jail the exception", meta={"tags": ["crpc"]}),
+    ]
+
+
+def test_blob_round_trip_and_append(tmp_path):
+    writer = BlobWriter(tmp_path, "t", suffix="")
+    for s in ["", "naïve", "two\n\nlines"]:
+        writer.add(s)
+    writer.close()
+    append_blob(tmp_path, "t", ["more"])
+    blob = Blob(tmp_path, "t")
+    assert list(blob) == ["", "naïve", "two\n\nlines", "more"]
+
+
+def test_build_writes_mmapped_format(tmp_path):
+    store = TfidfStore(tmp_path)
+    store.add_texts(_docs())
+    store.build()
+    assert json.loads((tmp_path / "format.json").read_text())["version"] == index_format.FORMAT_VERSION
+    assert not (tmp_path / "matrix.joblib").exists()
+
+    loaded = TfidfStore(tmp_path)
+    loaded._load()
+    assert isinstance(np.load(tmp_path / "matrix.data.npy", mmap_mode="r"), np.memmap)
+    assert [(d.id, d.text, d.meta) for d in loaded.docs] == [(d.id, d.text, d.meta) for d in _docs()]
+    assert abs(loaded.matrix - store.matrix).sum() < 1e-12
+    assert loaded.query("duty of care", k=1)[0][0].id == "b"
+
+
+def test_update_appends_in_place(tmp_path):
+    store = TfidfStore(tmp_path)
+    store.add_texts(_docs()[:2])
+    store.build()
+    assert store.update(add=[_docs()[2]]) == [2]
+    loaded = TfidfStore(tmp_path)
+    # Appended rows use the fitted vocabulary
+    assert loaded.query("care duty", k=1)[0][0].id == "b"
+    assert loaded.matrix.shape[0] == 3
+    assert (loaded.docs[2].text, loaded.docs[2].meta) == (_docs()[2].text, {"tags": ["crpc"]})
+
+
+def test_legacy_index_loads_and_upgrades(tmp_path):
+    fitted = TfidfStore(tmp_path / "fit")
+    fitted.add_texts(_docs()[1:])
+    fitted.build()
+    (tmp_path / "texts.txt").write_text("\n\n".join(d.text for d in fitted.docs), encoding="utf-8")
+    (tmp_path / "docs.json").write_text(json.dumps([{"id": d.id, "meta": d.meta} for d in fitted.docs]))
+    joblib.dump(fitted.vectorizer, tmp_path / "vectorizer.joblib")
+    joblib.dump(fitted.matrix, tmp_path / "matrix.joblib")
+    assert has_index(tmp_path)
+
+    legacy = TfidfStore(tmp_path)
+    assert legacy.query("bail", k=1)[0][0].id == "c"
+    assert legacy.upgrade() and not legacy.upgrade()
+    assert not (tmp_path / "texts.txt").exists()
+    assert TfidfStore(tmp_path).query("bail", k=1)[0][0].id == "c"
+
+
+def test_loaded_docs_are_lazy_and_cached(tmp_path):
+    from app.core import query_cache
+    from app.core.vector_store import PassageTable
+
+    store = TfidfStore(tmp_path)
+    store.add_texts(_docs())
+    store.build()
+    loaded = TfidfStore(tmp_path)
+    loaded._load()
+    assert isinstance(loaded.docs, PassageTable)
+    before = query_cache.passages.stats()["hits"]
+    loaded.query("bail rule", k=1)
+    assert loaded.query("bail rule", k=1)[0][0].id == "c"
+    assert query_cache.passages.stats()["hits"] > before
+
+
+def test_query_without_text_returns_references(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.routers import query
+
+    store = TfidfStore(tmp_path)
+    store.add_texts(_docs())
+    store.build()
+    monkeypatch.setattr(query, "INDEX_DIR", tmp_path)
+    hit = TestClient(app).post("/query/", json={"question": "bail", "k": 1, "include_text": False}).json()["hits"][0]
+    assert (hit["id"], hit["text"], hit["meta"]) == ("c", None, {"tags": ["crpc"]})
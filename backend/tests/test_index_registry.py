@@ -0,0 +1,55 @@
+from app.core.index_registry import IndexRegistry
+from app.core.vector_store import Document, TfidfStore, read_generation
+
+
+def _build(path, texts):
+    store = TfidfStore(path)
+    store.add_texts([Document(id=f"d{i}", text=t, meta={}) for i, t in enumerate(texts)])
+    store.build()
+
+
+def test_registry_reuses_loaded_store(tmp_path):
+    _build(tmp_path, ["contract law offer acceptance", "criminal negligence penalty"])
+    reg = IndexRegistry()
+    first = reg.tfidf(tmp_path)
+    assert reg.tfidf(tmp_path) is first
+    assert first.query("negligence", k=1)[0][0].id == "d1"
+
+
+def test_registry_reloads_on_new_generation(tmp_path):
+    _build(tmp_path, ["contract law offer acceptance", "criminal negligence penalty"])
+    reg = IndexRegistry()
+    first = reg.tfidf(tmp_path)
+    gen = read_generation(tmp_path)
+
+    _build(tmp_path, ["arbitration clause seat", "force majeure event", "tort of nuisance"])
+    assert read_generation(tmp_path) != gen
+    second = reg.tfidf(tmp_path)
+    assert second is not first
+    assert len(second.docs) == 3
+    # The old snapshot is left intact for requests still holding it
+    assert len(first.docs) == 2
+
+
+def test_registry_keeps_old_copy_while_writer_mid_swap(tmp_path):
+    _build(tmp_path, ["contract law offer acceptance", "criminal negligence penalty"])
+    reg = IndexRegistry()
+    first = reg.tfidf(tmp_path)
+    # Simulate a writer that has started (odd generation) but not finished
+    (tmp_path / "GENERATION").write_text(str(int(read_generation(tmp_path)) + 1))
+    assert reg.tfidf(tmp_path) is first
+
+
+def test_first_load_waits_for_writer_to_finish(tmp_path):
+    import threading
+    import time
+
+    _build(tmp_path, ["contract law offer acceptance", "criminal negligence penalty"])
+    gen = int(read_generation(tmp_path))
+    (tmp_path / "GENERATION").write_text(str(gen + 1))
+    finish = threading.Timer(0.2, lambda: (tmp_path / "GENERATION").write_text(str(gen + 2)))
+    finish.start()
+    start = time.monotonic()
+    store = IndexRegistry().tfidf(tmp_path)
+    assert time.monotonic() - start >= 0.15
+    assert store.generation == str(gen + 2)
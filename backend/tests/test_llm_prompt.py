@@ -0,0 +1,26 @@
+import pytest
+
+from app.core import llm
+from app.core.quant import quantize
+
+
+def test_prompt_starts_with_cacheable_prefix():
+    prompt = llm.build_prompt("What is bail?", ["bail is the rule", "jail the exception"])
+    assert prompt.startswith(llm.PROMPT_PREFIX)
+    # Everything request-specific comes after the shared prefix
+    assert "bail is the rule" not in llm.PROMPT_PREFIX
+    assert prompt.endswith("<|question|>\nWhat is bail?\n<|answer|>")
+
+
+def test_usage_reports_cached_vs_computed_prompt_tokens():
+    usage = llm._usage(tokens_in=120, tokens_out=30, cached=70)
+    assert usage["prompt_tokens"] == 120
+    assert usage["prompt_tokens_cached"] == 70
+    assert usage["prompt_tokens_computed"] == 50
+    assert usage["total_tokens"] == 150
+
+
+def test_unknown_quant_mode_is_rejected():
+    assert quantize("model", "none") == "model"
+    with pytest.raises(ValueError):
+        quantize("model", "int4")
@@ -0,0 +1,106 @@
+import threading
+from types import SimpleNamespace
+
+from app.core import llm
+
+
+def _fake_openai(pieces, seen):
+    def create(**kwargs):
+        seen.update(kwargs)
+        return iter([{"choices": [{"delta": {"content": p}}]} for p in pieces])
+
+    return SimpleNamespace(api_key=None, ChatCompletion=SimpleNamespace(create=create))
+
+
+def test_openai_stream_yields_deltas_then_summary(monkeypatch):
+    seen = {}
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(llm, "openai", _fake_openai(["Bail ", "is ", "the rule."], seen))
+    events = list(llm.generate_stream("What is bail?", ["bail is the rule"]))
+    assert seen["stream"] is True
+    assert "".join(e["delta"] for e in events[:-1]) == "Bail is the rule."
+    assert events[-1]["done"] and events[-1]["tokens_out"] == 3 and not events[-1]["cancelled"]
+
+
+def test_openai_stream_stops_when_cancelled(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(llm, "openai", _fake_openai(["a", "b", "c"], {}))
+    cancel = threading.Event()
+    out = []
+    for e in llm.generate_stream("q", [], cancel=cancel):
+        out.append(e)
+        cancel.set()
+    assert [e.get("delta") for e in out[:-1]] == ["a"]
+    assert out[-1]["cancelled"]
+
+
+def _echo_batch(calls):
+    def run_batch(prompts):
+        calls.append(list(prompts))
+        return [
+            llm.GenerationResult(prompt=p, completion=p.upper(), model="fake", tokens_in=len(p), tokens_out=1, usage={})
+            for p in prompts
+        ]
+
+    return run_batch
+
+
+def _submit_concurrently(sched, prompts):
+    out = {}
+    threads = [threading.Thread(target=lambda p=p: out.__setitem__(p, sched.submit(p))) for p in prompts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    return out
+
+
+def test_scheduler_coalesces_concurrent_prompts():
+    calls = []
+    sched = llm.BatchScheduler(_echo_batch(calls), length_fn=len, max_batch_size=4, max_wait_ms=200, bucket_tokens=100)
+    out = _submit_concurrently(sched, ["aa", "bb", "cc"])
+    assert {p: r.completion for p, r in out.items()} == {"aa": "AA", "bb": "BB", "cc": "CC"}
+    assert len(calls) == 1 and sorted(calls[0]) == ["aa", "bb", "cc"]
+    assert out["aa"].usage["batch_size"] == 3
+    assert sched.stats()["avg_batch_size"] == 3
+
+
+def test_scheduler_buckets_by_length():
+    calls = []
+    sched = llm.BatchScheduler(_echo_batch(calls), length_fn=len, max_batch_size=4, max_wait_ms=200, bucket_tokens=5)
+    _submit_concurrently(sched, ["ab", "cd", "a much longer prompt"])
+    assert sorted(map(sorted, calls)) == [["a much longer prompt"], ["ab", "cd"]]
+
+
+def test_concurrent_generate_requests_are_batched_with_default_pool(monkeypatch):
+    import asyncio
+
+    from app.core import executor
+    from app.core.context_packer import PackResult
+    from app.routers import generate
+
+    # Default config: a single inference worker
+    assert executor.inference_executor.max_workers == 1
+    calls = []
+    echo = _echo_batch(calls)
+
+    def run_batch(prompts):
+        results = echo(prompts)
+        for r in results:
+            r.usage = llm._usage(r.tokens_in, r.tokens_out, 0)
+        return results
+
+    sched = llm.BatchScheduler(run_batch, length_fn=len, max_batch_size=4, max_wait_ms=200, bucket_tokens=10_000)
+    monkeypatch.setattr(llm, "_scheduler", lambda: sched)
+    monkeypatch.setattr(generate, "_retrieve", lambda q, k: (PackResult([], 0, 0, 0), None, None))
+
+    async def ask_all():
+        reqs = [generate.GenerateRequest(question=f"Batched question {i}?") for i in range(4)]
+        return await asyncio.gather(*(generate.generate_answer(r) for r in reqs))
+
+    completed = executor.inference_executor.stats()["completed"]
+    answers = asyncio.run(ask_all())
+    assert len(calls) == 1 and len(calls[0]) == 4
+    # The one batch ran on the bounded inference pool
+    assert executor.inference_executor.stats()["completed"] == completed + 1
+    assert sorted(a.answer for a in answers) == sorted(llm.build_prompt(f"Batched question {i}?", []).upper() for i in range(4))
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import llm
+
+
+@pytest.fixture
+def slot(monkeypatch):
+    monkeypatch.setattr(llm, "load_model", lambda quant, model_name, adapter: ("tok", f"{model_name}+{adapter}", "cpu"))
+    return llm._ModelSlot(llm.ModelSpec("base"))
+
+
+def test_swap_waits_for_in_flight_generation(slot):
+    done = {}
+    with slot.use() as (_, model, _):
+        assert model == "base+None"
+        swapper = threading.Thread(target=lambda: done.update(slot.swap(llm.ModelSpec("base", "run2"), drain_timeout=5)))
+        swapper.start()
+        time.sleep(0.1)
+        # Still serving the old model while the generation is running
+        assert slot.spec.adapter is None and not done
+    swapper.join(timeout=5)
+    assert done["current"] == "base+run2"
+    with slot.use() as (_, model, _):
+        assert model == "base+run2"
+
+
+def test_swap_times_out_without_switching(slot):
+    with slot.use():
+        with pytest.raises(TimeoutError):
+            slot.swap(llm.ModelSpec("other"), drain_timeout=0.05)
+    assert slot.spec.model == "base"
+    assert not slot.status()["swapping"]
+
+
+def test_status_does_not_wait_for_first_load(monkeypatch):
+    release = threading.Event()
+
+    def slow_load(quant, model_name, adapter):
+        release.wait(5)
+        return ("tok", model_name, "cpu")
+
+    monkeypatch.setattr(llm, "load_model", slow_load)
+    slot = llm._ModelSlot(llm.ModelSpec("base"))
+    loader = threading.Thread(target=slot.get)
+    loader.start()
+    time.sleep(0.05)
+    status = {}
+    probe = threading.Thread(target=lambda: status.update(slot.status()))
+    probe.start()
+    probe.join(timeout=1)
+    assert status and not status["loaded"]
+    release.set()
+    loader.join(timeout=5)
+    assert slot.status()["loaded"]
+
+
+def test_admin_endpoint_requires_token(monkeypatch):
+    from app.main import app
+    from app.routers import admin
+
+    client = TestClient(app)
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", None)
+    assert client.post("/admin/model", json={}).status_code == 403
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "s3cret")
+    assert client.post("/admin/model", json={}, headers={"X-Admin-Token": "nope"}).status_code == 401
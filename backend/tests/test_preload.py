@@ -0,0 +1,76 @@
+from fastapi.testclient import TestClient
+
+from app.core import preload as preload_mod
+from app.core.preload import Readiness, preload
+from app.core.vector_store import Document, TfidfStore, read_generation
+
+
+def test_preload_reports_each_component(tmp_path, monkeypatch):
+    store = TfidfStore(tmp_path)
+    store.add_texts([Document(id="a", text="bail is the rule", meta={}), Document(id="b", text="contract offer", meta={})])
+    store.build()
+    monkeypatch.setattr(preload_mod, "readiness", Readiness("background"))
+    monkeypatch.setattr(preload_mod, "_load_llm", lambda: "fake model on cpu")
+
+    preload(tmp_path, queries=["what is bail"])
+    report = preload_mod.readiness.report()
+    assert report["index"]["state"] == "ready" and report["index"]["seconds"] is not None
+    assert report["encoder"]["state"] == "skipped"
+    assert report["llm"] == {"state": "ready", "seconds": report["llm"]["seconds"], "detail": "fake model on cpu"}
+    assert report["warmup"]["state"] == "ready"
+    assert not preload_mod.readiness.loading
+
+
+def test_health_is_503_until_preloaded(monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main, "readiness", Readiness("background"))
+    resp = TestClient(main.app).get("/health")
+    assert resp.status_code == 503 and resp.json()["status"] == "starting"
+
+    monkeypatch.setattr(main, "readiness", Readiness("off"))
+    assert TestClient(main.app).get("/health").status_code == 200
+
+
+def test_health_answers_while_the_model_slot_is_busy(monkeypatch):
+    import threading
+
+    from app import main
+    from app.core import llm
+
+    monkeypatch.setattr(main, "readiness", Readiness("background"))
+    client = TestClient(main.app)
+    result = {}
+    # A load/swap holding the slot must not stall the probe
+    with llm._slot._cond:
+        probe = threading.Thread(target=lambda: result.update(status=client.get("/health").status_code))
+        probe.start()
+        probe.join(timeout=2)
+    assert result.get("status") == 503
+
+
+def test_health_index_detail_follows_the_current_generation(tmp_path, monkeypatch):
+    from app import main
+    from app.core.index_registry import IndexRegistry
+
+    store = TfidfStore(tmp_path)
+    store.add_texts([Document(id="a", text="bail is the rule", meta={}), Document(id="b", text="contract offer", meta={})])
+    store.build()
+    reg = IndexRegistry()
+    monkeypatch.setattr(preload_mod, "registry", reg)
+    monkeypatch.setattr(preload_mod, "get_tfidf_store", reg.tfidf)
+    monkeypatch.setattr(preload_mod, "readiness", Readiness("background"))
+    monkeypatch.setattr(preload_mod, "_load_llm", lambda: "fake model on cpu")
+    monkeypatch.setattr(main, "readiness", preload_mod.readiness)
+    monkeypatch.setattr(main, "INDEX_DIR", tmp_path)
+    preload(tmp_path, queries=[])
+    first = TestClient(main.app).get("/health").json()["components"]["index"]["detail"]
+    assert first == f"2 chunks, generation {store.generation}"
+
+    TfidfStore(tmp_path).update(add=[Document(id="c", text="arrest without warrant", meta={})], remove_rows=[])
+    stale = TestClient(main.app).get("/health").json()["components"]["index"]["detail"]
+    assert "on disk" in stale
+
+    reg.tfidf(tmp_path)
+    current = TestClient(main.app).get("/health").json()["components"]["index"]["detail"]
+    assert current == f"3 chunks, generation {read_generation(tmp_path)}"
@@ -0,0 +1,63 @@
+from app.core import query_cache
+from app.core.embedding_store import EmbeddingStore
+from app.core.query_cache import LRUCache, cached_batch
+from app.core.vector_store import Document, TfidfStore
+
+from test_embedding_store import BagOfWordsEncoder, _index
+
+
+class CountingEncoder(BagOfWordsEncoder):
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return super().encode(texts, **kwargs)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_cached_batch_computes_only_misses():
+    cache = LRUCache(8)
+    cache.put("x", "X")
+    seen = []
+
+    def compute(missing):
+        seen.append(missing)
+        return [f"v{i}" for i in missing]
+
+    assert cached_batch(cache, ["x", "y", None], compute) == ["X", "v1", "v2"]
+    assert seen == [[1, 2]]
+    assert cached_batch(cache, ["y"], compute) == ["v1"]
+
+
+def test_repeated_search_skips_encoder_and_scan(tmp_path):
+    _index(tmp_path)
+    encoder = CountingEncoder()
+    EmbeddingStore(tmp_path, model=BagOfWordsEncoder()).build()
+    store = EmbeddingStore(tmp_path, model=encoder, model_name="counting").load()
+    first = store.search_rows(["bail"], k=2)[0]
+    assert store.search_rows(["bail"], k=2)[0] is first
+    assert store.search("bail", k=2)[0][0].id == "c"
+    # A different k is a different result list but reuses the cached query vector
+    store.search("bail", k=1)
+    assert encoder.encoded == ["bail"]
+
+
+def test_new_generation_misses_results_cache(tmp_path):
+    store = TfidfStore(tmp_path)
+    store.add_texts([Document(id="a", text="contract offer", meta={}), Document(id="b", text="bail rule", meta={})])
+    store.build()
+    assert store.query("bail", k=1)[0][0].id == "b"
+    before = query_cache.retrieval_results.stats()["hits"]
+    store.update(add=[Document(id="c", text="bail bail rule", meta={})])
+    assert store.query("bail", k=1)[0][0].id == "c"
+    assert query_cache.retrieval_results.stats()["hits"] == before
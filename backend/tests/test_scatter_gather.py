@@ -0,0 +1,74 @@
+import json
+import time
+
+import httpx
+import pytest
+
+from app.core.hybrid import HybridRetriever
+from app.core.scatter_gather import ScatterGather, ShardUnavailable, parse_shard_urls, shard_passages, shard_search
+from app.core.sharding import split_index
+
+from test_sharding import _store
+
+
+def _client(dirs, slow=(), down=()):
+    """Serves /shard/* for `http://sN` from dirs[N]; `slow` hosts stall, `down` hosts return 500."""
+
+    def handler(request):
+        host = request.url.host
+        if host in down:
+            return httpx.Response(500)
+        if host in slow:
+            time.sleep(0.3)
+        index_dir = dirs[int(host.lstrip("sr").split("-")[0])]
+        body = json.loads(request.content)
+        if request.url.path == "/shard/search":
+            data = shard_search(index_dir, body["questions"], body["k"], body["backends"], body["params"])
+        else:
+            data = shard_passages(index_dir, body["rows"])
+        return httpx.Response(200, json=data)
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture
+def shards(tmp_path):
+    _store(tmp_path / "index")
+    return tmp_path / "index", split_index(tmp_path / "index", tmp_path / "shards", 2)
+
+
+def test_parse_shard_urls():
+    assert parse_shard_urls("http://a:1|http://a2:1/, http://b:2") == [["http://a:1", "http://a2:1"], ["http://b:2"]]
+
+
+def test_coordinator_matches_single_node(shards):
+    index_dir, dirs = shards
+    remote = ScatterGather([["http://s0"], ["http://s1"]], client=_client(dirs))
+    qs = ["contract damages", "duty of care bail"]
+    local = HybridRetriever(index_dir).query_batch(qs, k=3)
+    hy = HybridRetriever(index_dir, remote=remote)
+    merged = hy.query_batch(qs, k=3)
+    assert [[(d.id, d.text) for d, _ in hits] for hits in merged] == [[(d.id, d.text) for d, _ in hits] for hits in local]
+    assert not hy.partial and "scatter_ms" in hy.timings
+
+
+def test_hedged_request_beats_slow_replica(shards):
+    _, dirs = shards
+    remote = ScatterGather([["http://s0-slow", "http://r0"], ["http://s1"]], hedge_ms=20, client=_client(dirs, slow={"s0-slow"}))
+    start = time.perf_counter()
+    rankings, _, gathered = remote.search(["contract"], 3)
+    assert time.perf_counter() - start < 0.25
+    assert not gathered.partial and rankings[0]["tfidf"]
+    assert remote.stats()["http://s0-slow | http://r0"]["hedges"] == 1
+
+
+def test_failed_shard_degrades_to_partial(shards):
+    _, dirs = shards
+    remote = ScatterGather([["http://s0"], ["http://s1"]], hedge_ms=0, client=_client(dirs, down={"s1"}))
+    hy = HybridRetriever(dirs[0], remote=remote)
+    hits = hy.search(["contract offer"], k=3)[0]
+    assert hy.partial and hits and all(h.doc.id in {"d0", "d1", "d2"} for h in hits)
+
+    strict = ScatterGather([["http://s0"], ["http://s1"]], hedge_ms=0, allow_partial=False, client=_client(dirs, down={"s1"}))
+    with pytest.raises(ShardUnavailable):
+        strict.search(["contract"], 3)
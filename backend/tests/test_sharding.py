@@ -0,0 +1,63 @@
+import numpy as np
+
+from app.core import topk
+
+from app.core.sharding import ShardedMatrix, merge_topk, read_shard_info, shard_bounds, split_index
+from app.core.vector_store import Document, TfidfStore
+
+TEXTS = [
+    "offer and acceptance form a contract",
+    "breach of contract gives damages",
+    "negligence requires a duty of care",
+    "duty of care owed to neighbours",
+    "bail is the rule and jail the exception",
+    "anticipatory bail under section 438",
+    "contract void for lack of consideration",
+]
+
+
+def _store(path):
+    store = TfidfStore(path)
+    store.add_texts([Document(id=f"d{i}", text=t, meta={"i": i}) for i, t in enumerate(TEXTS)])
+    store.build()
+    return store
+
+
+def test_shard_bounds_respect_min_rows():
+    assert shard_bounds(10, 4, min_rows=1) == [(0, 2), (2, 5), (5, 7), (7, 10)]
+    assert shard_bounds(10, 4, min_rows=6) == [(0, 10)]
+
+
+def test_sharded_scores_match_single_shard(tmp_path):
+    store = _store(tmp_path)
+    q = store.vectorizer.transform(["contract duty bail", "care"])
+    dead = np.array([1], dtype=np.int64)
+    whole_idx, whole_scores = ShardedMatrix(store.matrix, n_shards=1).top_k(q, 4, dead)
+    idx, scores = ShardedMatrix(store.matrix, n_shards=3, min_rows=1).top_k(q, 4, dead)
+    np.testing.assert_allclose(scores, whole_scores)
+    assert set(idx[0].tolist()) == set(whole_idx[0].tolist())
+    assert 1 not in idx[np.isfinite(scores)]
+
+
+def test_large_batches_are_scored_in_chunks(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    q = store.vectorizer.transform(["contract duty bail", "care", "bail", "offer", "damages"])
+    dead = np.array([1], dtype=np.int64)
+    matrix = ShardedMatrix(store.matrix, n_shards=3, min_rows=1)
+    whole_idx, whole_scores = matrix.top_k(q, 3, dead)
+    monkeypatch.setattr(topk, "QUERY_CHUNK", 2)
+    idx, scores = matrix.top_k(q, 3, dead)
+    np.testing.assert_array_equal(idx, whole_idx)
+    np.testing.assert_allclose(scores, whole_scores)
+
+
+def test_split_shards_merge_to_global_top_k(tmp_path):
+    store = _store(tmp_path / "index")
+    expected = store.search_rows(["contract damages"], k=3)[0]
+    merged = []
+    for shard_dir in split_index(tmp_path / "index", tmp_path / "shards", 3):
+        info = read_shard_info(shard_dir)
+        shard = TfidfStore(shard_dir)
+        merged.append([(info["row_offset"] + row, s) for row, s in shard.search_rows(["contract damages"], k=3)[0]])
+        assert shard.docs[0].id == f"d{info['row_offset']}"
+    assert [row for row, _ in merge_topk(merged, 3)] == [row for row, _ in expected]
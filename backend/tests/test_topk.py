@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from app.core import topk
+from app.core.ann import ExactIndex
+from app.core.topk import top_k
+
+
+def test_matches_full_sort_1d():
+    scores = np.random.default_rng(0).random(1000)
+    idx, vals = top_k(scores, 7)
+    expected = np.argsort(scores)[::-1][:7]
+    np.testing.assert_array_equal(idx, expected)
+    np.testing.assert_array_equal(vals, scores[expected])
+
+
+def test_batched_rows_are_independent():
+    scores = np.random.default_rng(1).random((4, 500))
+    idx, vals = top_k(scores, 3)
+    assert idx.shape == vals.shape == (4, 3)
+    for row, ids in zip(scores, idx):
+        np.testing.assert_array_equal(ids, np.argsort(row)[::-1][:3])
+
+
+def test_k_larger_than_corpus_and_zero():
+    scores = np.array([0.1, 0.9, 0.5])
+    idx, vals = top_k(scores, 10)
+    assert idx.tolist() == [1, 2, 0]
+    idx, vals = top_k(scores, 0)
+    assert idx.shape == (0,)
+    idx, _ = top_k(np.array([]), 5)
+    assert idx.shape == (0,)
+
+
+def test_accepts_sparse_rows():
+    scores = sparse.csr_matrix(np.array([[0.0, 0.3, 0.0, 0.7]]))
+    idx, vals = top_k(scores, 2)
+    assert idx.tolist() == [[3, 1]]
+
+
+def test_rejects_3d():
+    with pytest.raises(ValueError):
+        top_k(np.zeros((2, 2, 2)), 1)
+
+
+def test_chunked_scoring_matches_one_pass(monkeypatch):
+    rng = np.random.default_rng(2)
+    embs, queries = rng.random((300, 8)), rng.random((23, 8))
+    index = ExactIndex()
+    index.build(embs)
+    whole_scores, whole_ids = index.search(queries, 5)
+    shapes = []
+    orig = topk.top_k
+    monkeypatch.setattr(topk, "QUERY_CHUNK", 4)
+    monkeypatch.setattr("app.core.ann.top_k", lambda scores, k: shapes.append(scores.shape) or orig(scores, k))
+    scores, ids = index.search(queries, 5)
+    np.testing.assert_array_equal(ids, whole_ids)
+    np.testing.assert_allclose(scores, whole_scores)
+    # Never more than one chunk of questions scored at once
+    assert max(s[0] for s in shapes) == 4 and len(shapes) == 6
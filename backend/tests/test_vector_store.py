@@ -0,0 +1,75 @@
+import threading
+
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app.core.vector_store import Document, TfidfStore
+
+
+def test_query_batch_matches_cosine(tmp_path):
+    store = TfidfStore(tmp_path)
+    store.add_texts(
+        [
+            Document(id="a", text="offer and acceptance form a contract", meta={}),
+            Document(id="b", text="negligence requires a duty of care", meta={}),
+            Document(id="c", text="bail is the rule and jail the exception", meta={}),
+        ]
+    )
+    store.build()
+    qs = ["duty of care negligence", "contract offer", "bail jail"]
+    results = store.query_batch(qs, k=2)
+    assert [r[0][0].id for r in results] == ["b", "a", "c"]
+    expected = cosine_similarity(store.vectorizer.transform(qs), store.matrix)
+    for row, hits in zip(expected, results):
+        for d, score in hits:
+            assert abs(score - row[["a", "b", "c"].index(d.id)]) < 1e-9
+    assert store.query_batch([], k=2) == []
+
+
+def test_build_streaming_round_trips_through_disk(tmp_path):
+    def gen():
+        yield Document(id="a#0", text="offer and acceptance\n\nform a contract", meta={"chunk": 0})
+        yield Document(id="b#0", text="negligence requires a duty of care", meta={"chunk": 0})
+
+    store = TfidfStore(tmp_path)
+    assert store.build_streaming(gen()) == 2
+    assert store.docs == []
+
+    loaded = TfidfStore(tmp_path)
+    hits = loaded.query("contract", k=1)
+    assert hits[0][0].id == "a#0"
+    # Offset-indexed texts keep blank lines inside a document intact
+    assert hits[0][0].text == "offer and acceptance\n\nform a contract"
+    assert len(loaded.docs) == 2
+
+
+def test_build_streaming_empty_keeps_existing_index(tmp_path):
+    store = TfidfStore(tmp_path)
+    store.add_texts([Document(id="a", text="contract law", meta={})])
+    store.build()
+    assert TfidfStore(tmp_path).build_streaming(iter(())) == 0
+    assert TfidfStore(tmp_path).query("contract", k=1)[0][0].id == "a"
+
+
+def test_concurrent_updates_are_serialized(tmp_path):
+    TfidfStore(tmp_path).build_streaming(Document(str(i), f"contract clause {i}", {}) for i in range(50))
+    errors = []
+
+    def worker(t):
+        try:
+            for i in range(20):
+                TfidfStore(tmp_path).update(add=[Document(f"t{t}-{i}", f"bail order {t} {i}", {})], remove_rows=[t])
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert not errors
+    store = TfidfStore(tmp_path)
+    store._load()
+    assert len(store.docs) == store.matrix.shape[0] == 130
+    assert store.tombstones.tolist() == [0, 1, 2, 3]
+    assert sorted(d.id for d in store.docs[50:]) == sorted(f"t{t}-{i}" for t in range(4) for i in range(20))
+    assert not list(tmp_path.glob("*.tmp"))